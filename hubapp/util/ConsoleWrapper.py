@@ -1,4 +1,6 @@
 import base64
+import threading
+import time
 import requests
 import json
 
@@ -17,6 +19,11 @@ class Utils:
         _encoded_str = str(_encoded_data).replace("b'", "").replace("'", "")
         return str(_encoded_str)    
 
+# トークンの有効期限が返されなかった場合の有効期間(秒)
+TOKEN_DEFAULT_EXPIRES_IN = 3600
+# 有効期限の何秒前にトークンを取り直すか
+TOKEN_REFRESH_MARGIN = 60
+
 class ConsoleRESTAPI:
     def __init__(self, baseURL, client_id, client_secret, gcs_okta_domain):
         # Project information
@@ -26,11 +33,38 @@ class ConsoleRESTAPI:
         CLIENT_SECRET = client_secret
         self.GCS_OKTA_DOMAIN = gcs_okta_domain
         self.AUTHORIZATION_CODE = Utils.Base64EncodedStr(CLIENT_ID + ":" + CLIENT_SECRET)
+
+        # アクセストークンのキャッシュ
+        self.token = None
+        self.token_refresh_at = 0
+        self.token_lock = threading.Lock()
         
     ##########################################################################
     # Low Level APIs
     ##########################################################################
     def GetToken(self):
+        # 有効期限の少し前まではキャッシュしたトークンを使う
+        token = self.token
+        if token is not None and time.monotonic() < self.token_refresh_at:
+            return token
+
+        # 同時に呼ばれた場合もトークンの取得は1回だけ行い、他は取得結果を使う
+        with self.token_lock:
+            if self.token is not None and time.monotonic() < self.token_refresh_at:
+                return self.token
+            analysis_info = self.RequestToken()
+            self.token = analysis_info["access_token"]
+            expires_in = int(analysis_info.get("expires_in", TOKEN_DEFAULT_EXPIRES_IN))
+            self.token_refresh_at = time.monotonic() + max(expires_in - TOKEN_REFRESH_MARGIN, 0)
+            return self.token
+
+    # 失効したトークンを破棄する。既に別のリクエストで取り直している場合は何もしない
+    def InvalidateToken(self, token):
+        with self.token_lock:
+            if self.token == token:
+                self.token = None
+
+    def RequestToken(self):
         headers = {
             "accept": "application/json",
             "authorization": "Basic " + self.AUTHORIZATION_CODE,
@@ -49,8 +83,7 @@ class ConsoleRESTAPI:
             headers=headers,
         )
         analysis_info = json.loads(response.text)
-        token = analysis_info["access_token"]
-        return token
+        return analysis_info
 
     def GetHeaders(self, payload):
         token = self.GetToken()
@@ -90,6 +123,13 @@ class ConsoleRESTAPI:
             response = requests.request(
                 method=method, url=url, headers=headers, params=params, data=payload, files=files
             )
+            if response.status_code == 401:
+                # トークンが失効していた場合は取り直して1回だけ再試行する
+                self.InvalidateToken(headers["Authorization"][len("Bearer "):])
+                headers = self.GetHeaders(payload=payload)
+                response = requests.request(
+                    method=method, url=url, headers=headers, params=params, data=payload, files=files
+                )
             analysis_info = json.loads(response.text)
         except Exception as e:
             return response.text
@@ -1,9 +1,9 @@
-from PySide6.QtWidgets import QWidget, QLabel, QPushButton, QVBoxLayout, QHBoxLayout, QStackedWidget, QLineEdit, QGridLayout, QSizePolicy
+from PySide6.QtWidgets import QApplication, QWidget, QLabel, QPushButton, QVBoxLayout, QHBoxLayout, QStackedWidget, QLineEdit, QGridLayout, QSizePolicy
 from PySide6.QtGui import QPixmap, QPainter, QPen, QColor, QFont
 from PySide6.QtCore import Slot, QTimer, Qt, QRect, Signal, QByteArray
 
 from models.model import Model
-from controllers.controller import Controller
+from controllers.controller import Controller, InferenceResultWorker
 import base64
 
 import os
@@ -130,19 +130,19 @@ class MonitoringPage(QWidget):
         # メインウィジェットにレイアウトを設定
         self.setLayout(main_layout)
         
-        self.timer_proc()
+        self.inference_result_worker_proc()
 
     def inference_start_button_clicked(self):
         # 推論開始
         print("inference_start_button_clicked")
         self._controller.start_inference(self.env_accessor.get_device_id())
-        self.timer.start()
+        self.inference_result_worker.start_polling(self.env_accessor.get_device_id())
 
     def inference_stop_button_clicked(self):
         # 推論終了
         print("inference_stop_button_clicked")
         self._controller.stop_inference(self.env_accessor.get_device_id())
-        self.timer.stop()
+        self.inference_result_worker.stop_polling()
 
     def setting_geo_button_clicked(self):
         # 設定画面開く
@@ -165,14 +165,17 @@ class MonitoringPage(QWidget):
         self.stacked_widget.setCurrentIndex(4)
 
 
-    # タイマー制御
-    def timer_proc(self):
-        self.timer = QTimer(self)
-        self.timer.setInterval(500)
-        self.timer.timeout.connect(self.interval_timer)
+    # 推論結果の受信スレッド制御(新しいフレームが届いた時だけ表示を更新する)
+    def inference_result_worker_proc(self):
+        self.inference_result_worker = InferenceResultWorker(self._controller)
+        self.inference_result_worker.received.connect(self._controller.update_inference_result)
+        QApplication.instance().aboutToQuit.connect(self.on_exit)
 
-    def interval_timer(self):
-        self._controller.get_inference_result(self.env_accessor.get_device_id())        
+    @Slot()
+    def on_exit(self):
+        # 待機中のリクエストが返るまで待ってから終了する
+        self.inference_result_worker.stop_polling()
+        self.inference_result_worker.wait()
 
     def inference_result_changed(self, updated_list):
         self.draw_main_mode() 
@@ -185,10 +188,10 @@ class MonitoringPage(QWidget):
 
     # ウィンドウアクティブ制御
     def active(self):
-        self.timer.stop()
+        self.inference_result_worker.stop_polling()
 
     def deactive(self):
-        self.timer.stop()
+        self.inference_result_worker.stop_polling()
 
 
 # ジオフェンシング設定画面
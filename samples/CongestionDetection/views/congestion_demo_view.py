@@ -1,9 +1,9 @@
 from PySide6.QtWidgets import QApplication, QWidget, QLabel, QVBoxLayout, QHBoxLayout, QSizePolicy
 from PySide6.QtGui import QPixmap, QPainter, QPen, QColor, QFont, QKeyEvent
-from PySide6.QtCore import Slot, QTimer, Qt, QRect, Signal, QByteArray
+from PySide6.QtCore import Slot, Qt, QRect, Signal, QByteArray
 
 from models.model import Model
-from controllers.controller import Controller
+from controllers.controller import Controller, InferenceResultWorker
 
 
 import os
@@ -93,18 +93,14 @@ class CongestionDemoView(QWidget):
         
         # 自動で推論を開始
         self._controller.start_inference(self.env_accessor.get_device_id())
-        self.timer_proc()
+        self.inference_result_worker_proc()
 
 
-    # タイマー制御
-    def timer_proc(self):
-        self.timer = QTimer(self)
-        self.timer.setInterval(500)
-        self.timer.timeout.connect(self.interval_timer)
-        self.timer.start()
-
-    def interval_timer(self):
-        self._controller.get_inference_result(self.env_accessor.get_device_id())        
+    # 推論結果の受信スレッド制御(新しいフレームが届いた時だけ表示を更新する)
+    def inference_result_worker_proc(self):
+        self.inference_result_worker = InferenceResultWorker(self._controller)
+        self.inference_result_worker.received.connect(self._controller.update_inference_result)
+        self.inference_result_worker.start_polling(self.env_accessor.get_device_id())
 
     def inference_result_changed(self, updated_list):
         self.draw_inference() 
@@ -185,6 +181,9 @@ class CongestionDemoView(QWidget):
     @Slot()
     def on_exit(self):
         print("アプリケーションが終了されました。")
+        # 待機中のリクエストが返るまで待ってから終了する
+        self.inference_result_worker.stop_polling()
+        self.inference_result_worker.wait()
         # 自動で推論を終了
         self._controller.stop_inference(self.env_accessor.get_device_id())
 
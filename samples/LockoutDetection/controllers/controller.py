@@ -1,4 +1,4 @@
-from PySide6.QtCore import QObject
+from PySide6.QtCore import QObject, QThread, Signal
 from models.model import Model
 
 import requests
@@ -11,6 +11,10 @@ class Controller(QObject):
     def __init__(self, model :Model):
         super().__init__()
         self._model = model
+        # 前回取得した推論結果とETag(変わっていない場合はサーバーから304が返る)
+        self.inference_result_etag = None
+        self.inference_result_json = None
+        self.inference_result_frame_id = None
 
         # 自分のアドレスからとる    
         s = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
@@ -24,11 +28,37 @@ class Controller(QObject):
         return base_url
 
     def get_inference_result(self, device_id:str):
-        response = requests.get(f"{self.get_base_url()}/{device_id}/inference_result/")
-        if response.status_code != 200:
-            return
-        
+        json_data = self.fetch_inference_result(device_id)
+        if json_data is not None:
+            self.update_inference_result(json_data)
+
+    # 推論結果を取得し、表示の更新が必要な場合のみ返す
+    # waitを指定すると、前回から新しいフレームが届くまでサーバー側で最大wait秒待つ(long-poll)
+    def fetch_inference_result(self, device_id:str, wait:float=0):
+        headers = {}
+        if self.inference_result_etag is not None:
+            headers["If-None-Match"] = self.inference_result_etag
+        params = {}
+        if wait > 0 and self.inference_result_frame_id is not None:
+            params = {"after": self.inference_result_frame_id, "wait": wait}
+        response = requests.get(f"{self.get_base_url()}/{device_id}/inference_result/", headers=headers, params=params, timeout=wait + 10)
+        if response.status_code == 304:
+            # 前回と同じフレームの場合は、表示中の推論結果が古くなった時だけ更新する(消去は1回のみ)
+            json_data = self.inference_result_json
+            if json_data is None or not self.is_inference_result_expired(json_data):
+                return None
+            self.inference_result_json = None
+            return json_data
+        elif response.status_code != 200:
+            return None
         json_data = response.json()
+        self.inference_result_etag = response.headers.get("ETag")
+        self.inference_result_frame_id = json_data.get("frame_id")
+        self.inference_result_json = json_data
+        return json_data
+
+    # 推論結果をモデルに反映する(GUIスレッドで呼ぶ)
+    def update_inference_result(self, json_data):
 
         if json_data["count"] == 0 or json_data["inferences"] == {} or json_data["inferences"][0]['P'] == -1 :
             inference_results = []
@@ -48,6 +78,13 @@ class Controller(QObject):
                 inference_results = []
                 self._model.inference_results.append_all(inference_results)
 
+    # 推論結果があり、かつ10秒を過ぎている場合はTrue
+    def is_inference_result_expired(self, json_data):
+        if json_data["count"] == 0 or json_data["inferences"] == {} or json_data["inferences"][0]['P'] == -1 :
+            return False
+        date_object = datetime.fromisoformat(json_data["inferences"][0]['T']).replace(tzinfo=timezone.utc)
+        return (datetime.now(timezone.utc) - date_object).total_seconds() > 10
+
     def start_inference(self, device_id:str) :
         print("推論開始")
         payload  = {
@@ -80,4 +117,40 @@ class Controller(QObject):
         response = requests.post(f"{self.get_base_url()}/{file_name}/set_command_param_for_local_server_address/", json=payload)
         if response.status_code != 200:
             return
-        print(response)
\ No newline at end of file
+        print(response)
+
+
+# 推論結果をlong-pollで受け取るスレッド
+# 新しいフレームが届くとサーバーから応答が返るため、一定間隔のポーリングは行わない
+class InferenceResultWorker(QThread):
+    # 表示の更新が必要な推論結果(接続先のスロットはGUIスレッドで呼ばれる)
+    received = Signal(object)
+
+    def __init__(self, controller :Controller, wait:float=5):
+        super().__init__()
+        self._controller = controller
+        self._device_id = ""
+        # 1回のリクエストで待つ最大秒数。表示中の推論結果が古くなったかの確認もこの間隔で行う
+        self._wait = wait
+        self._running = False
+
+    def start_polling(self, device_id:str):
+        self._device_id = device_id
+        self._running = True
+        if not self.isRunning():
+            self.start()
+
+    # 待機中のリクエストが返った時点で停止する
+    def stop_polling(self):
+        self._running = False
+
+    def run(self):
+        while self._running:
+            try:
+                json_data = self._controller.fetch_inference_result(self._device_id, self._wait)
+            except requests.RequestException as e:
+                print(f"Error: {e}")
+                self.msleep(1000)
+                continue
+            if json_data is not None and self._running:
+                self.received.emit(json_data)
@@ -6,7 +6,7 @@ from PySide6.QtCore import Slot, QTimer, Qt, QRect, Signal, QByteArray
 
 from models.model import Model
 from models.model import PPEDetectonMode
-from controllers.controller import Controller
+from controllers.controller import Controller, InferenceResultWorker
 
 
 import os
@@ -102,9 +102,10 @@ class PPEDemoView(QWidget):
         # 自動で推論を開始
         self._controller.start_inference(self.env_accessor.get_device_id())
         self.timer_proc()
+        self.inference_result_worker_proc()
 
 
-    # タイマー制御
+    # タイマー制御(表示とLEDの更新のみ。推論結果は受信スレッドで受け取る)
     def timer_proc(self):
         self.timer = QTimer(self)
         self.timer.setInterval(1000)
@@ -113,7 +114,12 @@ class PPEDemoView(QWidget):
 
     def interval_timer(self):
         self.draw_main_mode()              
-        self._controller.get_inference_result(self.env_accessor.get_device_id())        
+
+    # 推論結果の受信スレッド制御(新しいフレームが届いた時だけ表示を更新する)
+    def inference_result_worker_proc(self):
+        self.inference_result_worker = InferenceResultWorker(self._controller)
+        self.inference_result_worker.received.connect(self._controller.update_inference_result)
+        self.inference_result_worker.start_polling(self.env_accessor.get_device_id())
 
 
     # 人数カウントの更新通知を受信
@@ -142,6 +148,9 @@ class PPEDemoView(QWidget):
     @Slot()
     def on_exit(self):
         print("アプリケーションが終了されました。")
+        # 待機中のリクエストが返るまで待ってから終了する
+        self.inference_result_worker.stop_polling()
+        self.inference_result_worker.wait()
         run_led_script("N")
         # 自動で推論を終了
         self._controller.stop_inference(self.env_accessor.get_device_id())
@@ -0,0 +1,164 @@
+import argparse
+import csv
+import gzip
+import os
+import time
+from datetime import datetime, timezone
+from AITRIOSLocalDBHandler import AITRIOSLocalDBPool, STORAGE_LAYOUT_ROW, DB_FILE_NAME
+
+# pyarrowがインストールされていない場合はgzip圧縮のCSVのみ出力できる
+try:
+    import pyarrow
+    import pyarrow.ipc
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
+
+EXPORT_FORMAT_PARQUET = "parquet"
+EXPORT_FORMAT_ARROW = "arrow"
+EXPORT_FORMAT_CSV = "csv"
+
+# 出力ファイルの拡張子とContent-Type
+EXPORT_FORMATS = {
+    EXPORT_FORMAT_PARQUET: (".parquet", "application/vnd.apache.parquet"),
+    EXPORT_FORMAT_ARROW: (".arrow", "application/vnd.apache.arrow.file"),
+    EXPORT_FORMAT_CSV: (".csv.gz", "application/gzip"),
+}
+
+EXPORT_COLUMNS = ["device_id", "class_id", "inference_datetime", "score", "x1", "y1", "x2", "y2"]
+
+if pyarrow is not None:
+    EXPORT_SCHEMA = pyarrow.schema([
+        ("device_id", pyarrow.string()),
+        ("class_id", pyarrow.string()),
+        ("inference_datetime", pyarrow.timestamp("ms", tz="UTC")),
+        ("score", pyarrow.float32()),
+        ("x1", pyarrow.int32()),
+        ("y1", pyarrow.int32()),
+        ("x2", pyarrow.int32()),
+        ("y2", pyarrow.int32()),
+    ])
+
+# pyarrowがあればParquet、無ければgzip圧縮のCSV
+def default_export_format():
+    return EXPORT_FORMAT_PARQUET if pyarrow is not None else EXPORT_FORMAT_CSV
+
+# 推論結果を期間とデバイスを指定してファイルに書き出す
+# 読み出しはchunk_size件ずつ行い、その間だけ読み出し用のコネクションを借りる(WALのため書き込みは止めない)
+class InferenceExporter:
+    def __init__(self, db_pool, chunk_size=10000):
+        self.db_pool = db_pool
+        self.chunk_size = chunk_size
+
+    # 書き出した件数と所要時間を返す。device_idsを省略した場合は全デバイス
+    def export(self, output, export_format, from_epoch_ms, until_epoch_ms, device_ids=None):
+        if export_format not in EXPORT_FORMATS:
+            raise ValueError("Unknown export format: " + export_format)
+        if export_format != EXPORT_FORMAT_CSV and pyarrow is None:
+            raise ValueError("pyarrow is required for " + export_format)
+
+        if not device_ids:
+            with self.db_pool.reader() as table_handler:
+                device_ids = table_handler.fetch_device_ids()
+
+        start_time = time.perf_counter()
+        chunks = self.iter_chunks(device_ids, from_epoch_ms, until_epoch_ms)
+        if export_format == EXPORT_FORMAT_CSV:
+            row_count = self.write_csv(output, chunks)
+        else:
+            row_count = self.write_arrow(output, export_format, chunks)
+        duration = time.perf_counter() - start_time
+
+        return {
+            "rows": row_count,
+            "duration": duration,
+            "rows_per_sec": row_count / duration if duration > 0 else 0,
+        }
+
+    # 列ごとのリストをchunk_size件ずつ返す
+    def iter_chunks(self, device_ids, from_epoch_ms, until_epoch_ms):
+        for device_id in device_ids:
+            after = None
+            while True:
+                with self.db_pool.reader() as table_handler:
+                    records = table_handler.fetch_range(device_id, from_epoch_ms, until_epoch_ms, after, self.chunk_size)
+                if not records:
+                    break
+                columns = {column: [] for column in EXPORT_COLUMNS}
+                for _, data_tuple in records:
+                    columns["device_id"].append(data_tuple[1])
+                    columns["class_id"].append(str(data_tuple[2]))
+                    columns["inference_datetime"].append(data_tuple[3])
+                    columns["score"].append(data_tuple[4])
+                    columns["x1"].append(data_tuple[5])
+                    columns["y1"].append(data_tuple[6])
+                    columns["x2"].append(data_tuple[7])
+                    columns["y2"].append(data_tuple[8])
+                yield columns
+                if len(records) < self.chunk_size:
+                    break
+                after = records[-1][0]
+
+    def write_arrow(self, output, export_format, chunks):
+        row_count = 0
+        if export_format == EXPORT_FORMAT_PARQUET:
+            writer = pyarrow.parquet.ParquetWriter(output, EXPORT_SCHEMA, compression="zstd")
+        else:
+            writer = pyarrow.ipc.new_file(output, EXPORT_SCHEMA)
+        try:
+            for columns in chunks:
+                writer.write_batch(pyarrow.RecordBatch.from_pydict(columns, schema=EXPORT_SCHEMA))
+                row_count += len(columns["device_id"])
+        finally:
+            writer.close()
+        return row_count
+
+    def write_csv(self, output, chunks):
+        row_count = 0
+        with gzip.open(output, "wt", encoding="utf-8", newline="") as w_fp:
+            writer = csv.writer(w_fp)
+            writer.writerow(EXPORT_COLUMNS)
+            for columns in chunks:
+                # 日時はISO 8601形式(UTC)で出力する
+                columns["inference_datetime"] = [
+                    datetime.fromtimestamp(epoch_ms / 1000, timezone.utc).isoformat(timespec="milliseconds")
+                    for epoch_ms in columns["inference_datetime"]
+                ]
+                writer.writerows(zip(*(columns[column] for column in EXPORT_COLUMNS)))
+                row_count += len(columns["device_id"])
+        return row_count
+
+# サーバーを止めずにコマンドラインから書き出す
+# python AITRIOSExport.py --device <device_id> --from 2025-01-16T00:00:00 --to 2025-01-17T00:00:00 --output export.parquet
+def main():
+    parser = argparse.ArgumentParser(description="Export inference results")
+    parser.add_argument("--db", default=DB_FILE_NAME)
+    parser.add_argument("--device", action="append", dest="device_ids", help="device id (repeatable, default: all devices)")
+    parser.add_argument("--from", dest="from_datetime", help="ISO 8601 (UTC if no timezone)")
+    parser.add_argument("--to", dest="to_datetime", help="ISO 8601 (UTC if no timezone, exclusive)")
+    parser.add_argument("--format", dest="export_format", choices=list(EXPORT_FORMATS), default=default_export_format())
+    parser.add_argument("--chunk-size", type=int, default=10000)
+    parser.add_argument("--layout", default=os.getenv("INFERENCE_STORAGE_LAYOUT", STORAGE_LAYOUT_ROW))
+    parser.add_argument("--output")
+    args = parser.parse_args()
+
+    from_epoch_ms = parse_iso_datetime(args.from_datetime) if args.from_datetime else 0
+    until_epoch_ms = parse_iso_datetime(args.to_datetime) if args.to_datetime else int(time.time() * 1000)
+    output = args.output or "inference_results" + EXPORT_FORMATS[args.export_format][0]
+
+    db_pool = AITRIOSLocalDBPool(args.db, reader_count=1, storage_layout=args.layout)
+    try:
+        stats = InferenceExporter(db_pool, args.chunk_size).export(
+            output, args.export_format, from_epoch_ms, until_epoch_ms, args.device_ids)
+    finally:
+        db_pool.close()
+    print("%s: %d rows, %.2f sec, %.0f rows/sec" % (output, stats["rows"], stats["duration"], stats["rows_per_sec"]))
+
+def parse_iso_datetime(value):
+    parsed = datetime.fromisoformat(value)
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return int(parsed.timestamp() * 1000)
+
+if __name__ == "__main__":
+    main()
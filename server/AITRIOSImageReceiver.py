@@ -0,0 +1,119 @@
+import os
+import tempfile
+import threading
+import time
+from starlette.concurrency import run_in_threadpool
+
+# 画像の受信
+# 受信データ全体をメモリに載せず、少しずつ一時ファイルに書き込んでから保存先に置き換える
+# ファイルの書き込みはスレッドプールで行い、イベントループを止めない
+class ImageUploadReceiver:
+    def __init__(self, max_size=16 * 1024 * 1024, write_buffer_size=1024 * 1024):
+        # 1ファイルの最大サイズ(バイト)。超えた場合は保存しない
+        self.max_size = max_size
+        # この大きさまで溜めてから書き込む(スレッドプールの呼び出し回数を抑える)
+        self.write_buffer_size = write_buffer_size
+
+        self.stats_lock = threading.Lock()
+        self.active_count = 0
+        self.peak_active_count = 0
+        self.saved_count = 0
+        self.rejected_count = 0
+        self.failed_count = 0
+        self.total_bytes = 0
+        self.total_duration = 0.0
+        self.last_bytes = 0
+        self.last_bytes_per_sec = 0.0
+
+    # Content-Lengthが最大サイズを超えているか(無い場合は受信しながら確認する)
+    def is_too_large(self, content_length):
+        try:
+            return content_length is not None and int(content_length) > self.max_size
+        except ValueError:
+            return False
+
+    def reject(self):
+        with self.stats_lock:
+            self.rejected_count += 1
+
+    # streamの内容をfile_pathに保存し、保存したバイト数を返す。最大サイズを超えた場合はNoneを返す
+    # 保存先と同じディレクトリの一時ファイルに書き込み、書き終わってからos.replaceで置き換えるため、
+    # 読み出し側が書き込み途中のファイルを見ることは無い
+    async def receive(self, stream, file_path):
+        with self.stats_lock:
+            self.active_count += 1
+            self.peak_active_count = max(self.peak_active_count, self.active_count)
+
+        start_time = time.perf_counter()
+        temp_path = None
+        try:
+            save_dir = os.path.dirname(file_path) or "."
+            await run_in_threadpool(os.makedirs, save_dir, exist_ok=True)
+            fd, temp_path = await run_in_threadpool(tempfile.mkstemp, dir=save_dir, suffix=".part")
+            w_fp = os.fdopen(fd, "wb")
+            try:
+                size = await self.write_stream(stream, w_fp)
+            finally:
+                await run_in_threadpool(w_fp.close)
+
+            if size is None:
+                self.reject()
+                return None
+
+            await run_in_threadpool(os.replace, temp_path, file_path)
+            temp_path = None
+        except Exception:
+            with self.stats_lock:
+                self.failed_count += 1
+            raise
+        finally:
+            if temp_path is not None:
+                await run_in_threadpool(remove_file, temp_path)
+            with self.stats_lock:
+                self.active_count -= 1
+
+        duration = time.perf_counter() - start_time
+        with self.stats_lock:
+            self.saved_count += 1
+            self.total_bytes += size
+            self.total_duration += duration
+            self.last_bytes = size
+            self.last_bytes_per_sec = size / duration if duration > 0 else 0
+        return size
+
+    async def write_stream(self, stream, w_fp):
+        size = 0
+        buffer = bytearray()
+        async for chunk in stream:
+            size += len(chunk)
+            if size > self.max_size:
+                return None
+            buffer += chunk
+            if len(buffer) >= self.write_buffer_size:
+                await run_in_threadpool(w_fp.write, bytes(buffer))
+                buffer.clear()
+        if buffer:
+            await run_in_threadpool(w_fp.write, bytes(buffer))
+        return size
+
+    def get_stats(self):
+        with self.stats_lock:
+            return {
+                "max_size": self.max_size,
+                "active": self.active_count,
+                "peak_active": self.peak_active_count,
+                "saved": self.saved_count,
+                "rejected": self.rejected_count,
+                "failed": self.failed_count,
+                "total_bytes": self.total_bytes,
+                "last_bytes": self.last_bytes,
+                "last_bytes_per_sec": self.last_bytes_per_sec,
+                # 1件ごとの受信速度の平均(受信量の合計÷受信時間の合計)
+                "average_bytes_per_sec": self.total_bytes / self.total_duration if self.total_duration > 0 else 0,
+            }
+
+def remove_file(file_path):
+    try:
+        os.remove(file_path)
+    except FileNotFoundError:
+        pass
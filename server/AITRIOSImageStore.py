@@ -0,0 +1,142 @@
+import os
+import time
+from AITRIOSLocalDBHandler import parse_inference_datetime
+from AITRIOSImageReceiver import remove_file
+from AITRIOSRetention import PeriodicPurgeJob
+
+# 受信時にデバイスIDが分からない画像(/image/{filename}で受信したもの)のデバイスID
+UNKNOWN_DEVICE_ID = "unknown"
+
+# デバイスIDやファイル名として使えるか(パスの区切りや親ディレクトリを含まない)
+def is_safe_name(name):
+    return name not in ("", ".", "..") and os.path.basename(name) == name and "\\" not in name
+
+# 画像の保存先と索引
+# 画像は<root_dir>/<デバイスID>/<日付(YYYYmmdd)>/<時(HH)>/<ファイル名>に保存し、1つのディレクトリのファイル数を抑える
+# 保存先のパス(root_dirからの相対パス)、サイズ、日時はt_image_indexに登録する
+class ImageStore:
+    def __init__(self, db_pool, root_dir="./image", retention_hours=0, max_total_bytes=0, thumbnail_generator=None):
+        self.db_pool = db_pool
+        self.root_dir = root_dir
+        # 指定された場合は画像の削除時に縮小画像も削除する
+        self.thumbnail_generator = thumbnail_generator
+        # 保存期間(時間)。0の場合は期間では削除しない
+        self.retention_hours = retention_hours
+        # 画像の合計サイズの上限(バイト)。0の場合は上限無し。超えた場合は古いものから削除する
+        self.max_total_bytes = max_total_bytes
+
+    # ファイル名の日時(YYYYmmddHHMMSSfff)をエポックミリ秒にする。日時で無い場合は受信時刻
+    def get_image_epoch_ms(self, filename):
+        stem = filename.split(".")[0]
+        if len(stem) in (14, 17) and stem.isdigit():
+            return parse_inference_datetime(stem)
+        return int(time.time() * 1000)
+
+    # 保存先のroot_dirからの相対パス
+    def get_relative_path(self, device_id, image_epoch_ms, filename):
+        shard = time.gmtime(image_epoch_ms // 1000)
+        return os.path.join(device_id, time.strftime("%Y%m%d", shard), time.strftime("%H", shard), filename)
+
+    def get_full_path(self, relative_path):
+        return os.path.join(self.root_dir, relative_path)
+
+    # 保存した画像を索引に登録する(書き込み用コネクションを使うため、イベントループからはスレッドプールで呼ぶ)
+    def register(self, device_id, image_epoch_ms, relative_path, size):
+        with self.db_pool.writer() as table_handler:
+            table_handler.insert_image(device_id, image_epoch_ms, relative_path, size)
+
+    # 指定した日時に最も近い画像を返す。無い場合はNone
+    def find_nearest(self, device_id, epoch_ms):
+        with self.db_pool.reader() as table_handler:
+            return self.to_dict(table_handler.fetch_nearest_image(device_id, epoch_ms))
+
+    def find_latest(self, device_id):
+        with self.db_pool.reader() as table_handler:
+            return self.to_dict(table_handler.fetch_latest_image(device_id))
+
+    def to_dict(self, image):
+        if image is None:
+            return None
+        _, device_id, image_epoch_ms, relative_path, size = image
+        return {
+            "device_id": device_id,
+            "image_epoch_ms": image_epoch_ms,
+            "path": self.get_full_path(relative_path),
+            "size": size,
+        }
+
+    def get_stats(self):
+        with self.db_pool.reader() as table_handler:
+            image_count, total_bytes = table_handler.fetch_image_total_size()
+        return {
+            "root_dir": self.root_dir,
+            "retention_hours": self.retention_hours,
+            "max_total_bytes": self.max_total_bytes,
+            "images": image_count,
+            "total_bytes": total_bytes,
+        }
+
+    # 保存期間を過ぎた画像と、合計サイズの上限を超えた分の古い画像を削除し、(削除件数, 削除したバイト数)を返す
+    # 索引から削除してからファイルを削除するため、索引が削除済みのファイルを指すことは無い
+    def purge(self, batch_size=1000, stop_event=None):
+        purged_count = 0
+        purged_bytes = 0
+        if self.retention_hours > 0:
+            cutoff_epoch_ms = int((time.time() - self.retention_hours * 3600) * 1000)
+            while stop_event is None or not stop_event.is_set():
+                with self.db_pool.writer() as table_handler:
+                    images = table_handler.fetch_oldest_images(batch_size, cutoff_epoch_ms)
+                    table_handler.delete_images([image[0] for image in images])
+                purged_bytes += self.remove_images(images)
+                purged_count += len(images)
+                if len(images) < batch_size:
+                    break
+
+        if self.max_total_bytes > 0:
+            while stop_event is None or not stop_event.is_set():
+                with self.db_pool.writer() as table_handler:
+                    _, total_bytes = table_handler.fetch_image_total_size()
+                    if total_bytes <= self.max_total_bytes:
+                        break
+                    images = []
+                    for image in table_handler.fetch_oldest_images(batch_size):
+                        if total_bytes <= self.max_total_bytes:
+                            break
+                        images.append(image)
+                        total_bytes -= image[2]
+                    table_handler.delete_images([image[0] for image in images])
+                if not images:
+                    break
+                purged_bytes += self.remove_images(images)
+                purged_count += len(images)
+        return purged_count, purged_bytes
+
+    def remove_images(self, images):
+        removed_bytes = 0
+        for _, relative_path, size in images:
+            full_path = self.get_full_path(relative_path)
+            remove_file(full_path)
+            if self.thumbnail_generator is not None:
+                self.thumbnail_generator.remove(full_path)
+            removed_bytes += size
+            # 空になった時・日付・デバイスのディレクトリも削除する
+            directory = os.path.dirname(full_path)
+            for _ in range(3):
+                try:
+                    os.rmdir(directory)
+                except OSError:
+                    break
+                directory = os.path.dirname(directory)
+        return removed_bytes
+
+# 画像の定期削除
+class ImageRetentionJob(PeriodicPurgeJob):
+    PURGED_ITEMS = ("images_purged", "bytes_purged")
+
+    def __init__(self, image_store, interval=600, batch_size=1000):
+        super().__init__(interval, batch_size)
+        self.image_store = image_store
+
+    def purge(self):
+        images_purged, bytes_purged = self.image_store.purge(self.batch_size, self.stop_event)
+        return {"images_purged": images_purged, "bytes_purged": bytes_purged}
@@ -0,0 +1,123 @@
+import queue
+import threading
+import time
+import logging
+import traceback
+
+# 推論結果の書き込みキュー
+# HTTPの応答とSQLiteへの書き込みを切り離し、専用スレッドでまとめて書き込む
+class InferenceIngestQueue:
+    # キュー停止用の目印
+    STOP = object()
+
+    def __init__(self, store_function, max_depth=1000, max_batch_size=100):
+        # store_functionは書き込みスレッドから、受信データのリストを引数に呼び出される
+        # 変換できずに読み飛ばしたフレームがある場合はその数を返す(statsのinvalid_framesに加算する)
+        self.store_function = store_function
+        self.max_depth = max_depth
+        self.max_batch_size = max_batch_size
+        self.queue = queue.Queue(maxsize=max_depth)
+        self.thread = None
+
+        self.stats_lock = threading.Lock()
+        self.accepted_count = 0
+        self.rejected_count = 0
+        self.batch_count = 0
+        self.stored_count = 0
+        # store_functionが例外を送出し、書き込めなかったバッチ
+        self.failed_batch_count = 0
+        self.failed_count = 0
+        self.invalid_frame_count = 0
+        self.peak_depth = 0
+        self.last_batch_size = 0
+        self.largest_batch_size = 0
+        self.last_batch_duration = 0.0
+
+    def start(self):
+        self.thread = threading.Thread(target=self.run, name="InferenceIngestQueue", daemon=True)
+        self.thread.start()
+
+    # キューが満杯の場合はFalseを返す(呼び出し元で503を返す)
+    def put(self, item):
+        try:
+            self.queue.put_nowait(item)
+        except queue.Full:
+            with self.stats_lock:
+                self.rejected_count += 1
+            return False
+
+        with self.stats_lock:
+            self.accepted_count += 1
+            self.peak_depth = max(self.peak_depth, self.queue.qsize())
+        return True
+
+    # キューに残っているデータを全て書き込んでから停止する
+    def stop(self):
+        if self.thread is None:
+            return
+        self.queue.put(self.STOP)
+        self.thread.join()
+        self.thread = None
+
+    def run(self):
+        stopping = False
+        while not stopping:
+            item = self.queue.get()
+            if item is self.STOP:
+                break
+
+            # 溜まっている分を最大max_batch_size件までまとめて取り出す
+            batch = [item]
+            while len(batch) < self.max_batch_size:
+                try:
+                    item = self.queue.get_nowait()
+                except queue.Empty:
+                    break
+                if item is self.STOP:
+                    stopping = True
+                    break
+                batch.append(item)
+
+            start_time = time.perf_counter()
+            try:
+                invalid_frame_count = self.store_function(batch) or 0
+                stored = True
+            except Exception:
+                logging.error("Failed to store %d inference results", len(batch))
+                traceback.print_exc()
+                stored = False
+            duration = time.perf_counter() - start_time
+
+            with self.stats_lock:
+                self.batch_count += 1
+                if stored:
+                    self.stored_count += len(batch)
+                    self.invalid_frame_count += invalid_frame_count
+                else:
+                    self.failed_batch_count += 1
+                    self.failed_count += len(batch)
+                self.last_batch_size = len(batch)
+                self.largest_batch_size = max(self.largest_batch_size, len(batch))
+                self.last_batch_duration = duration
+
+        logging.info("InferenceIngestQueue stopped")
+
+    def get_stats(self):
+        with self.stats_lock:
+            return {
+                "depth": self.queue.qsize(),
+                "max_depth": self.max_depth,
+                "peak_depth": self.peak_depth,
+                "max_batch_size": self.max_batch_size,
+                "accepted": self.accepted_count,
+                "rejected": self.rejected_count,
+                "stored": self.stored_count,
+                "failed": self.failed_count,
+                "failed_batches": self.failed_batch_count,
+                "invalid_frames": self.invalid_frame_count,
+                "batches": self.batch_count,
+                "last_batch_size": self.last_batch_size,
+                "largest_batch_size": self.largest_batch_size,
+                "average_batch_size": (self.stored_count + self.failed_count) / self.batch_count if self.batch_count else 0,
+                "last_batch_duration": self.last_batch_duration,
+            }
@@ -1,24 +1,19 @@
 import sqlite3
-from datetime import datetime
+import queue
+import struct
+import calendar
+import time
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
 
-class AITRIOSLocalDBHandler:
-    def __init__(self):
-        
-        self.connection = sqlite3.connect("aitrios_local_data.db")
-        self.cursor = self.connection.cursor()
-
-    def close(self):
-        self.connection.close()
+DB_FILE_NAME = "aitrios_local_data.db"
 
-# 推論結果Table
-class InferenceResultTableHandler:
-    def __init__(self):
-        self.dbhandler = AITRIOSLocalDBHandler()
-        self.dbhandler.cursor
-        self.create_table()
-
-    def create_table(self):
-        self.dbhandler.cursor.execute("""
+# スキーマのマイグレーション(バージョン, 実行するSQL)
+# 既存のDBは未適用のバージョンだけが順に実行され、その場でアップグレードされる
+SCHEMA_MIGRATIONS = [
+    (1, [
+        """
         CREATE TABLE IF NOT EXISTS t_inference_result  (
             id INTEGER PRIMARY KEY AUTOINCREMENT,
             device_id TEXT,
@@ -31,28 +26,613 @@ class InferenceResultTableHandler:
             y2 INTEGER,
             created_at TEXT DEFAULT (datetime('now', 'localtime'))
         )
-        """)
-        self.dbhandler.connection.commit()
+        """,
+    ]),
+    (2, [
+        # デバイスごとの最新フレーム検索用
+        "CREATE INDEX IF NOT EXISTS idx_inference_result_device_datetime ON t_inference_result (device_id, inference_datetime)",
+    ]),
+    (3, [
+        # フレーム単位の保存形式(INFERENCE_STORAGE_LAYOUT=frameの場合に使う)
+        """
+        CREATE TABLE IF NOT EXISTS t_device  (
+            device_key INTEGER PRIMARY KEY,
+            device_id TEXT NOT NULL UNIQUE
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS t_inference_frame  (
+            id INTEGER PRIMARY KEY,
+            device_key INTEGER NOT NULL,
+            inference_epoch_ms INTEGER NOT NULL,
+            detections BLOB NOT NULL
+        )
+        """,
+        "CREATE INDEX IF NOT EXISTS idx_inference_frame_device_epoch ON t_inference_frame (device_key, inference_epoch_ms)",
+    ]),
+    (4, [
+        # 保存期間を過ぎて削除した推論結果の1時間ごとの件数(class_idが空文字は推論結果無しのフレーム)
+        """
+        CREATE TABLE IF NOT EXISTS t_inference_summary  (
+            device_id TEXT NOT NULL,
+            class_id TEXT NOT NULL,
+            bucket_epoch_ms INTEGER NOT NULL,
+            detection_count INTEGER NOT NULL,
+            PRIMARY KEY (device_id, class_id, bucket_epoch_ms)
+        )
+        """,
+    ]),
+    (5, [
+        # デバイス・クラスごとの1分/1時間単位の集計(登録時に加算する。class_idが空文字はクラスを問わない全体の集計)
+        # frame_count: フレーム数(クラスごとの場合はそのクラスが検出されたフレーム数)
+        # max_count: 1フレームあたりの最大検出数, score_sum: スコアの合計
+        """
+        CREATE TABLE IF NOT EXISTS t_inference_rollup  (
+            device_id TEXT NOT NULL,
+            bucket TEXT NOT NULL,
+            bucket_epoch_ms INTEGER NOT NULL,
+            class_id TEXT NOT NULL,
+            frame_count INTEGER NOT NULL,
+            detection_count INTEGER NOT NULL,
+            max_count INTEGER NOT NULL,
+            score_sum REAL NOT NULL,
+            PRIMARY KEY (device_id, bucket, bucket_epoch_ms, class_id)
+        )
+        """,
+    ]),
+    (6, [
+        # 日時を文字列(YYYYmmddHHMMSSfff)からUTCのエポックミリ秒に置き換える
+        """
+        CREATE TABLE t_inference_result_epoch  (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            device_id TEXT,
+            class_id  TEXT,
+            inference_epoch_ms  INTEGER,
+            inference_percentage  REAL,
+            x1 INTEGER,
+            y1 INTEGER,
+            x2 INTEGER,
+            y2 INTEGER,
+            created_at TEXT DEFAULT (datetime('now', 'localtime'))
+        )
+        """,
+        """
+        INSERT INTO t_inference_result_epoch (id, device_id, class_id, inference_epoch_ms, inference_percentage, x1, y1, x2, y2, created_at)
+        SELECT id, device_id, class_id,
+               CAST(strftime('%s', substr(inference_datetime, 1, 4) || '-' || substr(inference_datetime, 5, 2) || '-' || substr(inference_datetime, 7, 2) || ' ' ||
+                                   substr(inference_datetime, 9, 2) || ':' || substr(inference_datetime, 11, 2) || ':' || substr(inference_datetime, 13, 2)) AS INTEGER) * 1000
+               + CAST(substr(inference_datetime, 15, 3) AS INTEGER),
+               inference_percentage, x1, y1, x2, y2, created_at
+        FROM t_inference_result
+        """,
+        "DROP TABLE t_inference_result",
+        "ALTER TABLE t_inference_result_epoch RENAME TO t_inference_result",
+        "CREATE INDEX IF NOT EXISTS idx_inference_result_device_epoch ON t_inference_result (device_id, inference_epoch_ms)",
+    ]),
+    # 受信した画像の索引(image_epoch_msはinference_epoch_msと同じくファイル名の日時から求めるため、device_idと合わせて推論結果と結合できる)
+    (7, [
+        """
+        CREATE TABLE IF NOT EXISTS t_image_index  (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            device_id TEXT,
+            image_epoch_ms INTEGER,
+            path TEXT,
+            size INTEGER,
+            created_at TEXT DEFAULT (datetime('now', 'localtime'))
+        )
+        """,
+        "CREATE INDEX IF NOT EXISTS idx_image_index_device_epoch ON t_image_index (device_id, image_epoch_ms)",
+        "CREATE INDEX IF NOT EXISTS idx_image_index_epoch ON t_image_index (image_epoch_ms)",
+        "CREATE UNIQUE INDEX IF NOT EXISTS idx_image_index_path ON t_image_index (path)",
+    ]),
+]
+
+# 保存形式
+# row: 検出結果1件を1レコードとして保存する(t_inference_result)
+# frame: 1フレームを1レコードとし、検出結果をバイナリにまとめて保存する(t_inference_frame)
+STORAGE_LAYOUT_ROW = "row"
+STORAGE_LAYOUT_FRAME = "frame"
+
+# t_inference_summaryの集計単位(1時間)
+SUMMARY_BUCKET_MS = 3600 * 1000
+
+# t_inference_rollupの集計単位
+ROLLUP_BUCKETS = {
+    "minute": 60 * 1000,
+    "hour": 3600 * 1000,
+}
+
+# frame形式の検出結果1件分(クラスID, スコア, Left, Top, Right, Bottom)
+DETECTION_STRUCT = struct.Struct("<Ifiiii")
+
+# デバイスの日時(YYYYmmddHHMMSSfff)をUTCのエポックミリ秒に変換する
+def parse_inference_datetime(inference_datetime):
+    epoch_sec = calendar.timegm((
+        int(inference_datetime[0:4]), int(inference_datetime[4:6]), int(inference_datetime[6:8]),
+        int(inference_datetime[8:10]), int(inference_datetime[10:12]), int(inference_datetime[12:14]),
+    ))
+    return epoch_sec * 1000 + int(inference_datetime[14:17] or 0)
+
+# エポックミリ秒をAPIで返すISO 8601形式(UTC、タイムゾーン無し)の文字列にする
+# datetime.isoformat()と同じ形式(ミリ秒が0の場合は秒まで)
+def render_inference_datetime(epoch_ms):
+    epoch_sec, millisecond = divmod(epoch_ms, 1000)
+    rendered = "%04d-%02d-%02dT%02d:%02d:%02d" % time.gmtime(epoch_sec)[:6]
+    if millisecond:
+        rendered += ".%03d000" % millisecond
+    return rendered
+
+# fetch_rangeのカーソル(数字を"-"でつないだ文字列)を分解する
+def split_cursor(cursor, count):
+    parts = cursor.split("-")
+    if len(parts) != count or not all(part.isdigit() for part in parts):
+        raise ValueError("Invalid cursor: " + cursor)
+    return parts
+
+# コネクションごとのPRAGMA設定
+def configure_connection(connection):
+    # 削除した領域を少しずつ解放できるようにする(WALへの切り替えより前に設定した新しいDBのみ有効。既存のDBは1度VACUUMが必要)
+    connection.execute("PRAGMA auto_vacuum=INCREMENTAL")
+    # WALにすることで書き込み中も読み出しがブロックされない
+    connection.execute("PRAGMA journal_mode=WAL")
+    # WALではNORMALでもDBは壊れない(電源断時に直近のコミットが失われる可能性があるのみ)
+    connection.execute("PRAGMA synchronous=NORMAL")
+    # ページキャッシュ 8MB
+    connection.execute("PRAGMA cache_size=-8000")
+    connection.execute("PRAGMA temp_store=MEMORY")
+    # 別プロセスが書き込み中の場合は待つ
+    connection.execute("PRAGMA busy_timeout=5000")
+
+# 未適用のマイグレーションを実行する
+def migrate(connection):
+    connection.execute("""
+    CREATE TABLE IF NOT EXISTS t_schema_version  (
+        version INTEGER PRIMARY KEY,
+        applied_at TEXT DEFAULT (datetime('now', 'localtime'))
+    )
+    """)
+    for version, statements in SCHEMA_MIGRATIONS:
+        # 複数プロセスが同時に起動しても二重に適用しないよう、書き込みロックを取ってから確認する
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            applied = connection.execute("SELECT 1 FROM t_schema_version WHERE version = ?", (version,)).fetchone()
+            if applied is None:
+                for statement in statements:
+                    connection.execute(statement)
+                connection.execute("INSERT INTO t_schema_version (version) VALUES (?)", (version,))
+            connection.commit()
+        except Exception:
+            connection.rollback()
+            raise
+
+class AITRIOSLocalDBHandler:
+    def __init__(self, connection=None):
+        # コネクションが渡された場合はそれを使う(コネクションプールから借りる場合)
+        if connection is None:
+            self.connection = sqlite3.connect(DB_FILE_NAME)
+            configure_connection(self.connection)
+            self.owns_connection = True
+        else:
+            self.connection = connection
+            self.owns_connection = False
+        self.cursor = self.connection.cursor()
+
+    def close(self):
+        self.cursor.close()
+        # プールから借りたコネクションは閉じない
+        if self.owns_connection:
+            self.connection.close()
+
+# コネクションプール(書き込み用1本、読み出し用N本)
+# アプリ起動時に1度だけ作成し、テーブル作成もその時に1度だけ行う
+class AITRIOSLocalDBPool:
+    def __init__(self, db_file_name=DB_FILE_NAME, reader_count=4, storage_layout=STORAGE_LAYOUT_ROW):
+        self.db_file_name = db_file_name
+        if storage_layout == STORAGE_LAYOUT_FRAME:
+            self.table_handler_class = InferenceFrameTableHandler
+        else:
+            self.table_handler_class = InferenceResultTableHandler
+        # frame形式で使うデバイスIDとデバイスキーの対応(一度採番したら変わらないため共有する)
+        self.device_keys = {}
+        self.writer_lock = threading.Lock()
+        self.writer_connection = self.connect()
+
+        # テーブル作成とマイグレーションは起動時の1度だけ
+        table_handler = InferenceResultTableHandler(AITRIOSLocalDBHandler(self.writer_connection))
+        table_handler.create_table()
+        table_handler.close()
+
+        self.reader_connections = queue.Queue()
+        for _ in range(reader_count):
+            self.reader_connections.put(self.connect())
+
+    def connect(self):
+        # FastAPIのスレッドプールから使われるため、スレッドをまたいだ利用を許可する
+        connection = sqlite3.connect(self.db_file_name, check_same_thread=False)
+        configure_connection(connection)
+        return connection
+
+    def create_table_handler(self, connection):
+        table_handler = self.table_handler_class(AITRIOSLocalDBHandler(connection))
+        if isinstance(table_handler, InferenceFrameTableHandler):
+            table_handler.device_keys = self.device_keys
+        return table_handler
+
+    # 書き込み用コネクションを排他的に借りる
+    @contextmanager
+    def writer(self):
+        with self.writer_lock:
+            table_handler = self.create_table_handler(self.writer_connection)
+            try:
+                yield table_handler
+            finally:
+                table_handler.close()
+
+    # 読み出し用コネクションを借りる。空きが無い場合は返却されるまで待つ
+    @contextmanager
+    def reader(self):
+        connection = self.reader_connections.get()
+        table_handler = self.create_table_handler(connection)
+        try:
+            yield table_handler
+        finally:
+            table_handler.close()
+            self.reader_connections.put(connection)
+
+    # 他のコネクション(他のワーカープロセスなど)がコミットすると変わる値を返す
+    # 書き込み用コネクション自身のコミットでは変わらないため、自プロセス以外からの書き込みを検知できる
+    # 書き込み中でロックが取れない場合は待たずにNoneを返す
+    def external_data_version(self):
+        if not self.writer_lock.acquire(blocking=False):
+            return None
+        try:
+            return self.writer_connection.execute("PRAGMA data_version").fetchone()[0]
+        finally:
+            self.writer_lock.release()
+
+    def close(self):
+        with self.writer_lock:
+            self.writer_connection.close()
+        while not self.reader_connections.empty():
+            self.reader_connections.get_nowait().close()
+
+# デバイスごとの最新フレームのキャッシュ(デバイスIDのLRU)
+# 書き込み時に更新し、読み出し時にSQLiteを参照しないようにする
+class LatestFrameCache:
+    def __init__(self, max_devices=256):
+        self.max_devices = max_devices
+        self.lock = threading.Lock()
+        self.frames = OrderedDict()
+        self.data_version = None
+        # デバイスごとの自プロセスの書き込みの世代と、コミットからキャッシュへの反映までの間の書き込みの数
+        # SQLiteから読み出したフレームは、読み出し中にそのデバイスへの書き込みが無かった場合のみキャッシュする
+        self.write_generations = {}
+        self.writes_in_flight = {}
+
+    # 他プロセスからの書き込みを検知した場合はキャッシュを全て破棄する
+    def validate(self, data_version):
+        if data_version is None:
+            return
+        with self.lock:
+            if self.data_version != data_version:
+                self.frames.clear()
+                self.data_version = data_version
+
+    def get(self, device_id):
+        with self.lock:
+            frame = self.frames.get(device_id)
+            if frame is None:
+                return None
+            self.frames.move_to_end(device_id)
+            return frame[1]
+
+    # フレームIDから作るETag
+    def get_etag(self, device_id):
+        with self.lock:
+            frame = self.frames.get(device_id)
+            if frame is None:
+                return None
+            return '"%s"' % frame[1]["frame_id"]
+
+    # 応答用にエンコードしたバイト列を返す。未エンコードの場合はencoderでエンコードし、次の書き込みまで保持する
+    def get_encoded(self, device_id, encoder):
+        with self.lock:
+            frame = self.frames.get(device_id)
+            if frame is None:
+                return None
+            self.frames.move_to_end(device_id)
+            if frame[2] is None:
+                frame = (frame[0], frame[1], encoder(frame[1]))
+                self.frames[device_id] = frame
+            return frame[2]
+
+    # フレームIDはフレームの日時と推論結果の件数から作る(同じ日時の推論結果が追加された場合も変わる)
+    @staticmethod
+    def with_frame_id(inference_epoch_ms, json_data):
+        return dict(json_data, frame_id="%d-%d" % (inference_epoch_ms, json_data["count"]))
+
+    # 書き込み(コミット)の前に書き込むデバイスを指定して呼び、キャッシュへの反映が終わったらend_writeを呼ぶ
+    def begin_write(self, device_ids):
+        with self.lock:
+            for device_id in device_ids:
+                self.write_generations[device_id] = self.write_generations.get(device_id, 0) + 1
+                self.writes_in_flight[device_id] = self.writes_in_flight.get(device_id, 0) + 1
+
+    def end_write(self, device_ids):
+        with self.lock:
+            for device_id in device_ids:
+                self.writes_in_flight[device_id] -= 1
+                if not self.writes_in_flight[device_id]:
+                    del self.writes_in_flight[device_id]
+
+    # SQLiteから読み出す前に取得し、putのgenerationに渡す
+    def get_write_generation(self, device_id):
+        with self.lock:
+            return self.write_generations.get(device_id, 0)
+
+    # inference_epoch_msが新しいフレームのみ反映する。同じ日時の場合は推論結果を追加する
+    # generationを指定した場合はSQLiteから読み出したフレーム全体とみなし、追加せずに置き換える
+    # ただし読み出し中に書き込みがあった場合は、書き込み側の反映と重複しないようキャッシュしない
+    # 反映したフレーム(frame_id付き)を返す。反映しなかった場合はNoneを返す
+    def put(self, device_id, inference_epoch_ms, json_data, generation=None):
+        with self.lock:
+            if generation is not None and (generation != self.write_generations.get(device_id, 0) or
+                                           device_id in self.writes_in_flight):
+                return None
+            frame = self.frames.get(device_id)
+            if frame is not None:
+                if inference_epoch_ms < frame[0]:
+                    return None
+                if inference_epoch_ms == frame[0] and generation is None:
+                    inferences = frame[1]["inferences"] + json_data["inferences"]
+                    json_data = {"count": len(inferences), "inferences": inferences}
+            json_data = self.with_frame_id(inference_epoch_ms, json_data)
+            # (日時, 推論結果, エンコード済みのバイト列)
+            self.frames[device_id] = (inference_epoch_ms, json_data, None)
+            self.frames.move_to_end(device_id)
+            while len(self.frames) > self.max_devices:
+                self.frames.popitem(last=False)
+            return json_data
+
+# 推論結果Table
+class InferenceResultTableHandler:
+    def __init__(self, dbhandler=None):
+        # dbhandlerが渡された場合はテーブル作成済み(コネクションプール経由)とみなす
+        if dbhandler is None:
+            self.dbhandler = AITRIOSLocalDBHandler()
+            self.create_table()
+        else:
+            self.dbhandler = dbhandler
 
+    def create_table(self):
+        migrate(self.dbhandler.connection)
 
     def insert_data(self, data):
-        self.dbhandler.cursor.execute("INSERT INTO t_inference_result  (device_id, class_id, inference_datetime , inference_percentage, x1, y1, x2, y2) VALUES (?, ?, ?, ?, ?, ?, ?, ?)", 
+        self.dbhandler.cursor.execute("INSERT INTO t_inference_result  (device_id, class_id, inference_epoch_ms , inference_percentage, x1, y1, x2, y2) VALUES (?, ?, ?, ?, ?, ?, ?, ?)", 
                             (data["device_id"], data["C"], data["T"], data["P"], data["X"], data["Y"], data["x"], data["y"]))
         self.dbhandler.connection.commit()
 
+    # 1フレーム分など複数レコードを1トランザクションでまとめて登録する
+    def insert_many(self, data_list):
+        with self.dbhandler.connection:
+            self.dbhandler.cursor.executemany("INSERT INTO t_inference_result  (device_id, class_id, inference_epoch_ms , inference_percentage, x1, y1, x2, y2) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                                [(data["device_id"], data["C"], data["T"], data["P"], data["X"], data["Y"], data["x"], data["y"]) for data in data_list])
+            self.update_rollups(data_list)
+
+    # 登録するレコードをフレームごとにまとめ、t_inference_rollupに加算する(insert_manyのトランザクション内で呼ぶ)
+    def update_rollups(self, data_list):
+        frames = {}
+        for data in data_list:
+            frames.setdefault((data["device_id"], data["T"]), []).append(data)
+
+        rollups = {}
+        for (device_id, epoch_ms), records in frames.items():
+            # クラスごとの(検出数, スコアの合計)。空文字はフレーム全体
+            frame_counts = {"": [0, 0.0]}
+            for data in records:
+                if data["C"] == "":
+                    continue
+                for class_id in ("", str(data["C"])):
+                    counts = frame_counts.setdefault(class_id, [0, 0.0])
+                    counts[0] += 1
+                    counts[1] += data["P"]
+
+            for bucket, bucket_ms in ROLLUP_BUCKETS.items():
+                bucket_epoch_ms = epoch_ms - epoch_ms % bucket_ms
+                for class_id, (detection_count, score_sum) in frame_counts.items():
+                    rollup = rollups.setdefault((device_id, bucket, bucket_epoch_ms, class_id), [0, 0, 0, 0.0])
+                    rollup[0] += 1
+                    rollup[1] += detection_count
+                    rollup[2] = max(rollup[2], detection_count)
+                    rollup[3] += score_sum
+
+        self.dbhandler.cursor.executemany(
+            "INSERT INTO t_inference_rollup (device_id, bucket, bucket_epoch_ms, class_id, frame_count, detection_count, max_count, score_sum) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?) "
+            "ON CONFLICT (device_id, bucket, bucket_epoch_ms, class_id) DO UPDATE SET "
+            "frame_count = frame_count + excluded.frame_count, "
+            "detection_count = detection_count + excluded.detection_count, "
+            "max_count = MAX(max_count, excluded.max_count), "
+            "score_sum = score_sum + excluded.score_sum",
+            [key + tuple(rollup) for key, rollup in rollups.items()]
+        )
+
+    # from_epoch_ms以上to_epoch_ms未満の集計を取り出す
+    def fetch_rollups(self, device_id, bucket, from_epoch_ms, to_epoch_ms):
+        bucket_ms = ROLLUP_BUCKETS[bucket]
+        self.dbhandler.cursor.execute(
+            "SELECT bucket_epoch_ms, class_id, frame_count, detection_count, max_count, score_sum FROM t_inference_rollup "
+            "WHERE device_id = ? AND bucket = ? AND bucket_epoch_ms >= ? AND bucket_epoch_ms < ? "
+            "ORDER BY bucket_epoch_ms, class_id",
+            (device_id, bucket, from_epoch_ms - from_epoch_ms % bucket_ms, to_epoch_ms)
+        )
+        return self.dbhandler.cursor.fetchall()
+
+    # 集計を時間単位ごとにまとめる
+    def convert_rollups_to_json(self, device_id, bucket, rollup_tuples):
+        buckets = []
+        for bucket_epoch_ms, class_id, frame_count, detection_count, max_count, score_sum in rollup_tuples:
+            if class_id == "":
+                # クラスを問わない全体の集計は時間単位ごとに最初に並ぶ
+                buckets.append({
+                    "T": render_inference_datetime(bucket_epoch_ms),
+                    "frames": frame_count,
+                    "detections": detection_count,
+                    "max_per_frame": max_count,
+                    "mean_per_frame": detection_count / frame_count,
+                    "mean_score": score_sum / detection_count if detection_count else None,
+                    "classes": [],
+                })
+                continue
+            total = buckets[-1]
+            total["classes"].append({
+                "C": class_id,
+                "frames": frame_count,
+                "detections": detection_count,
+                "max_per_frame": max_count,
+                "mean_per_frame": detection_count / total["frames"],
+                "mean_score": score_sum / detection_count,
+            })
+
+        return {
+            "device_id": device_id,
+            "bucket": bucket,
+            "count": len(buckets),
+            "buckets": buckets,
+        }
+
+    # cutoff_epoch_msより古い推論結果をlimit件まで削除し、削除した件数を返す
+    # summarizeがTrueの場合は削除前に1時間ごとの件数をt_inference_summaryに集計する
+    def purge_before(self, cutoff_epoch_ms, limit, summarize=False):
+        with self.dbhandler.connection:
+            self.dbhandler.cursor.execute(
+                "SELECT id, device_id, class_id, inference_epoch_ms FROM t_inference_result "
+                "WHERE inference_epoch_ms < ? LIMIT ?",
+                (cutoff_epoch_ms, limit)
+            )
+            rows = self.dbhandler.cursor.fetchall()
+            if summarize:
+                self.summarize([(device_id, class_id, inference_epoch_ms, 1)
+                                for _, device_id, class_id, inference_epoch_ms in rows])
+            self.dbhandler.cursor.executemany("DELETE FROM t_inference_result WHERE id = ?", [(row[0],) for row in rows])
+        return len(rows)
+
+    # (デバイスID, クラスID, エポックミリ秒, 件数)のリストを1時間ごとに集計して加算する
+    def summarize(self, counts):
+        buckets = {}
+        for device_id, class_id, epoch_ms, count in counts:
+            key = (device_id, str(class_id), epoch_ms - epoch_ms % SUMMARY_BUCKET_MS)
+            buckets[key] = buckets.get(key, 0) + count
+        self.dbhandler.cursor.executemany(
+            "INSERT INTO t_inference_summary (device_id, class_id, bucket_epoch_ms, detection_count) VALUES (?, ?, ?, ?) "
+            "ON CONFLICT (device_id, class_id, bucket_epoch_ms) DO UPDATE SET detection_count = detection_count + excluded.detection_count",
+            [key + (count,) for key, count in buckets.items()]
+        )
+
+    # 削除した領域の解放とWALのチェックポイント
+    def compact(self, vacuum_pages):
+        self.dbhandler.cursor.execute(f"PRAGMA incremental_vacuum({int(vacuum_pages)})")
+        self.dbhandler.cursor.fetchall()
+        self.dbhandler.cursor.execute("PRAGMA wal_checkpoint(PASSIVE)")
+        return self.dbhandler.cursor.fetchone()
+
     def fetch_by_device_id(self, device_id: str):
         self.dbhandler.cursor.execute("SELECT * FROM t_inference_result WHERE device_id = ?", (device_id,))
         return self.dbhandler.cursor.fetchall()
 
+    # 画像の索引(保存形式によらずt_image_indexを使う)
+    # 同じパスに再度保存された場合は既存のレコードを置き換える
+    def insert_image(self, device_id, image_epoch_ms, path, size):
+        with self.dbhandler.connection:
+            self.dbhandler.cursor.execute(
+                "INSERT INTO t_image_index (device_id, image_epoch_ms, path, size) VALUES (?, ?, ?, ?) "
+                "ON CONFLICT (path) DO UPDATE SET device_id = excluded.device_id, image_epoch_ms = excluded.image_epoch_ms, size = excluded.size",
+                (device_id, image_epoch_ms, path, size))
+
+    # 指定した日時に最も近い画像を(ID, デバイスID, エポックミリ秒, パス, サイズ)で返す。無い場合はNone
+    def fetch_nearest_image(self, device_id, epoch_ms):
+        candidates = []
+        for condition, order in (("<=", "DESC"), (">", "ASC")):
+            self.dbhandler.cursor.execute(
+                "SELECT id, device_id, image_epoch_ms, path, size FROM t_image_index "
+                f"WHERE device_id = ? AND image_epoch_ms {condition} ? ORDER BY image_epoch_ms {order}, id DESC LIMIT 1",
+                (device_id, epoch_ms)
+            )
+            candidates.extend(self.dbhandler.cursor.fetchall())
+        if not candidates:
+            return None
+        return min(candidates, key=lambda image: abs(image[2] - epoch_ms))
+
+    def fetch_latest_image(self, device_id):
+        self.dbhandler.cursor.execute(
+            "SELECT id, device_id, image_epoch_ms, path, size FROM t_image_index "
+            "WHERE device_id = ? ORDER BY image_epoch_ms DESC, id DESC LIMIT 1",
+            (device_id,)
+        )
+        return self.dbhandler.cursor.fetchone()
+
+    # 古い順にlimit件までの画像を(ID, パス, サイズ)で返す。cutoff_epoch_msを指定した場合はそれより前のもののみ
+    def fetch_oldest_images(self, limit, cutoff_epoch_ms=None):
+        if cutoff_epoch_ms is None:
+            self.dbhandler.cursor.execute(
+                "SELECT id, path, size FROM t_image_index ORDER BY image_epoch_ms LIMIT ?", (limit,))
+        else:
+            self.dbhandler.cursor.execute(
+                "SELECT id, path, size FROM t_image_index WHERE image_epoch_ms < ? ORDER BY image_epoch_ms LIMIT ?",
+                (cutoff_epoch_ms, limit))
+        return self.dbhandler.cursor.fetchall()
+
+    def fetch_image_total_size(self):
+        self.dbhandler.cursor.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM t_image_index")
+        return self.dbhandler.cursor.fetchone()
+
+    def delete_images(self, image_ids):
+        with self.dbhandler.connection:
+            self.dbhandler.cursor.executemany("DELETE FROM t_image_index WHERE id = ?", [(image_id,) for image_id in image_ids])
+
+    # 推論結果が登録されているデバイスIDの一覧
+    def fetch_device_ids(self):
+        self.dbhandler.cursor.execute("SELECT DISTINCT device_id FROM t_inference_result ORDER BY device_id")
+        return [row[0] for row in self.dbhandler.cursor.fetchall()]
+
+    # from_epoch_ms以上to_epoch_ms未満の推論結果を(日時, ID)の順にlimit件まで取り出し、(カーソル, レコード)のリストを返す
+    # afterに前回取り出した最後のカーソルを渡すと、その続きから取り出す
+    def fetch_range(self, device_id, from_epoch_ms, to_epoch_ms, after, limit):
+        after_epoch_ms, after_id = map(int, split_cursor(after, 2)) if after else (from_epoch_ms, 0)
+        self.dbhandler.cursor.execute(
+            "SELECT * FROM t_inference_result "
+            "WHERE device_id = ? AND inference_epoch_ms >= ? AND inference_epoch_ms < ? "
+            "AND (inference_epoch_ms, id) > (?, ?) "
+            "ORDER BY inference_epoch_ms, id LIMIT ?",
+            (device_id, from_epoch_ms, to_epoch_ms, after_epoch_ms, after_id, limit)
+        )
+        return [("%d-%d" % (data_tuple[3], data_tuple[0]), data_tuple) for data_tuple in self.dbhandler.cursor.fetchall()]
+
     def fetch_latestdate_by_device_id(self, device_id: str):
         self.dbhandler.cursor.execute(
             "SELECT * FROM t_inference_result "
-            "WHERE device_id = ? AND inference_datetime = ("
-            "SELECT inference_datetime FROM t_inference_result "
-            "WHERE device_id = ? ORDER BY inference_datetime DESC LIMIT 1)",
+            "WHERE device_id = ? AND inference_epoch_ms = ("
+            "SELECT MAX(inference_epoch_ms) FROM t_inference_result "
+            "WHERE device_id = ?)",
             (device_id, device_id)
         )
         return self.dbhandler.cursor.fetchall()
+
+    # 複数デバイスの最新フレームを1回のクエリで取り出し、デバイスIDごとのレコードのリストを返す
+    # MAXはデバイスごとの相関サブクエリにする(GROUP BYでまとめるとインデックスの最大値の参照にならず、全件を走査する)
+    def fetch_latestdate_by_device_ids(self, device_ids):
+        values = ", ".join(["(?)"] * len(device_ids))
+        self.dbhandler.cursor.execute(
+            f"WITH d (device_id) AS (VALUES {values}) "
+            "SELECT r.* FROM d JOIN t_inference_result r ON r.device_id = d.device_id AND r.inference_epoch_ms = ("
+            "SELECT MAX(inference_epoch_ms) FROM t_inference_result WHERE device_id = d.device_id"
+            ") ORDER BY r.id",
+            list(device_ids)
+        )
+        records = {}
+        for data_tuple in self.dbhandler.cursor.fetchall():
+            records.setdefault(data_tuple[1], []).append(data_tuple)
+        return records
  
     def convert_to_json_multiple(self, data_tuples):
         inferences = []
@@ -60,7 +640,7 @@ class InferenceResultTableHandler:
             data_dict = {
                 "device_id": data_tuple[1],
                 "C": data_tuple[2],
-                "T": datetime.strptime(data_tuple[3][:-3] + data_tuple[3][-3:] + "000", "%Y%m%d%H%M%S%f"),
+                "T": render_inference_datetime(data_tuple[3]),
                 "P": data_tuple[4],
                 "X": data_tuple[5],
                 "Y": data_tuple[6],
@@ -77,4 +657,153 @@ class InferenceResultTableHandler:
         return result
 
     def close(self):
-        self.dbhandler.close()
\ No newline at end of file
+        self.dbhandler.close()
+
+# 推論結果Table(frame形式)
+# 1フレームを1レコードとし、デバイスIDは整数のキー、日時はエポックミリ秒、検出結果はバイナリで保存する
+# 読み出しはt_inference_resultと同じ形式のタプルで返すため、呼び出し側はInferenceResultTableHandlerと同様に使える
+class InferenceFrameTableHandler(InferenceResultTableHandler):
+    def __init__(self, dbhandler=None):
+        super().__init__(dbhandler)
+        self.device_keys = {}
+
+    # トランザクション内で呼ぶ。新しく採番したキーはnew_device_keysに入れ、コミット後にdevice_keysに反映する
+    # (ロールバックされるとt_deviceの行が消え、同じキーが別のデバイスに採番されるため)
+    def get_device_key(self, device_id: str, new_device_keys):
+        device_key = self.device_keys.get(device_id, new_device_keys.get(device_id))
+        if device_key is None:
+            self.dbhandler.cursor.execute("INSERT OR IGNORE INTO t_device (device_id) VALUES (?)", (device_id,))
+            self.dbhandler.cursor.execute("SELECT device_key FROM t_device WHERE device_id = ?", (device_id,))
+            device_key = self.dbhandler.cursor.fetchone()[0]
+            new_device_keys[device_id] = device_key
+        return device_key
+
+    def find_device_key(self, device_id: str):
+        device_key = self.device_keys.get(device_id)
+        if device_key is None:
+            self.dbhandler.cursor.execute("SELECT device_key FROM t_device WHERE device_id = ?", (device_id,))
+            row = self.dbhandler.cursor.fetchone()
+            if row is None:
+                return None
+            device_key = row[0]
+            self.device_keys[device_id] = device_key
+        return device_key
+
+    def insert_data(self, data):
+        self.insert_many([data])
+
+    def purge_before(self, cutoff_epoch_ms, limit, summarize=False):
+        with self.dbhandler.connection:
+            self.dbhandler.cursor.execute(
+                "SELECT f.id, d.device_id, f.inference_epoch_ms, f.detections FROM t_inference_frame f "
+                "JOIN t_device d ON d.device_key = f.device_key "
+                "WHERE f.inference_epoch_ms < ? LIMIT ?",
+                (cutoff_epoch_ms, limit)
+            )
+            frames = self.dbhandler.cursor.fetchall()
+            if summarize:
+                counts = []
+                for _, device_id, inference_epoch_ms, detections in frames:
+                    if not detections:
+                        counts.append((device_id, "", inference_epoch_ms, 1))
+                    for detection in DETECTION_STRUCT.iter_unpack(detections):
+                        counts.append((device_id, detection[0], inference_epoch_ms, 1))
+                self.summarize(counts)
+            self.dbhandler.cursor.executemany("DELETE FROM t_inference_frame WHERE id = ?", [(frame[0],) for frame in frames])
+        return len(frames)
+
+    # レコードをフレーム(デバイスIDと日時)ごとにまとめ、1フレーム1レコードで登録する
+    def insert_many(self, data_list):
+        frames = {}
+        for data in data_list:
+            detections = frames.setdefault((data["device_id"], data["T"]), [])
+            # 推論結果が無しのレコードは検出結果0件のフレームとして保存する
+            if data["C"] != "":
+                detections.append(DETECTION_STRUCT.pack(int(data["C"]), data["P"], data["X"], data["Y"], data["x"], data["y"]))
+
+        new_device_keys = {}
+        with self.dbhandler.connection:
+            self.dbhandler.cursor.executemany("INSERT INTO t_inference_frame (device_key, inference_epoch_ms, detections) VALUES (?, ?, ?)",
+                                [(self.get_device_key(device_id, new_device_keys), inference_epoch_ms, b"".join(detections))
+                                 for (device_id, inference_epoch_ms), detections in frames.items()])
+            self.update_rollups(data_list)
+        self.device_keys.update(new_device_keys)
+
+    def fetch_by_device_id(self, device_id: str):
+        device_key = self.find_device_key(device_id)
+        if device_key is None:
+            return []
+        self.dbhandler.cursor.execute(
+            "SELECT id, inference_epoch_ms, detections FROM t_inference_frame WHERE device_key = ? ORDER BY id",
+            (device_key,)
+        )
+        return self.expand_frames(device_id, self.dbhandler.cursor.fetchall())
+
+    def fetch_device_ids(self):
+        self.dbhandler.cursor.execute("SELECT device_id FROM t_device ORDER BY device_id")
+        return [row[0] for row in self.dbhandler.cursor.fetchall()]
+
+    # カーソルはフレームの(エポックミリ秒, ID)とフレーム内の検出結果の番号
+    def fetch_range(self, device_id, from_epoch_ms, to_epoch_ms, after, limit):
+        after_epoch_ms, after_id, after_index = map(int, split_cursor(after, 3)) if after else (0, 0, -1)
+        device_key = self.find_device_key(device_id)
+        if device_key is None:
+            return []
+        # カーソルのフレームの残りが0件の場合もlimit件に届くよう、1フレーム多く取り出す
+        self.dbhandler.cursor.execute(
+            "SELECT id, inference_epoch_ms, detections FROM t_inference_frame "
+            "WHERE device_key = ? AND inference_epoch_ms >= ? AND inference_epoch_ms < ? "
+            "AND (inference_epoch_ms, id) >= (?, ?) "
+            "ORDER BY inference_epoch_ms, id LIMIT ?",
+            (device_key, from_epoch_ms, to_epoch_ms, after_epoch_ms, after_id, limit + 1)
+        )
+
+        records = []
+        for frame_id, inference_epoch_ms, detections in self.dbhandler.cursor.fetchall():
+            for index, data_tuple in enumerate(self.expand_frames(device_id, [(frame_id, inference_epoch_ms, detections)])):
+                if (inference_epoch_ms, frame_id) == (after_epoch_ms, after_id) and index <= after_index:
+                    continue
+                records.append(("%d-%d-%d" % (inference_epoch_ms, frame_id, index), data_tuple))
+                if len(records) == limit:
+                    return records
+        return records
+
+    def fetch_latestdate_by_device_id(self, device_id: str):
+        device_key = self.find_device_key(device_id)
+        if device_key is None:
+            return []
+        self.dbhandler.cursor.execute(
+            "SELECT id, inference_epoch_ms, detections FROM t_inference_frame "
+            "WHERE device_key = ? AND inference_epoch_ms = ("
+            "SELECT MAX(inference_epoch_ms) FROM t_inference_frame "
+            "WHERE device_key = ?) ORDER BY id",
+            (device_key, device_key)
+        )
+        return self.expand_frames(device_id, self.dbhandler.cursor.fetchall())
+
+    def fetch_latestdate_by_device_ids(self, device_ids):
+        values = ", ".join(["(?)"] * len(device_ids))
+        self.dbhandler.cursor.execute(
+            f"WITH ids (device_id) AS (VALUES {values}) "
+            "SELECT d.device_id, f.id, f.inference_epoch_ms, f.detections FROM ids "
+            "JOIN t_device d ON d.device_id = ids.device_id "
+            "JOIN t_inference_frame f ON f.device_key = d.device_key AND f.inference_epoch_ms = ("
+            "SELECT MAX(inference_epoch_ms) FROM t_inference_frame WHERE device_key = d.device_key"
+            ") ORDER BY f.id",
+            list(device_ids)
+        )
+        records = {}
+        for device_id, frame_id, inference_epoch_ms, detections in self.dbhandler.cursor.fetchall():
+            records.setdefault(device_id, []).extend(self.expand_frames(device_id, [(frame_id, inference_epoch_ms, detections)]))
+        return records
+
+    # フレームをt_inference_resultと同じ形式のタプルに展開する
+    def expand_frames(self, device_id, frames):
+        data_tuples = []
+        for frame_id, inference_epoch_ms, detections in frames:
+            if not detections:
+                data_tuples.append((frame_id, device_id, "", inference_epoch_ms, -1.0, -1, -1, -1, -1, None))
+                continue
+            for class_id, score, left, top, right, bottom in DETECTION_STRUCT.iter_unpack(detections):
+                data_tuples.append((frame_id, device_id, str(class_id), inference_epoch_ms, score, left, top, right, bottom, None))
+        return data_tuples
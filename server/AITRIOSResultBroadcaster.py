@@ -0,0 +1,69 @@
+import asyncio
+import threading
+
+# 配信先ごとのバッファ
+# 受信側の処理が遅く満杯になった場合は古いものから捨てる
+class InferenceResultSubscriber:
+    def __init__(self, max_buffer):
+        self.queue = asyncio.Queue(maxsize=max_buffer)
+        self.dropped_count = 0
+
+    def push(self, json_data):
+        if self.queue.full():
+            self.queue.get_nowait()
+            self.dropped_count += 1
+        self.queue.put_nowait(json_data)
+
+    async def get(self):
+        return await self.queue.get()
+
+# 新しく登録された推論結果を、デバイスごとの配信先全てに送る
+class InferenceResultBroadcaster:
+    def __init__(self, loop, max_buffer=16):
+        # 書き込みスレッドから呼ばれるため、配信処理はイベントループ上で行う
+        self.loop = loop
+        self.max_buffer = max_buffer
+        self.lock = threading.Lock()
+        self.subscribers = {}
+        # 新しいフレームを待っているリクエスト(long-poll)に通知するイベント。通知のたびに作り直す
+        self.frame_events = {}
+
+    def subscribe(self, device_id):
+        subscriber = InferenceResultSubscriber(self.max_buffer)
+        with self.lock:
+            self.subscribers.setdefault(device_id, set()).add(subscriber)
+        return subscriber
+
+    def unsubscribe(self, device_id, subscriber):
+        with self.lock:
+            subscribers = self.subscribers.get(device_id)
+            if subscribers is None:
+                return
+            subscribers.discard(subscriber)
+            if not subscribers:
+                del self.subscribers[device_id]
+
+    # 次にフレームが配信された時にセットされるイベントを返す(イベントループ上で呼ぶこと)
+    # 待つ側はイベントを取得してから最新フレームを確認することで、その間の配信を取りこぼさない
+    def get_frame_event(self, device_id):
+        with self.lock:
+            frame_event = self.frame_events.get(device_id)
+            if frame_event is None:
+                frame_event = self.frame_events[device_id] = asyncio.Event()
+            return frame_event
+
+    # どのスレッドからでも呼び出せる
+    def publish(self, device_id, json_data):
+        with self.lock:
+            if device_id not in self.subscribers and device_id not in self.frame_events:
+                return
+        self.loop.call_soon_threadsafe(self.publish_in_loop, device_id, json_data)
+
+    def publish_in_loop(self, device_id, json_data):
+        with self.lock:
+            subscribers = list(self.subscribers.get(device_id, ()))
+            frame_event = self.frame_events.pop(device_id, None)
+        for subscriber in subscribers:
+            subscriber.push(json_data)
+        if frame_event is not None:
+            frame_event.set()
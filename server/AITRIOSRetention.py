@@ -0,0 +1,111 @@
+import threading
+import time
+import logging
+import traceback
+
+# 一定間隔で削除処理を行うジョブ(スレッドの起動・停止と実行状況の集計)
+# サブクラスはPURGED_ITEMSの項目ごとの件数をpurgeで返す。get_statsでは項目ごとにlast_<項目>とtotal_<項目>を返す
+class PeriodicPurgeJob:
+    PURGED_ITEMS = ()
+
+    def __init__(self, interval=600, batch_size=1000):
+        self.interval = interval
+        self.batch_size = batch_size
+        self.stop_event = threading.Event()
+        self.thread = None
+
+        self.stats_lock = threading.Lock()
+        self.run_count = 0
+        self.last_run_at = None
+        self.last_duration = 0.0
+        self.last_purged = dict.fromkeys(self.PURGED_ITEMS, 0)
+        self.total_purged = dict.fromkeys(self.PURGED_ITEMS, 0)
+
+    def start(self):
+        self.stop_event.clear()
+        self.thread = threading.Thread(target=self.run, name=type(self).__name__, daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        if self.thread is None:
+            return
+        self.stop_event.set()
+        self.thread.join()
+        self.thread = None
+
+    def run(self):
+        while not self.stop_event.is_set():
+            try:
+                self.run_once()
+            except Exception:
+                traceback.print_exc()
+            self.stop_event.wait(self.interval)
+        logging.info("%s stopped", type(self).__name__)
+
+    # 1回分の削除を行い、削除した件数の辞書を返す
+    def run_once(self):
+        start_time = time.perf_counter()
+        purged = self.purge()
+        duration = time.perf_counter() - start_time
+        with self.stats_lock:
+            self.run_count += 1
+            self.last_run_at = time.time()
+            self.last_duration = duration
+            for name in self.PURGED_ITEMS:
+                self.last_purged[name] = purged[name]
+                self.total_purged[name] += purged[name]
+        return purged
+
+    def purge(self):
+        raise NotImplementedError
+
+    # 設定値(get_statsに含める)
+    def get_settings(self):
+        return {"interval": self.interval, "batch_size": self.batch_size}
+
+    def get_stats(self):
+        with self.stats_lock:
+            stats = self.get_settings()
+            stats.update({
+                "runs": self.run_count,
+                "last_run_at": self.last_run_at,
+                "last_duration": self.last_duration,
+            })
+            for name in self.PURGED_ITEMS:
+                stats["last_" + name] = self.last_purged[name]
+                stats["total_" + name] = self.total_purged[name]
+            return stats
+
+# 保存期間を過ぎた推論結果の定期削除
+# 書き込みロックを長く握らないよう、少しずつ削除しては他の書き込みに譲る
+class InferenceRetentionJob(PeriodicPurgeJob):
+    PURGED_ITEMS = ("rows_purged",)
+
+    def __init__(self, db_pool, retention_hours, interval=600, batch_size=1000, summarize=False, vacuum_pages=1000):
+        super().__init__(interval, batch_size)
+        self.db_pool = db_pool
+        self.retention_hours = retention_hours
+        # Trueの場合は削除前に1時間ごとの件数をt_inference_summaryに残す
+        self.summarize = summarize
+        # 1回の実行で解放する最大ページ数
+        self.vacuum_pages = vacuum_pages
+
+    # 1回分の削除と領域の解放を行う
+    def purge(self):
+        cutoff_epoch_ms = int((time.time() - self.retention_hours * 3600) * 1000)
+
+        rows_purged = 0
+        while not self.stop_event.is_set():
+            with self.db_pool.writer() as table_handler:
+                purged = table_handler.purge_before(cutoff_epoch_ms, self.batch_size, self.summarize)
+            rows_purged += purged
+            if purged < self.batch_size:
+                break
+
+        if rows_purged:
+            with self.db_pool.writer() as table_handler:
+                table_handler.compact(self.vacuum_pages)
+        return {"rows_purged": rows_purged}
+
+    def get_settings(self):
+        return {"retention_hours": self.retention_hours, "summarize": self.summarize, **super().get_settings()}
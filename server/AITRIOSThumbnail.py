@@ -0,0 +1,124 @@
+import os
+import threading
+import time
+import logging
+from concurrent.futures import ThreadPoolExecutor
+import cv2
+import numpy as np
+from AITRIOSImageReceiver import remove_file
+
+# 縮小画像の形式と、cv2.imencodeに渡す画質の指定
+THUMBNAIL_FORMATS = {
+    "jpg": cv2.IMWRITE_JPEG_QUALITY,
+    "webp": cv2.IMWRITE_WEBP_QUALITY,
+}
+
+# 元画像と同じディレクトリに置く縮小画像のパス(<元のファイル名>_<サイズ>.<形式>)
+def get_thumbnail_path(image_path, size, image_format):
+    return "%s_%d.%s" % (os.path.splitext(image_path)[0], size, image_format)
+
+# 受信した画像の縮小画像(長辺が指定したサイズ)の作成
+# 受信処理を待たせないよう専用のスレッドプールで作成する。OpenCVは処理中にGILを解放するため複数スレッドで並行して動く
+class ThumbnailGenerator:
+    def __init__(self, sizes=(160, 320, 640), image_format="jpg", quality=80, max_workers=2, max_pending=100):
+        if image_format not in THUMBNAIL_FORMATS:
+            raise ValueError("Unknown thumbnail format: " + image_format)
+        # 大きい順に作成し、1つ前に作成した画像から縮小する(元画像からの縮小は1回のみ)
+        self.sizes = sorted(sizes, reverse=True)
+        self.image_format = image_format
+        self.encode_params = [THUMBNAIL_FORMATS[image_format], quality]
+        # 作成待ちの上限。超えた場合は作成せず、取得時に作成する
+        self.max_pending = max_pending
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="ThumbnailGenerator")
+
+        self.stats_lock = threading.Lock()
+        self.pending_count = 0
+        self.generated_count = 0
+        self.skipped_count = 0
+        self.failed_count = 0
+        self.total_duration = 0.0
+        self.last_duration = 0.0
+
+    def shutdown(self):
+        self.executor.shutdown(wait=True)
+
+    # 作成を予約する。作成待ちが上限に達している場合はFalseを返す
+    def submit(self, image_path):
+        with self.stats_lock:
+            if self.pending_count >= self.max_pending:
+                self.skipped_count += 1
+                return False
+            self.pending_count += 1
+        self.executor.submit(self.run, image_path)
+        return True
+
+    def run(self, image_path):
+        try:
+            self.generate(image_path)
+        except Exception:
+            logging.exception("Thumbnail generation failed: %s", image_path)
+        finally:
+            with self.stats_lock:
+                self.pending_count -= 1
+
+    # 全てのサイズの縮小画像を作成する。画像として読み込めない場合はFalseを返す
+    def generate(self, image_path):
+        start_time = time.perf_counter()
+        image = cv2.imdecode(np.fromfile(image_path, dtype=np.uint8), cv2.IMREAD_COLOR)
+        if image is None:
+            with self.stats_lock:
+                self.failed_count += 1
+            return False
+
+        for size in self.sizes:
+            height, width = image.shape[:2]
+            scale = size / max(height, width)
+            if scale < 1:
+                image = cv2.resize(image, (max(1, round(width * scale)), max(1, round(height * scale))),
+                                   interpolation=cv2.INTER_AREA)
+            ok, encoded = cv2.imencode("." + self.image_format, image, self.encode_params)
+            if not ok:
+                with self.stats_lock:
+                    self.failed_count += 1
+                return False
+            # 書き込み途中のファイルを返さないよう、一時ファイルに書き込んでから置き換える
+            thumbnail_path = get_thumbnail_path(image_path, size, self.image_format)
+            temp_path = "%s.%d.part" % (thumbnail_path, threading.get_ident())
+            encoded.tofile(temp_path)
+            os.replace(temp_path, thumbnail_path)
+
+        duration = time.perf_counter() - start_time
+        with self.stats_lock:
+            self.generated_count += 1
+            self.total_duration += duration
+            self.last_duration = duration
+        return True
+
+    # 指定したサイズの縮小画像のパスを返す。まだ作成されていない場合はその場で作成する(スレッドプールから呼ぶこと)
+    # 作成できない場合はNone
+    def get_thumbnail(self, image_path, size):
+        thumbnail_path = get_thumbnail_path(image_path, size, self.image_format)
+        if os.path.exists(thumbnail_path):
+            return thumbnail_path
+        if os.path.exists(image_path) and self.generate(image_path):
+            return thumbnail_path
+        return None
+
+    # 元画像を削除する時に縮小画像も削除する
+    def remove(self, image_path):
+        for size in self.sizes:
+            remove_file(get_thumbnail_path(image_path, size, self.image_format))
+
+    def get_stats(self):
+        with self.stats_lock:
+            return {
+                "sizes": self.sizes,
+                "format": self.image_format,
+                "pending": self.pending_count,
+                "max_pending": self.max_pending,
+                "generated": self.generated_count,
+                "skipped": self.skipped_count,
+                "failed": self.failed_count,
+                "last_duration": self.last_duration,
+                "average_duration": self.total_duration / self.generated_count if self.generated_count else 0,
+            }
@@ -1,81 +1,477 @@
-from fastapi import FastAPI, Request, status
+from fastapi import FastAPI, Request, status, Depends, Query
+from fastapi.responses import JSONResponse, StreamingResponse, FileResponse, Response, ORJSONResponse
+from starlette.background import BackgroundTask
+from contextlib import asynccontextmanager
+import asyncio
 import traceback
 import logging
-from Desilialize import DeserializeUtil
+from Desilialize import DeserializeUtil, DetectionFilter
 import json
-from AITRIOSLocalDBHandler import InferenceResultTableHandler
-from ConsoleWrapperLimited import ConsoleRESTAPI, Utils
-from datetime import datetime, timezone
+import orjson
+from AITRIOSLocalDBHandler import AITRIOSLocalDBPool, LatestFrameCache, STORAGE_LAYOUT_ROW, ROLLUP_BUCKETS, parse_inference_datetime, render_inference_datetime
+from AITRIOSIngestQueue import InferenceIngestQueue
+from AITRIOSResultBroadcaster import InferenceResultBroadcaster
+from AITRIOSRetention import InferenceRetentionJob
+from AITRIOSExport import InferenceExporter, EXPORT_FORMATS, default_export_format
+from AITRIOSImageReceiver import ImageUploadReceiver
+from AITRIOSImageStore import ImageStore, ImageRetentionJob, UNKNOWN_DEVICE_ID, is_safe_name
+from AITRIOSThumbnail import ThumbnailGenerator
+from starlette.concurrency import run_in_threadpool
+from typing import List
+import tempfile
+from ConsoleWrapperLimited import Utils
+from ConsoleWrapperAsync import AsyncConsoleRESTAPI
+from datetime import datetime, timezone, timedelta
+import calendar
+import time
 import os
 from dotenv import load_dotenv
 
+load_dotenv()
 
-app_ins = FastAPI()
+# SQLiteのコネクションプール(起動時に1度だけ作成)
+db_pool = None
+# 推論結果の書き込みキュー
+ingest_queue = None
+# デバイスごとの最新フレームのキャッシュ
+latest_frame_cache = None
+# Console APIの呼び出し(プロセスで1つだけ作成し、トークンとコネクションを使い回す)
+console_api_instance = None
+# 新しい推論結果の配信
+result_broadcaster = None
+# 保存期間を過ぎた推論結果の定期削除(RETENTION_HOURSが0の場合は削除しない)
+retention_job = None
+# 画像の受信(受信しながら一時ファイルに書き込む)
+image_receiver = ImageUploadReceiver(max_size=int(os.getenv("IMAGE_MAX_SIZE", str(16 * 1024 * 1024))))
+# 画像の保存先と索引
+image_store = None
+# 送信元のアドレスごとの、最後に/metaで受信したデバイスID(/image/{filename}で受信した画像のデバイスの特定に使う)
+meta_device_ids = {}
+# 画像の定期削除(IMAGE_RETENTION_HOURSとIMAGE_MAX_TOTAL_MBが0の場合は削除しない)
+image_retention_job = None
+# 受信した画像の縮小画像の作成
+thumbnail_generator = None
+# 期間指定の取得で1回にSQLiteから取り出す件数
+INFERENCE_RESULTS_CHUNK_SIZE = 500
+# long-pollで待つ最大時間(秒)
+LONG_POLL_MAX_WAIT = float(os.getenv("LONG_POLL_MAX_WAIT", "60"))
+# 配信のハートビート間隔(秒)
+STREAM_HEARTBEAT_INTERVAL = float(os.getenv("STREAM_HEARTBEAT_INTERVAL", "15"))
+# デバイスごとの検出結果の絞り込み条件の設定ファイル
+DETECTION_FILTER_FILE = os.getenv("DETECTION_FILTER_FILE", "detection_filter.json")
+# 設定ファイルが無い場合、またはデバイスの設定が無い場合の絞り込み条件(Class 0または1でかつ0.5以上のスコアのみ)
+default_detection_filter = DetectionFilter(class_ids=frozenset([0, 1]), min_score=0.5)
+device_detection_filters = {}
+# デバイスグループの設定ファイル({"<group>": ["<device_id>", ...]})
+DEVICE_GROUP_FILE = os.getenv("DEVICE_GROUP_FILE", "device_groups.json")
+device_groups = {}
+# 複数デバイスの最新フレームを一度に取得する場合の最大デバイス数
+LATEST_BATCH_MAX_DEVICES = int(os.getenv("LATEST_BATCH_MAX_DEVICES", "500"))
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    global db_pool, ingest_queue, latest_frame_cache, result_broadcaster, console_api_instance, retention_job
+    global image_store, image_retention_job, thumbnail_generator
+    load_detection_filters(DETECTION_FILTER_FILE)
+    load_device_groups(DEVICE_GROUP_FILE)
+    meta_device_ids.clear()
+    db_pool = AITRIOSLocalDBPool(reader_count=int(os.getenv("DB_READER_COUNT", "4")),
+                                 storage_layout=os.getenv("INFERENCE_STORAGE_LAYOUT", STORAGE_LAYOUT_ROW))
+    latest_frame_cache = LatestFrameCache(max_devices=int(os.getenv("LATEST_FRAME_CACHE_SIZE", "256")))
+    result_broadcaster = InferenceResultBroadcaster(asyncio.get_running_loop(),
+                                                    max_buffer=int(os.getenv("STREAM_BUFFER_SIZE", "16")))
+    ingest_queue = InferenceIngestQueue(store_inference_results,
+                                        max_depth=int(os.getenv("INGEST_QUEUE_MAX_DEPTH", "1000")),
+                                        max_batch_size=int(os.getenv("INGEST_BATCH_SIZE", "100")))
+    ingest_queue.start()
+    retention_hours = float(os.getenv("RETENTION_HOURS", "0"))
+    if retention_hours > 0:
+        retention_job = InferenceRetentionJob(db_pool, retention_hours,
+                                              interval=float(os.getenv("RETENTION_INTERVAL", "600")),
+                                              batch_size=int(os.getenv("RETENTION_BATCH_SIZE", "1000")),
+                                              summarize=os.getenv("RETENTION_SUMMARIZE", "false").lower() == "true")
+        retention_job.start()
+    thumbnail_generator = ThumbnailGenerator(sizes=[int(size) for size in os.getenv("THUMBNAIL_SIZES", "160,320,640").split(",")],
+                                             image_format=os.getenv("THUMBNAIL_FORMAT", "jpg"),
+                                             quality=int(os.getenv("THUMBNAIL_QUALITY", "80")),
+                                             max_workers=int(os.getenv("THUMBNAIL_WORKERS", "2")))
+    image_store = ImageStore(db_pool, root_dir=os.getenv("IMAGE_DIR", "./image"),
+                             retention_hours=float(os.getenv("IMAGE_RETENTION_HOURS", "0")),
+                             max_total_bytes=int(float(os.getenv("IMAGE_MAX_TOTAL_MB", "0")) * 1024 * 1024),
+                             thumbnail_generator=thumbnail_generator)
+    if image_store.retention_hours > 0 or image_store.max_total_bytes > 0:
+        image_retention_job = ImageRetentionJob(image_store, interval=float(os.getenv("IMAGE_RETENTION_INTERVAL", "600")))
+        image_retention_job.start()
+    console_api_instance = AsyncConsoleRESTAPI(base_url, client_id, client_secret, gcs_okta_domain,
+                                               pool_size=int(os.getenv("CONSOLE_POOL_SIZE", "10")),
+                                               timeout=float(os.getenv("CONSOLE_TIMEOUT", "30")),
+                                               retries=int(os.getenv("CONSOLE_RETRIES", "3")))
+    yield
+    # 停止時はキューに残っている推論結果を書き込んでから閉じる
+    if retention_job is not None:
+        retention_job.stop()
+    if image_retention_job is not None:
+        image_retention_job.stop()
+    thumbnail_generator.shutdown()
+    ingest_queue.stop()
+    db_pool.close()
+    await console_api_instance.aclose()
+
+app_ins = FastAPI(lifespan=lifespan)
+
+# 絞り込み条件の設定ファイルを読み込む
+# {"default": {"class_ids": [0, 1], "min_score": 0.5}, "devices": {"<device_id>": {"min_score": 0.3, "max_detections": 10, "min_box_area": 100}}}
+# 不正な値がある場合は起動時にValueErrorで止める
+def load_detection_filters(file_name):
+    if not os.path.exists(file_name):
+        return
+    with open(file_name, encoding="utf-8") as r_fp:
+        filter_config = json.load(r_fp)
+    set_detection_filters(filter_config)
+    logging.info("Detection filters loaded: %s", file_name)
+
+# 全て検証してから置き換える(不正な値がある場合はValueErrorを送出し、現在の条件はそのまま)
+def set_detection_filters(filter_config):
+    global default_detection_filter, device_detection_filters
+    if not isinstance(filter_config, dict):
+        raise ValueError("Detection filter config must be an object")
+    devices = filter_config.get("devices", {})
+    if not isinstance(devices, dict):
+        raise ValueError("devices must be an object")
+    new_default_detection_filter = default_detection_filter
+    if "default" in filter_config:
+        new_default_detection_filter = DetectionFilter.from_dict(filter_config["default"])
+    new_device_detection_filters = {device_id: DetectionFilter.from_dict(device_filter)
+                                    for device_id, device_filter in devices.items()}
+    default_detection_filter = new_default_detection_filter
+    device_detection_filters = new_device_detection_filters
+
+def get_detection_filter(device_id):
+    return device_detection_filters.get(device_id, default_detection_filter)
+
+# デバイスグループの設定ファイルを読み込む
+def load_device_groups(file_name):
+    global device_groups
+    if not os.path.exists(file_name):
+        return
+    with open(file_name, encoding="utf-8") as r_fp:
+        device_groups = {group: list(device_ids) for group, device_ids in json.load(r_fp).items()}
+    logging.info("Device groups loaded: %s", file_name)
 # Log format
 log_format = '%(asctime)s - %(message)s'
 # Set log level to INFO
 logging.basicConfig(format=log_format, level=logging.INFO)
 
+# 起動時に作成したAITRIOSLocalDBPoolを渡す
+def get_db_pool():
+    return db_pool
+
 
 # 最後の推論結果取得
+# afterに前回のframe_id、waitに秒数を指定すると、新しいフレームが登録されるまで最大wait秒待ってから返す(long-poll)
 @app_ins.get("/{device_id}/inference_result")
-async def get_inference_result(device_id: str, request: Request):
+async def get_inference_result(device_id: str, request: Request, after: str = None,
+                               wait: float = Query(0, ge=0, le=LONG_POLL_MAX_WAIT),
+                               db_pool: AITRIOSLocalDBPool = Depends(get_db_pool)):
     logging.info("get_inference_result device_id: %s", device_id)
 
-    # SQLiteから取り出す
-    table_handler = InferenceResultTableHandler()
-    record = table_handler.fetch_latestdate_by_device_id(device_id)
+    if after is not None and wait > 0:
+        await wait_for_new_frame(db_pool, device_id, after, wait)
+
+    json_data = await get_latest_frame(db_pool, device_id)
+    # クライアントが同じフレームを持っている場合は304を返す(キャッシュのみ参照し、エンコードもしない)
+    etag = latest_frame_cache.get_etag(device_id)
+    if etag is not None and (etag_matches(request.headers.get("if-none-match"), etag) or
+                             (after is not None and json_data.get("frame_id") == after)):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers={"ETag": etag})
+
+    # キャッシュしたエンコード済みのバイト列をそのまま返す
+    content = latest_frame_cache.get_encoded(device_id, orjson.dumps)
+    if content is None:
+        content = orjson.dumps(json_data)
 
-    json_data = table_handler.convert_to_json_multiple(record)
-    table_handler.close()
-    print(json_data)
-    
     # TODO:最新日付のチェックをし、古い場合、または推論結果が存在しなかった場合は0件を返す
-    return json_data
+    return Response(content=content, media_type="application/json",
+                    headers={"ETag": etag} if etag is not None else None)
+
+# 最新フレームのframe_idがafterから変わるか、wait秒経つまで待つ
+# 待っている間はスレッドを使わず、書き込み時の配信イベントで起こされる
+async def wait_for_new_frame(db_pool, device_id, after, wait):
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + wait
+    while True:
+        frame_event = result_broadcaster.get_frame_event(device_id)
+        if (await get_latest_frame(db_pool, device_id)).get("frame_id") != after:
+            return
+        remaining = deadline - loop.time()
+        if remaining <= 0:
+            return
+        try:
+            await asyncio.wait_for(frame_event.wait(), timeout=remaining)
+        except asyncio.TimeoutError:
+            return
+        if (await get_latest_frame(db_pool, device_id)).get("frame_id") != after:
+            return
+
+def etag_matches(if_none_match, etag):
+    if not if_none_match:
+        return False
+    return any(tag.strip() in (etag, "W/" + etag, "*") for tag in if_none_match.split(","))
+
+# 新しい推論結果をServer-Sent Eventsで配信する
+# 接続直後に現在の最新フレームを送り、以降は登録されるたびに送る。一定時間登録が無い場合はハートビートを送る
+@app_ins.get("/{device_id}/inference_result/stream")
+async def stream_inference_result(device_id: str, request: Request,
+                                  db_pool: AITRIOSLocalDBPool = Depends(get_db_pool)):
+    logging.info("stream_inference_result device_id: %s", device_id)
+
+    subscriber = result_broadcaster.subscribe(device_id)
+
+    async def event_stream():
+        try:
+            yield format_inference_result_event(await get_latest_frame(db_pool, device_id))
+            while True:
+                try:
+                    json_data = await asyncio.wait_for(subscriber.get(), timeout=STREAM_HEARTBEAT_INTERVAL)
+                except asyncio.TimeoutError:
+                    yield "event: heartbeat\ndata: {}\n\n"
+                    continue
+                yield format_inference_result_event(json_data)
+        finally:
+            result_broadcaster.unsubscribe(device_id, subscriber)
+
+    return StreamingResponse(event_stream(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+def format_inference_result_event(json_data):
+    return "event: inference_result\ndata: " + orjson.dumps(json_data).decode() + "\n\n"
+
+# 非同期のAPIから呼ぶ場合の最新フレームの取得
+# キャッシュにある場合はそのまま返し、SQLiteから取り出す場合のみスレッドプールで行う(読み出し用コネクションの空き待ちでイベントループを止めない)
+async def get_latest_frame(db_pool: AITRIOSLocalDBPool, device_id: str):
+    latest_frame_cache.validate(db_pool.external_data_version())
+    json_data = latest_frame_cache.get(device_id)
+    if json_data is not None:
+        return json_data
+    return await run_in_threadpool(fetch_latest_frame, db_pool, device_id)
+
+# 最新フレームをキャッシュから取り出す。キャッシュに無い場合(起動直後など)のみSQLiteから取り出す
+def fetch_latest_frame(db_pool: AITRIOSLocalDBPool, device_id: str):
+    latest_frame_cache.validate(db_pool.external_data_version())
+    json_data = latest_frame_cache.get(device_id)
+    if json_data is not None:
+        return json_data
+
+    generation = latest_frame_cache.get_write_generation(device_id)
+    with db_pool.reader() as table_handler:
+        record = table_handler.fetch_latestdate_by_device_id(device_id)
+        json_data = table_handler.convert_to_json_multiple(record)
+
+    # 推論結果が無いデバイスも空のフレームとしてキャッシュする(次の書き込みで置き換わる)
+    inference_epoch_ms = record[0][3] if record else -1
+    cached_json_data = latest_frame_cache.put(device_id, inference_epoch_ms, json_data, generation)
+    return cached_json_data if cached_json_data is not None else LatestFrameCache.with_frame_id(inference_epoch_ms, json_data)
+
+# 複数デバイスの最新フレームをまとめて取得する
+# {"device_ids": ["<device_id>", ...]} または {"device_group": "<group>"} を受け取り、
+# キャッシュに無いデバイスの分だけ1回のクエリで読み出す
+@app_ins.post("/inference_results/latest")
+async def get_latest_inference_results(request: Request, db_pool: AITRIOSLocalDBPool = Depends(get_db_pool)):
+    content = await request.body()
+    try:
+        json_data = json.loads(content) if content else {}
+    except ValueError:
+        return JSONResponse(status_code=status.HTTP_400_BAD_REQUEST, content={"error": "invalid json"})
+    if not isinstance(json_data, dict):
+        return JSONResponse(status_code=status.HTTP_400_BAD_REQUEST,
+                            content={"error": "device_ids or device_group is required"})
+
+    if "device_group" in json_data:
+        device_ids = device_groups.get(json_data["device_group"]) if isinstance(json_data["device_group"], str) else None
+        if device_ids is None:
+            return JSONResponse(status_code=status.HTTP_400_BAD_REQUEST,
+                                content={"error": "unknown device_group: " + str(json_data["device_group"])})
+    else:
+        device_ids = json_data.get("device_ids")
+        if not isinstance(device_ids, list) or not all(isinstance(device_id, str) for device_id in device_ids):
+            return JSONResponse(status_code=status.HTTP_400_BAD_REQUEST,
+                                content={"error": "device_ids or device_group is required"})
+    # 重複を除き、指定された順序を保つ
+    device_ids = list(dict.fromkeys(device_ids))
+    if len(device_ids) > LATEST_BATCH_MAX_DEVICES:
+        return JSONResponse(status_code=status.HTTP_400_BAD_REQUEST,
+                            content={"error": "too many devices (max %d)" % LATEST_BATCH_MAX_DEVICES})
+    logging.info("get_latest_inference_results devices: %d", len(device_ids))
+
+    return ORJSONResponse({"count": len(device_ids), "results": await fetch_latest_frames(db_pool, device_ids)})
+
+# キャッシュにあるデバイスはそのまま返し、無いデバイスの分のみスレッドプールでSQLiteから取り出す
+async def fetch_latest_frames(db_pool, device_ids):
+    latest_frame_cache.validate(db_pool.external_data_version())
+    results = {}
+    missing_device_ids = []
+    for device_id in device_ids:
+        json_data = latest_frame_cache.get(device_id)
+        if json_data is None:
+            missing_device_ids.append(device_id)
+        results[device_id] = json_data
+
+    if missing_device_ids:
+        results.update(await run_in_threadpool(read_latest_frames, db_pool, missing_device_ids))
+    return results
+
+def read_latest_frames(db_pool, device_ids):
+    generations = {device_id: latest_frame_cache.get_write_generation(device_id) for device_id in device_ids}
+    results = {}
+    with db_pool.reader() as table_handler:
+        records = table_handler.fetch_latestdate_by_device_ids(device_ids)
+        for device_id in device_ids:
+            record = records.get(device_id, [])
+            json_data = table_handler.convert_to_json_multiple(record)
+            inference_epoch_ms = record[0][3] if record else -1
+            cached_json_data = latest_frame_cache.put(device_id, inference_epoch_ms, json_data, generations[device_id])
+            results[device_id] = (cached_json_data if cached_json_data is not None
+                                  else LatestFrameCache.with_frame_id(inference_epoch_ms, json_data))
+    return results
+
+# 1分/1時間単位の集計(フレーム数、検出数、1フレームあたりの最大/平均検出数、平均スコア)
+# from, toはISO 8601形式(タイムゾーン無しはUTC)。省略時はtoが現在時刻、fromがその1日前
+@app_ins.get("/{device_id}/stats")
+def get_inference_stats(device_id: str, bucket: str = "minute",
+                        from_datetime: datetime = Query(None, alias="from"),
+                        to_datetime: datetime = Query(None, alias="to"),
+                        db_pool: AITRIOSLocalDBPool = Depends(get_db_pool)):
+    if bucket not in ROLLUP_BUCKETS:
+        return JSONResponse(status_code=status.HTTP_400_BAD_REQUEST,
+                            content={"error": "bucket must be one of " + ", ".join(ROLLUP_BUCKETS)})
+    if to_datetime is None:
+        to_datetime = datetime.now(timezone.utc)
+    if from_datetime is None:
+        from_datetime = to_datetime - timedelta(days=1)
+
+    with db_pool.reader() as table_handler:
+        rollup_tuples = table_handler.fetch_rollups(device_id, bucket, to_epoch_ms(from_datetime), to_epoch_ms(to_datetime))
+        return ORJSONResponse(table_handler.convert_rollups_to_json(device_id, bucket, rollup_tuples))
+
+# 期間内の推論結果を1行1件のJSON(NDJSON)で返す。from, toはISO 8601形式(toは含まない)
+# 各行のcursorをafterに指定すると続きから取得できる。SQLiteからは少しずつ取り出しながら送る
+@app_ins.get("/{device_id}/inference_results")
+def get_inference_results(device_id: str,
+                          from_datetime: datetime = Query(None, alias="from"),
+                          to_datetime: datetime = Query(None, alias="to"),
+                          limit: int = Query(1000, ge=1, le=100000),
+                          after: str = None,
+                          db_pool: AITRIOSLocalDBPool = Depends(get_db_pool)):
+    from_epoch_ms = to_epoch_ms(from_datetime) if from_datetime is not None else 0
+    until_epoch_ms = to_epoch_ms(to_datetime if to_datetime is not None else datetime.now(timezone.utc))
+
+    # 1回目は応答前に取り出し、カーソルが不正な場合は400を返す
+    try:
+        records = fetch_inference_results_chunk(db_pool, device_id, from_epoch_ms, until_epoch_ms, after,
+                                                min(limit, INFERENCE_RESULTS_CHUNK_SIZE))
+    except ValueError:
+        return JSONResponse(status_code=status.HTTP_400_BAD_REQUEST, content={"error": "Invalid cursor"})
+
+    def ndjson_stream(records):
+        remaining = limit
+        while True:
+            for inference in records:
+                yield orjson.dumps(inference) + b"\n"
+            requested = min(remaining, INFERENCE_RESULTS_CHUNK_SIZE)
+            remaining -= len(records)
+            if remaining <= 0 or len(records) < requested:
+                break
+            records = fetch_inference_results_chunk(db_pool, device_id, from_epoch_ms, until_epoch_ms,
+                                                    records[-1]["cursor"], min(remaining, INFERENCE_RESULTS_CHUNK_SIZE))
+
+    return StreamingResponse(ndjson_stream(records), media_type="application/x-ndjson")
+
+# 読み出し用のコネクションは1回の取り出しの間だけ借りる
+def fetch_inference_results_chunk(db_pool, device_id, from_epoch_ms, until_epoch_ms, after, limit):
+    with db_pool.reader() as table_handler:
+        records = table_handler.fetch_range(device_id, from_epoch_ms, until_epoch_ms, after, limit)
+        inferences = table_handler.convert_to_json_multiple([data_tuple for _, data_tuple in records])["inferences"]
+    for (cursor, _), inference in zip(records, inferences):
+        inference["cursor"] = cursor
+    return inferences
+
+# 期間内の推論結果をParquet/Arrow IPC(pyarrowが必要)またはgzip圧縮のCSVで書き出す
+# device_idは複数指定でき、省略した場合は全デバイス。書き出し中もデバイスからの登録は止まらない
+@app_ins.get("/hub/export")
+def export_inference_results(device_id: List[str] = Query(None),
+                             from_datetime: datetime = Query(None, alias="from"),
+                             to_datetime: datetime = Query(None, alias="to"),
+                             export_format: str = Query(None, alias="format"),
+                             db_pool: AITRIOSLocalDBPool = Depends(get_db_pool)):
+    export_format = export_format or default_export_format()
+    from_epoch_ms = to_epoch_ms(from_datetime) if from_datetime is not None else 0
+    until_epoch_ms = to_epoch_ms(to_datetime if to_datetime is not None else datetime.now(timezone.utc))
+    suffix, media_type = EXPORT_FORMATS.get(export_format, ("", ""))
+
+    # 一旦一時ファイルに書き出し、送信後に削除する
+    w_fp = tempfile.NamedTemporaryFile(suffix=suffix, delete=False)
+    w_fp.close()
+    try:
+        stats = InferenceExporter(db_pool).export(w_fp.name, export_format, from_epoch_ms, until_epoch_ms, device_id)
+    except ValueError as e:
+        os.remove(w_fp.name)
+        return JSONResponse(status_code=status.HTTP_400_BAD_REQUEST, content={"error": str(e)})
+    logging.info("export_inference_results rows: %d rows/sec: %.0f", stats["rows"], stats["rows_per_sec"])
+
+    return FileResponse(w_fp.name, media_type=media_type, filename="inference_results" + suffix,
+                        headers={"X-Export-Rows": str(stats["rows"]),
+                                 "X-Export-Rows-Per-Sec": "%.0f" % stats["rows_per_sec"]},
+                        background=BackgroundTask(os.remove, w_fp.name))
+
+def to_epoch_ms(value: datetime):
+    return calendar.timegm(value.utctimetuple()) * 1000 + value.microsecond // 1000
 
 #------------------ AITRIOS Console Wrapper API --------------------------
-load_dotenv()
 client_id = os.getenv("CLIENT_ID")
 client_secret = os.getenv("CLIENT_SECRET")    
 base_url = "https://console.aitrios.sony-semicon.com/api/v1"
 gcs_okta_domain = "https://auth.aitrios.sony-semicon.com/oauth2/default/v1/token"
 
+# 起動時に作成したAsyncConsoleRESTAPIを渡す
+def get_console_api():
+    return console_api_instance
+
 @app_ins.post("/{device_id}/start_inference")
-def start_inference(device_id: str, request: Request) :
+async def start_inference(device_id: str, request: Request,
+                          console_api: AsyncConsoleRESTAPI = Depends(get_console_api)) :
     logging.info("start_inference device_id: %s", device_id)
-    console_api = ConsoleRESTAPI(base_url, client_id, client_secret, gcs_okta_domain)        
     print("推論開始:}")
-    response = console_api.StartUploadInferenceResult(device_id)
+    response = await console_api.StartUploadInferenceResult(device_id)
     print(response)
     return response
 
 @app_ins.post("/{device_id}/stop_inference")
-def stop_inference(device_id: str, request: Request) :
+async def stop_inference(device_id: str, request: Request,
+                         console_api: AsyncConsoleRESTAPI = Depends(get_console_api)) :
     logging.info("stop_inference device_id: %s", device_id)
-    console_api = ConsoleRESTAPI(base_url, client_id, client_secret, gcs_okta_domain)        
     print("推論停止")
-    response = console_api.StoploadInferenceResult(device_id)
+    response = await console_api.StoploadInferenceResult(device_id)
     print(response)
     return response
 
 # ローカルサーバーを設定する
 @app_ins.post("/{file_name}/set_command_param_for_local_server_address")
-async def set_command_param_for_local_server_address(file_name: str, request: Request):
+async def set_command_param_for_local_server_address(file_name: str, request: Request,
+                                                     console_api: AsyncConsoleRESTAPI = Depends(get_console_api)):
     logging.info("set_command_param_for_local_server_address file_name: %s", file_name)
-    return await update_command_parameters(file_name, request, set_local_server_address)
+    return await update_command_parameters(file_name, request, set_local_server_address, console_api)
 
 # CROPサイズを設定する
 @app_ins.post("/{file_name}/set_command_param_for_crop_size")
-async def set_command_param_for_crop_size(file_name: str, request: Request):
+async def set_command_param_for_crop_size(file_name: str, request: Request,
+                                          console_api: AsyncConsoleRESTAPI = Depends(get_console_api)):
     logging.info("set_command_param_for_crop_size file_name: %s", file_name)
-    return await update_command_parameters(file_name, request, set_crop_size)
+    return await update_command_parameters(file_name, request, set_crop_size, console_api)
 
 # CommandParameter共通処理
-async def update_command_parameters(file_name: str, request: Request, update_function):
-    console_api = ConsoleRESTAPI(base_url, client_id, client_secret, gcs_okta_domain)        
-
+async def update_command_parameters(file_name: str, request: Request, update_function, console_api: AsyncConsoleRESTAPI):
     # コマンドパラメータを取得
-    command_params = console_api.GetCommandParameterFiles()
+    command_params = await console_api.GetCommandParameterFiles()
 
     # 指定された file_name を持つ要素を抽出し commands 形式に整形
     command_param_data = []
@@ -100,7 +496,7 @@ async def update_command_parameters(file_name: str, request: Request, update_fun
 
     print(command_param_json)
     print("Command Parameter更新")
-    response = console_api.UpdateCommandParameterFiles(file_name, _encoded_command_param_data)
+    response = await console_api.UpdateCommandParameterFiles(file_name, _encoded_command_param_data)
     print(response)
     return response
 
@@ -133,16 +529,17 @@ def set_crop_size(commands, json_data):
 
 
 @app_ins.get("/{device_id}/get_preview_image")
-async def get_preview_image(device_id: str, request: Request):
+async def get_preview_image(device_id: str, request: Request,
+                            console_api: AsyncConsoleRESTAPI = Depends(get_console_api)):
     logging.info("get_preview_image device_id: %s", device_id)
 
-    console_api = ConsoleRESTAPI(base_url, client_id, client_secret, gcs_okta_domain) 
-    response = console_api.GetPreviewImage(device_id)
+    response = await console_api.GetPreviewImage(device_id)
 
     return response
 
 @app_ins.post("/get_provisioning_qr_code")
-async def get_provisioning_qr_code(request: Request):
+async def get_provisioning_qr_code(request: Request,
+                                   console_api: AsyncConsoleRESTAPI = Depends(get_console_api)):
     logging.info("get_provisioning_qr_code")
 
     content = await request.body()
@@ -151,84 +548,225 @@ async def get_provisioning_qr_code(request: Request):
     wifi_ssid = json_data["wifi_ssid"]
     wifi_pass = json_data["wifi_pass"]
 
-    console_api = ConsoleRESTAPI(base_url, client_id, client_secret, gcs_okta_domain) 
-    response = console_api.GetProvisioningQRCode(ntp, wifi_ssid, wifi_pass)
+    response = await console_api.GetProvisioningQRCode(ntp, wifi_ssid, wifi_pass)
 
     return response
 
 
 # AITRIOS ローカルHTTP用 画像受信(mode 0 or 1)
+# デバイスIDはX-Device-IDヘッダー、無い場合は同じ送信元から最後に/metaで受信した推論結果のDeviceIDとする
+# どちらも無い場合(推論結果を送らないmode 0で、ヘッダーも無い場合など)はUNKNOWN_DEVICE_IDの画像として保存する
 @app_ins.put("/image/{filename}")
 async def update_image(filename, request: Request):
-        try:
-                SAVE_PATH_IMG = './image'
+        device_id = request.headers.get("x-device-id")
+        if device_id is None and request.client is not None:
+                device_id = meta_device_ids.get(request.client.host)
+        return await store_image(device_id or UNKNOWN_DEVICE_ID, filename, request)
+
+# デバイスIDを指定した画像受信(デバイスごと、日時ごとに分けて保存する)
+@app_ins.put("/image/{device_id}/{filename}")
+async def update_device_image(device_id: str, filename: str, request: Request):
+        return await store_image(device_id, filename, request)
 
+async def store_image(device_id, filename, request: Request):
+        try:
                 logging.info("update image")
-                content = await request.body()
-                os.makedirs(SAVE_PATH_IMG, exist_ok=True)
-                save_file(SAVE_PATH_IMG, content, filename)
-                logging.info("Image File Saved: %s", filename)
+                if not is_safe_name(device_id) or not is_safe_name(filename):
+                        return JSONResponse(status_code=status.HTTP_400_BAD_REQUEST, content={"error": "Invalid file name"})
+                # 最大サイズを超える場合は受信せずに413を返す
+                if image_receiver.is_too_large(request.headers.get("content-length")):
+                        image_receiver.reject()
+                        return JSONResponse(status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+                                            content={"error": "Image is too large"})
+                image_epoch_ms = image_store.get_image_epoch_ms(filename)
+                relative_path = image_store.get_relative_path(device_id, image_epoch_ms, filename)
+                size = await image_receiver.receive(request.stream(), image_store.get_full_path(relative_path))
+                if size is None:
+                        return JSONResponse(status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+                                            content={"error": "Image is too large"})
+                await run_in_threadpool(image_store.register, device_id, image_epoch_ms, relative_path, size)
+                logging.info("Image File Saved: %s (%d bytes)", relative_path, size)
+                # 縮小画像は受信の応答を待たせずに作成する
+                thumbnail_generator.submit(image_store.get_full_path(relative_path))
                 return {"status":status.HTTP_200_OK}
         except (Exception):
                 traceback.print_exc()
 
-def save_file(file_type, content, filename):
-        file_path = os.path.join(file_type, filename)
-        with open(file_path, 'wb') as w_fp:
-                w_fp.write(content)
+# 指定した日時(ISO 8601形式、タイムゾーン無しはUTC)に最も近い画像を返す
+# 推論結果のTをそのまま指定すると、その推論を行ったフレームの画像が取得できる
+@app_ins.get("/image/{device_id}/nearest")
+def get_nearest_image(device_id: str, at_datetime: datetime = Query(..., alias="datetime"), size: int = None):
+    return image_file_response(image_store.find_nearest(device_id, to_epoch_ms(at_datetime)), size)
+
+# 最新の画像を返す。sizeを指定した場合は長辺がそのサイズの縮小画像を返す
+@app_ins.get("/image/{device_id}/latest")
+def get_latest_image(device_id: str, size: int = None):
+    return image_file_response(image_store.find_latest(device_id), size)
+
+def image_file_response(image, size):
+    if size is not None and size not in thumbnail_generator.sizes:
+        return JSONResponse(status_code=status.HTTP_400_BAD_REQUEST,
+                            content={"error": "size must be one of " + ", ".join(map(str, thumbnail_generator.sizes))})
+    if image is None or not os.path.exists(image["path"]):
+        return JSONResponse(status_code=status.HTTP_404_NOT_FOUND, content={"error": "Image not found"})
+
+    path = image["path"]
+    if size is not None:
+        # 作成前(または作成待ちが溢れた)場合はその場で作成する
+        path = thumbnail_generator.get_thumbnail(path, size)
+        if path is None:
+            return JSONResponse(status_code=status.HTTP_404_NOT_FOUND, content={"error": "Thumbnail not available"})
+    return FileResponse(path, headers={"X-Image-Datetime": render_inference_datetime(image["image_epoch_ms"])})
 
 # AITRIOS ローカルHTTP用 推論結果受信(mode 1 or 2)
+# 受信データの確認だけを行いキューに積む。SQLiteへの書き込みは書き込みスレッドで行う
 @app_ins.put("/meta/{filename}")
 async def update_inference_result(filename, request: Request):
     try:
         content = await request.body()
-        contentj = json.loads(content)
-        inferences = contentj["Inferences"]
-        inferenceresult = inferences[0]["O"]
-
-        deserializeutil = DeserializeUtil()
-        deserialize_data = deserializeutil.get_deserialize_data(inferenceresult)
-        logging.info("Deserialized Data: %s", deserialize_data)
-        
-        # SQLiteに格納する
-        table_handler = InferenceResultTableHandler()
-
-        inserted_count = 0
-        for rec, record in deserialize_data.items():
-            # TODO:必要に応じ条件を変える。Class 0または1でかつ0.5以上のスコアのみ
-            if (record['C'] == 0 or record['C'] == 1) and record['P'] >= 0.5:
-                data = {
-                    "device_id": contentj["DeviceID"],
-                    "C": record['C'],
-                    "T": inferences[0]["T"],
-                    "P": record['P'],
-                    "X": record['X'],
-                    "Y": record['Y'],
-                    "x": record['x'],
-                    "y": record['y']
-                }           
-                print("Insert Data: %s", data)
-                table_handler.insert_data(data)
-                inserted_count = inserted_count + 1
-
-        if inserted_count == 0:
-            # 推論結果が無しのレコードを入れる
-            now = datetime.now(timezone.utc)
-            data = {
-                "device_id": contentj["DeviceID"],
-                "C": "",
-                "T": now.strftime("%Y%m%d%H%M%S") + f"{now.microsecond // 1000:03d}",
-                "P": -1,
-                "X": -1,
-                "Y": -1,
-                "x": -1,
-                "y": -1
-            }           
-            print("No Insert Data: %s", data)
-            table_handler.insert_data(data)       
-
-        table_handler.close()
+        try:
+            contentj = json.loads(content)
+        except ValueError:
+            return JSONResponse(status_code=status.HTTP_400_BAD_REQUEST, content={"error": "Invalid json"})
+        if (not isinstance(contentj, dict) or "DeviceID" not in contentj or
+                not isinstance(contentj.get("Inferences"), list) or not contentj["Inferences"] or
+                not all(isinstance(inference, dict) and isinstance(inference.get("O"), str) for inference in contentj["Inferences"])):
+            return JSONResponse(status_code=status.HTTP_400_BAD_REQUEST, content={"error": "Invalid inference result"})
+        if request.client is not None and isinstance(contentj["DeviceID"], str):
+            meta_device_ids[request.client.host] = contentj["DeviceID"]
+
+        if not ingest_queue.put(contentj):
+            # キューが満杯の場合はデバイス側に再送してもらう
+            logging.warning("Ingest queue is full. device_id: %s", contentj["DeviceID"])
+            return JSONResponse(status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                                content={"error": "Ingest queue is full"},
+                                headers={"Retry-After": "1"})
 
         return {"status":status.HTTP_200_OK}
     except (Exception):
-        traceback.print_exc()
\ No newline at end of file
+        traceback.print_exc()
+
+# 受信した推論結果をSQLiteに登録するレコードに変換し、(レコードのリスト, 変換できなかったフレーム数)を返す
+# デバイスが複数の推論結果をまとめて送ってきた場合も、Inferencesの全てのフレームを変換する
+def convert_to_records(contentj):
+    data_list = []
+    invalid_frame_count = 0
+    for inference in contentj["Inferences"]:
+        try:
+            data_list.extend(convert_frame_to_records(contentj["DeviceID"], inference))
+        except (Exception):
+            traceback.print_exc()
+            invalid_frame_count += 1
+    return data_list, invalid_frame_count
+
+# 1フレーム分の推論結果をレコードに変換する
+def convert_frame_to_records(device_id, inference):
+    inferenceresult = inference["O"]
+
+    deserializeutil = DeserializeUtil()
+    # デバイスごとの絞り込み条件はデシリアライズ時に適用する
+    detections = deserializeutil.get_deserialize_columns(inferenceresult, get_detection_filter(device_id))
+    logging.info("Deserialized Data: %d detections", len(detections))
+    
+    # 日時は受信時に1度だけエポックミリ秒に変換する(無い場合は現在時刻)
+    if inference.get("T"):
+        inference_epoch_ms = parse_inference_datetime(inference["T"])
+    else:
+        inference_epoch_ms = int(time.time() * 1000)
+
+    data_list = []
+    for class_id, score, left, top, right, bottom in detections.tolist():
+        data = {
+            "device_id": device_id,
+            "C": class_id,
+            "T": inference_epoch_ms,
+            "P": score,
+            "X": left,
+            "Y": top,
+            "x": right,
+            "y": bottom
+        }           
+        data_list.append(data)
+
+    if len(data_list) == 0:
+        # 推論結果が無しのレコードを入れる
+        data = {
+            "device_id": device_id,
+            "C": "",
+            "T": inference_epoch_ms,
+            "P": -1,
+            "X": -1,
+            "Y": -1,
+            "x": -1,
+            "y": -1
+        }           
+        print("No Insert Data: %s", data)
+        data_list.append(data)
+
+    return data_list
+
+# 書き込みスレッドから呼ばれる。キューから取り出した分をまとめて1トランザクションで登録する
+# 変換できなかったフレーム数を返す(/hub/ingest_statsのinvalid_framesに加算される)
+def store_inference_results(batch):
+    data_list = []
+    invalid_frame_count = 0
+    for contentj in batch:
+        records, invalid_count = convert_to_records(contentj)
+        data_list.extend(records)
+        invalid_frame_count += invalid_count
+
+    if data_list:
+        with db_pool.writer() as table_handler:
+            # コミットからキャッシュへの反映までの間に読み出したフレームがキャッシュされないようにする
+            device_ids = {data["device_id"] for data in data_list}
+            latest_frame_cache.begin_write(device_ids)
+            try:
+                table_handler.insert_many(data_list)
+                notify_stored_frames(table_handler, data_list)
+            finally:
+                latest_frame_cache.end_write(device_ids)
+    return invalid_frame_count
+
+# 書き込んだレコードをフレーム(デバイスIDと日時)ごとにまとめ、キャッシュの更新と配信を行う
+def notify_stored_frames(table_handler, data_list):
+    frames = {}
+    for data in data_list:
+        frames.setdefault((data["device_id"], data["T"]), []).append(data)
+
+    for (device_id, inference_epoch_ms), records in frames.items():
+        # SQLiteから取り出した場合と同じ形式にする
+        data_tuples = [(None, data["device_id"], str(data["C"]), data["T"], float(data["P"]),
+                        data["X"], data["Y"], data["x"], data["y"]) for data in records]
+        json_data = table_handler.convert_to_json_multiple(data_tuples)
+        # キャッシュに反映した場合は、同じ日時の推論結果をまとめたframe_id付きのフレームを配信する
+        cached_json_data = latest_frame_cache.put(device_id, inference_epoch_ms, json_data)
+        result_broadcaster.publish(device_id, cached_json_data if cached_json_data is not None else json_data)
+
+# 検出結果の絞り込み条件を置き換える(形式はdetection_filter.jsonと同じ。再起動すると設定ファイルの内容に戻る)
+@app_ins.put("/hub/detection_filters")
+async def put_detection_filters(request: Request):
+    try:
+        set_detection_filters(json.loads(await request.body()))
+    except ValueError as e:
+        return JSONResponse(status_code=status.HTTP_400_BAD_REQUEST, content={"error": str(e)})
+    return {"devices": len(device_detection_filters)}
+
+# 書き込みキューの状態(キューの深さやバッチサイズ)
+@app_ins.get("/hub/ingest_stats")
+def get_ingest_stats():
+    return ingest_queue.get_stats()
+
+# 保存期間の削除処理の状況
+@app_ins.get("/hub/retention_stats")
+def get_retention_stats():
+    if retention_job is None:
+        return {"enabled": False}
+    return {"enabled": True, **retention_job.get_stats()}
+
+# 画像受信の状況(受信中の件数、保存件数、受信速度など)
+@app_ins.get("/hub/image_stats")
+def get_image_stats():
+    stats = {"receiver": image_receiver.get_stats(), "store": image_store.get_stats(), "thumbnail": thumbnail_generator.get_stats()}
+    if image_retention_job is not None:
+        stats["retention"] = image_retention_job.get_stats()
+    return stats
@@ -0,0 +1,222 @@
+import asyncio
+import json
+import time
+import httpx
+from ConsoleWrapperLimited import Utils, IDEMPOTENT_METHODS, TOKEN_DEFAULT_EXPIRES_IN, TOKEN_REFRESH_MARGIN
+
+# 再試行するステータスコード
+RETRY_STATUS_CODES = [429, 500, 502, 503, 504]
+
+# ConsoleRESTAPIの非同期版
+# FastAPIのイベントループを止めないよう、httpxの非同期クライアントでConsoleを呼び出す
+class AsyncConsoleRESTAPI:
+    def __init__(self, baseURL, client_id, client_secret, gcs_okta_domain,
+                 pool_size=10, timeout=30, retries=3, backoff_factor=0.5):
+        # Project information
+
+        self.BASE_URL = baseURL
+        CLIENT_ID = client_id
+        CLIENT_SECRET = client_secret
+        self.GCS_OKTA_DOMAIN = gcs_okta_domain
+        self.AUTHORIZATION_CODE = Utils.Base64EncodedStr(CLIENT_ID + ":" + CLIENT_SECRET)
+
+        # アクセストークンのキャッシュ
+        self.token = None
+        self.token_refresh_at = 0
+        self.token_lock = asyncio.Lock()
+
+        # Keep-Aliveでコネクションを使い回すクライアント
+        self.retries = retries
+        self.backoff_factor = backoff_factor
+        self.client = httpx.AsyncClient(
+            timeout=timeout,
+            limits=httpx.Limits(max_connections=pool_size, max_keepalive_connections=pool_size),
+        )
+
+    async def aclose(self):
+        await self.client.aclose()
+
+    ##########################################################################
+    # Low Level APIs
+    ##########################################################################
+    async def GetToken(self):
+        # 有効期限の少し前まではキャッシュしたトークンを使う
+        token = self.token
+        if token is not None and time.monotonic() < self.token_refresh_at:
+            return token
+
+        # 同時に呼ばれた場合もトークンの取得は1回だけ行い、他は取得結果を使う
+        async with self.token_lock:
+            if self.token is not None and time.monotonic() < self.token_refresh_at:
+                return self.token
+            analysis_info = await self.RequestToken()
+            self.token = analysis_info["access_token"]
+            expires_in = int(analysis_info.get("expires_in", TOKEN_DEFAULT_EXPIRES_IN))
+            self.token_refresh_at = time.monotonic() + max(expires_in - TOKEN_REFRESH_MARGIN, 0)
+            return self.token
+
+    # 失効したトークンを破棄する。既に別のリクエストで取り直している場合は何もしない
+    def InvalidateToken(self, token):
+        if self.token == token:
+            self.token = None
+
+    async def RequestToken(self):
+        headers = {
+            "accept": "application/json",
+            "authorization": "Basic " + self.AUTHORIZATION_CODE,
+            "cache-control": "no-cache",
+            "content-type": "application/x-www-form-urlencoded",
+        }
+
+        data = {
+            "grant_type": "client_credentials",
+            "scope": "system",
+        }
+
+        response = await self.client.post(
+            url=self.GCS_OKTA_DOMAIN,
+            data=data,
+            headers=headers,
+        )
+        analysis_info = json.loads(response.text)
+        return analysis_info
+
+    async def GetHeaders(self, payload):
+        token = await self.GetToken()
+        headers = {"Accept": "application/json", "Authorization": "Bearer " + token}
+        if payload != {}:
+            headers.setdefault("Content-Type", "application/json")
+        return headers
+
+    # 冪等なメソッドのみ、接続エラーや5xxの場合にバックオフしながら再試行する
+    async def Send(self, method, url, headers, params, payload, files):
+        retries = self.retries if method in IDEMPOTENT_METHODS else 0
+        for attempt in range(retries + 1):
+            try:
+                response = await self.client.request(
+                    method=method, url=url, headers=headers, params=params,
+                    content=payload if payload != {} else None, files=files if files != {} else None,
+                )
+            except httpx.TransportError:
+                if attempt == retries:
+                    raise
+            else:
+                if response.status_code not in RETRY_STATUS_CODES or attempt == retries:
+                    return response
+            await asyncio.sleep(self.backoff_factor * (2 ** attempt))
+
+    async def Request(self, url, method, **kwargs):
+        params = {}
+        payload = {}
+        files = {}
+        url = self.BASE_URL + url
+
+        # set parameters
+        for key, val in kwargs.items():
+            if val != None:
+                if key == "payload":
+                    # payload
+                    payload = json.dumps(val)
+                elif key == "files":
+                    # multipart/form-data
+                    files = val
+                else:
+                    # check parameters
+                    if "{" + key + "}" in url:
+                        # path parameter
+                        url = url.replace("{" + key + "}", val)
+                    else:
+                        # query parameter
+                        params.setdefault(key, str(val))
+
+        # create header
+        headers = await self.GetHeaders(payload=payload)
+        # call request
+        response = await self.Send(method, url, headers, params, payload, files)
+        if response.status_code == 401:
+            # トークンが失効していた場合は取り直して1回だけ再試行する
+            self.InvalidateToken(headers["Authorization"][len("Bearer "):])
+            headers = await self.GetHeaders(payload=payload)
+            response = await self.Send(method, url, headers, params, payload, files)
+        try:
+            analysis_info = json.loads(response.text)
+        except Exception as e:
+            return response.text
+        return analysis_info
+
+    # 推論開始
+    async def StartUploadInferenceResult(self, device_id):
+        ret = await self.Request(
+            url="/devices/{device_id}/inferenceresults/collectstart",
+            method="POST",
+            device_id=device_id,
+        )
+        return ret
+
+    # 推論終了
+    async def StoploadInferenceResult(self, device_id):
+        ret = await self.Request(
+            url="/devices/{device_id}/inferenceresults/collectstop",
+            method="POST",
+            device_id=device_id,
+        )
+        return ret
+
+    # プレビューイメージ取得
+    async def GetPreviewImage(self, device_id):
+        ret = await self.Request(
+            url="/devices/{device_id}/images/latest",
+            method="GET",
+            device_id=device_id,
+        )
+        return ret
+
+    # Command Parameterの全てを取得
+    async def GetCommandParameterFiles(self):
+        ret = await self.Request(
+            url="/command_parameter_files",
+            method="GET",
+        )
+        return ret
+
+    # 特定のCommand Parameterを取得。ただしデータはエンコードされているので、結果を得るには、返却されたデータからのデコードが必要
+    async def ExportCommandParameterFiles(self, file_name):
+        ret = await self.Request(
+            url="/command_parameter_files/{file_name}/export",
+            method="GET",
+            file_name=file_name,
+        )
+        return ret
+
+    # 特定のCommand Parameterを更新。parameterはb64エンコードされたjsonを渡すこと
+    async def UpdateCommandParameterFiles(self, file_name, parameter):
+        ret = await self.Request(
+            url=f"/command_parameter_files/{file_name}",
+            method="PATCH",
+            file_name=file_name,
+            payload={
+                "parameter":parameter,
+                "comment":"automation"
+            }
+        )
+
+        return ret
+
+    # カメラのプロビジョニング用QRコード取得
+    async def GetProvisioningQRCode(self, ntp, wifi_ssid, wifi_pass):
+        ret = await self.Request(
+            url="/provisioning/qrcode",
+            method="GET",
+            ntp=ntp,
+            wifi_ssid=wifi_ssid,
+            wifi_pass=wifi_pass
+        )
+        return ret
+
+    # デバイス取得
+    async def GetDevices(self):
+        ret = await self.Request(
+            url="/devices",
+            method="GET",
+        )
+        return ret
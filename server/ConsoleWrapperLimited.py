@@ -1,6 +1,10 @@
 import base64
+import threading
+import time
 import json
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 import cv2
 import numpy as np
 import os
@@ -35,8 +39,17 @@ class Utils:
         return image_rgb
 
 
+# トークンの有効期限が返されなかった場合の有効期間(秒)
+TOKEN_DEFAULT_EXPIRES_IN = 3600
+# 有効期限の何秒前にトークンを取り直すか
+TOKEN_REFRESH_MARGIN = 60
+
+# 再試行してよい冪等なメソッド
+IDEMPOTENT_METHODS = ["GET", "HEAD", "OPTIONS", "PUT", "DELETE"]
+
 class ConsoleRESTAPI:
-    def __init__(self, baseURL, client_id, client_secret, gcs_okta_domain):
+    def __init__(self, baseURL, client_id, client_secret, gcs_okta_domain,
+                 pool_size=10, timeout=30, retries=3, backoff_factor=0.5):
         # Project information
 
         self.BASE_URL = baseURL
@@ -44,11 +57,56 @@ class ConsoleRESTAPI:
         CLIENT_SECRET = client_secret
         self.GCS_OKTA_DOMAIN = gcs_okta_domain
         self.AUTHORIZATION_CODE = Utils.Base64EncodedStr(CLIENT_ID + ":" + CLIENT_SECRET)
+
+        # アクセストークンのキャッシュ
+        self.token = None
+        self.token_refresh_at = 0
+        self.token_lock = threading.Lock()
+
+        # Keep-Aliveでコネクションを使い回すセッション
+        # 冪等なメソッドのみ、接続エラーや5xxの場合にバックオフしながら再試行する
+        self.timeout = timeout
+        self.session = requests.Session()
+        retry = Retry(
+            total=retries,
+            backoff_factor=backoff_factor,
+            status_forcelist=[429, 500, 502, 503, 504],
+            allowed_methods=IDEMPOTENT_METHODS,
+            raise_on_status=False,
+        )
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+    def close(self):
+        self.session.close()
         
     ##########################################################################
     # Low Level APIs
     ##########################################################################
     def GetToken(self):
+        # 有効期限の少し前まではキャッシュしたトークンを使う
+        token = self.token
+        if token is not None and time.monotonic() < self.token_refresh_at:
+            return token
+
+        # 同時に呼ばれた場合もトークンの取得は1回だけ行い、他は取得結果を使う
+        with self.token_lock:
+            if self.token is not None and time.monotonic() < self.token_refresh_at:
+                return self.token
+            analysis_info = self.RequestToken()
+            self.token = analysis_info["access_token"]
+            expires_in = int(analysis_info.get("expires_in", TOKEN_DEFAULT_EXPIRES_IN))
+            self.token_refresh_at = time.monotonic() + max(expires_in - TOKEN_REFRESH_MARGIN, 0)
+            return self.token
+
+    # 失効したトークンを破棄する。既に別のリクエストで取り直している場合は何もしない
+    def InvalidateToken(self, token):
+        with self.token_lock:
+            if self.token == token:
+                self.token = None
+
+    def RequestToken(self):
         headers = {
             "accept": "application/json",
             "authorization": "Basic " + self.AUTHORIZATION_CODE,
@@ -61,14 +119,14 @@ class ConsoleRESTAPI:
             "scope": "system",
         }
 
-        response = requests.post(
+        response = self.session.post(
             url=self.GCS_OKTA_DOMAIN,
             data=data,
             headers=headers,
+            timeout=self.timeout,
         )
         analysis_info = json.loads(response.text)
-        token = analysis_info["access_token"]
-        return token
+        return analysis_info
 
     def GetHeaders(self, payload):
         token = self.GetToken()
@@ -105,9 +163,18 @@ class ConsoleRESTAPI:
         headers = self.GetHeaders(payload=payload)
         # call request
         try:
-            response = requests.request(
-                method=method, url=url, headers=headers, params=params, data=payload, files=files
+            response = self.session.request(
+                method=method, url=url, headers=headers, params=params, data=payload, files=files,
+                timeout=self.timeout,
             )
+            if response.status_code == 401:
+                # トークンが失効していた場合は取り直して1回だけ再試行する
+                self.InvalidateToken(headers["Authorization"][len("Bearer "):])
+                headers = self.GetHeaders(payload=payload)
+                response = self.session.request(
+                    method=method, url=url, headers=headers, params=params, data=payload, files=files,
+                    timeout=self.timeout,
+                )
             analysis_info = json.loads(response.text)
         except Exception as e:
             return response.text
@@ -1,6 +1,10 @@
 
 import base64
+import struct
+from dataclasses import dataclass, fields
+from typing import FrozenSet, Optional
 import flatbuffers
+import numpy as np
 
 
 class ObjectDetectionTop(object):
@@ -178,8 +182,10 @@ class DeserializeUtil:
         Returns:
             ConsoleAccessClient: CosoleAccessClient Class generated from access information.
         """
+        return self.decode_objects(base64.b64decode(serialize_data))
+
+    def decode_objects(self, buf_decode):
         buf = {}
-        buf_decode = base64.b64decode(serialize_data)
         ppl_out = ObjectDetectionTop.GetRootAsObjectDetectionTop(buf_decode, 0)
         obj_data = ppl_out.Perception()
         res_num = obj_data.ObjectDetectionListLength()
@@ -197,4 +203,189 @@ class DeserializeUtil:
                 buf[str(i + 1)]['x'] = bbox_2d.Right()
                 buf[str(i + 1)]['y'] = bbox_2d.Bottom()
 
-        return buf
\ No newline at end of file
+        return buf
+
+    def get_deserialize_columns(self, serialize_data, detection_filter=None):
+        """Decode all detections of ObjectDetectionTop at once into a structured array.
+
+        Instead of walking each GeneralObject through flatbuffers.table.Table,
+        the vtables and fields of every detection are gathered with NumPy in one pass.
+        Detections whose bounding box is not BoundingBox2d are skipped, same as get_deserialize_data.
+
+        Args:
+            serialize_data (str): Base64 encoded ObjectDetectionTop.
+            detection_filter (DetectionFilter): Optional filter. Class id and score are checked
+                before the bounding boxes are read, so rejected detections are never materialized.
+
+        Returns:
+            numpy.ndarray: Structured array of DETECTION_DTYPE (C, P, X, Y, x, y).
+        """
+        buf_decode = base64.b64decode(serialize_data)
+        buf = np.frombuffer(buf_decode, dtype=np.uint8)
+
+        # ObjectDetectionTop -> Perception -> ObjectDetectionList
+        root_pos = struct.unpack_from("<I", buf_decode, 0)[0]
+        data_pos = _indirect_field(buf_decode, root_pos, 0)
+        if data_pos is None:
+            return np.zeros(0, dtype=DETECTION_DTYPE)
+        vector_pos = _indirect_field(buf_decode, data_pos, 0)
+        if vector_pos is None:
+            return np.zeros(0, dtype=DETECTION_DTYPE)
+        res_num = struct.unpack_from("<I", buf_decode, vector_pos)[0]
+        if res_num == 0:
+            return np.zeros(0, dtype=DETECTION_DTYPE)
+        if res_num < MIN_VECTORIZED_DETECTIONS:
+            # 検出数が少ない場合はNumPyでまとめて読む準備の方が重いため、1件ずつ読む
+            detections = np.array([tuple(value[name] for name in DETECTION_DTYPE.names)
+                                   for value in self.decode_objects(buf_decode).values()], dtype=DETECTION_DTYPE)
+            if detection_filter is not None:
+                detections = detection_filter.limit(detections[detection_filter.accepts(detections["C"], detections["P"])])
+            return detections
+
+        # GeneralObject
+        element_pos = vector_pos + 4 + 4 * np.arange(res_num, dtype=np.int64)
+        object_pos = element_pos + _gather(buf, element_pos, "<u4")
+        object_offsets = _vtable_offsets(buf, object_pos, 4)
+        bbox_type = _gather_field(buf, object_pos, object_offsets[:, 1], "<u1", 0)
+        is_bbox_2d = (bbox_type == BoundingBox.BoundingBox2d) & (object_offsets[:, 2] != 0)
+        object_pos = object_pos[is_bbox_2d]
+        object_offsets = object_offsets[is_bbox_2d]
+
+        class_ids = _gather_field(buf, object_pos, object_offsets[:, 0], "<u4", 0)
+        scores = _gather_field(buf, object_pos, object_offsets[:, 3], "<f4", 0.0)
+        if detection_filter is not None:
+            # クラスIDとスコアで先に絞り込み、対象外のバウンディングボックスは読まない
+            keep = detection_filter.accepts(class_ids, scores)
+            object_pos = object_pos[keep]
+            object_offsets = object_offsets[keep]
+            class_ids = class_ids[keep]
+            scores = scores[keep]
+
+        # BoundingBox2d
+        union_pos = object_pos + object_offsets[:, 2]
+        bbox_pos = union_pos + _gather(buf, union_pos, "<u4")
+        bbox_offsets = _vtable_offsets(buf, bbox_pos, 4)
+
+        detections = np.zeros(len(object_pos), dtype=DETECTION_DTYPE)
+        detections["C"] = class_ids
+        detections["P"] = scores
+        detections["X"] = _gather_field(buf, bbox_pos, bbox_offsets[:, 0], "<i4", 0)
+        detections["Y"] = _gather_field(buf, bbox_pos, bbox_offsets[:, 1], "<i4", 0)
+        detections["x"] = _gather_field(buf, bbox_pos, bbox_offsets[:, 2], "<i4", 0)
+        detections["y"] = _gather_field(buf, bbox_pos, bbox_offsets[:, 3], "<i4", 0)
+        if detection_filter is not None:
+            detections = detection_filter.limit(detections)
+        return detections
+
+# 検出結果の絞り込み条件
+@dataclass
+class DetectionFilter:
+    # 対象とするクラスID(Noneの場合は全て)
+    class_ids: Optional[FrozenSet[int]] = None
+    # スコアの下限
+    min_score: float = 0.0
+    # 1フレームあたりの最大件数(スコアの高い順に残す。Noneの場合は無制限)
+    max_detections: Optional[int] = None
+    # バウンディングボックスの面積の下限
+    min_box_area: int = 0
+
+    # 設定ファイル等の値から作る。クラスIDや件数は文字列("0"など)でも数値に変換し、不正な値の場合はValueErrorを送出する
+    @classmethod
+    def from_dict(cls, data):
+        if not isinstance(data, dict):
+            raise ValueError("Detection filter must be an object: %r" % (data,))
+        unknown_keys = set(data) - {field.name for field in fields(cls)}
+        if unknown_keys:
+            raise ValueError("Unknown detection filter keys: " + ", ".join(sorted(unknown_keys)))
+        try:
+            class_ids = data.get("class_ids")
+            if class_ids is not None:
+                if not isinstance(class_ids, list):
+                    raise ValueError("class_ids must be a list")
+                class_ids = frozenset(int(class_id) for class_id in class_ids)
+            max_detections = data.get("max_detections")
+            if max_detections is not None:
+                max_detections = int(max_detections)
+            detection_filter = cls(
+                class_ids=class_ids,
+                min_score=float(data.get("min_score", 0.0)),
+                max_detections=max_detections,
+                min_box_area=int(data.get("min_box_area", 0)),
+            )
+        except (TypeError, ValueError) as e:
+            raise ValueError("Invalid detection filter %r: %s" % (data, e))
+        # クラスIDはuint32
+        if class_ids is not None and any(class_id < 0 or class_id > 0xFFFFFFFF for class_id in class_ids):
+            raise ValueError("class_ids must be between 0 and 4294967295: %r" % (data,))
+        if (max_detections is not None and max_detections < 0) or detection_filter.min_box_area < 0:
+            raise ValueError("max_detections and min_box_area must not be negative: %r" % (data,))
+        return detection_filter
+
+    # クラスIDとスコアの条件
+    def accepts(self, class_ids, scores):
+        # 従来の判定(Pythonのfloatでの比較)と結果を合わせるため、float64で比較する
+        keep = scores.astype(np.float64) >= self.min_score
+        if self.class_ids is not None:
+            keep &= np.isin(class_ids, list(self.class_ids))
+        return keep
+
+    # 面積と件数の条件
+    def limit(self, detections):
+        if self.min_box_area > 0:
+            area = (detections["x"].astype(np.int64) - detections["X"]) * (detections["y"].astype(np.int64) - detections["Y"])
+            detections = detections[area >= self.min_box_area]
+        if self.max_detections is not None and len(detections) > self.max_detections:
+            # スコアの高いものを残し、並び順は元のままにする
+            top = np.sort(np.argsort(-detections["P"], kind="stable")[:self.max_detections])
+            detections = detections[top]
+        return detections
+
+# これより検出数が少ないフレームはget_deserialize_columnsでも1件ずつ読む(bench/bench_deserialize.pyで計測した分岐点)
+MIN_VECTORIZED_DETECTIONS = 5
+
+# get_deserialize_columnsの戻り値の型(クラスID, スコア, Left, Top, Right, Bottom)
+DETECTION_DTYPE = np.dtype([
+    ("C", "<u4"),
+    ("P", "<f4"),
+    ("X", "<i4"),
+    ("Y", "<i4"),
+    ("x", "<i4"),
+    ("y", "<i4"),
+])
+
+# テーブルのfield_index番目のフィールドが指す先(テーブルやベクター)の位置。フィールドが無い場合はNone
+def _indirect_field(buf_decode, table_pos, field_index):
+    vtable_pos = table_pos - struct.unpack_from("<i", buf_decode, table_pos)[0]
+    vtable_size = struct.unpack_from("<H", buf_decode, vtable_pos)[0]
+    voffset = 4 + 2 * field_index
+    if voffset >= vtable_size:
+        return None
+    offset = struct.unpack_from("<H", buf_decode, vtable_pos + voffset)[0]
+    if offset == 0:
+        return None
+    field_pos = table_pos + offset
+    return field_pos + struct.unpack_from("<I", buf_decode, field_pos)[0]
+
+# 各位置からdtypeの値をまとめて読み出す(アラインメントされていない位置でも読める)
+def _gather(buf, positions, dtype):
+    dtype = np.dtype(dtype)
+    index = positions[:, None] + np.arange(dtype.itemsize)
+    return buf[index].view(dtype).reshape(-1).astype(np.int64 if dtype.kind in "iu" else dtype)
+
+# 各テーブルのvtableを1度だけ読み、先頭field_count個のフィールドのオフセットを返す(無いフィールドは0)
+def _vtable_offsets(buf, table_pos, field_count):
+    vtable_pos = table_pos - _gather(buf, table_pos, "<i4")
+    vtable_size = _gather(buf, vtable_pos, "<u2")
+    offsets = np.zeros((len(table_pos), field_count), dtype=np.int64)
+    for field_index in range(field_count):
+        voffset = 4 + 2 * field_index
+        has_field = voffset < vtable_size
+        offsets[has_field, field_index] = _gather(buf, vtable_pos[has_field] + voffset, "<u2")
+    return offsets
+
+# オフセットが0(フィールド無し)の場合はdefaultを返す
+def _gather_field(buf, table_pos, offsets, dtype, default):
+    values = np.full(len(table_pos), default, dtype=np.dtype(dtype).newbyteorder("="))
+    has_field = offsets != 0
+    values[has_field] = _gather(buf, table_pos[has_field] + offsets[has_field], dtype)
+    return values
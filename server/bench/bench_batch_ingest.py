@@ -0,0 +1,50 @@
+import json
+import logging
+import os
+import random
+import sys
+import time
+from bench_data import make_work_dir, server_dir
+sys.path.insert(0, os.path.join(server_dir, "tests"))
+from payloads import make_object_detection_payload
+from fastapi.testclient import TestClient
+
+# /meta/{filename}で受信してSQLiteに登録し終えるまでのフレーム数/秒を、1回の送信に含めるフレーム数ごとに比べる
+# python bench/bench_batch_ingest.py [フレーム数]
+
+def make_meta(device_id, first_epoch_ms, frame_count, rng):
+    inferences = []
+    for frame in range(frame_count):
+        epoch_ms = first_epoch_ms + frame * 100
+        detections = [(rng.randint(0, 1), 0.5 + rng.random() / 2, 10, 10, 60, 60) for _ in range(5)]
+        inferences.append({"T": time.strftime("%Y%m%d%H%M%S", time.gmtime(epoch_ms // 1000)) + "%03d" % (epoch_ms % 1000),
+                           "O": make_object_detection_payload(detections)})
+    return json.dumps({"DeviceID": device_id, "ModelID": "bench", "Image": False, "Inferences": inferences})
+
+if __name__ == "__main__":
+    total_frames = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    make_work_dir()
+    import AITRIOS_Hub
+    logging.disable(logging.INFO)
+    rng = random.Random(0)
+    with TestClient(AITRIOS_Hub.app_ins) as client:
+        print("frames/upload  uploads  frames/s  stored frames")
+        first_epoch_ms = 1737000000000
+        for frames_per_upload in (1, 10, 50):
+            upload_count = total_frames // frames_per_upload
+            device_id = "batch%d" % frames_per_upload
+            bodies = [make_meta(device_id, first_epoch_ms + upload * frames_per_upload * 100, frames_per_upload, rng)
+                      for upload in range(upload_count)]
+            stored_before = AITRIOS_Hub.ingest_queue.get_stats()["stored"]
+            start_time = time.perf_counter()
+            for upload, body in enumerate(bodies):
+                response = client.put("/meta/%d.txt" % upload, content=body)
+                assert response.status_code == 200, response.text
+            while AITRIOS_Hub.ingest_queue.get_stats()["stored"] < stored_before + upload_count:
+                time.sleep(0.001)
+            duration = time.perf_counter() - start_time
+            with AITRIOS_Hub.db_pool.reader() as table_handler:
+                stored_frames = table_handler.dbhandler.connection.execute(
+                    "SELECT COUNT(DISTINCT inference_epoch_ms) FROM t_inference_result WHERE device_id = ?", (device_id,)
+                ).fetchone()[0]
+            print("%13d  %7d  %8.0f  %13d" % (frames_per_upload, upload_count, upload_count * frames_per_upload / duration, stored_frames))
@@ -0,0 +1,102 @@
+import asyncio
+import json
+import os
+import ssl
+import subprocess
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import requests
+from bench_data import make_work_dir
+from ConsoleWrapperLimited import ConsoleRESTAPI
+from ConsoleWrapperAsync import AsyncConsoleRESTAPI
+
+# Console APIの呼び出しを、呼び出しごとにトークンを取得して新しい接続で送る場合(従来)と
+# トークンをキャッシュし、Keep-Aliveの接続を使い回す場合(ConsoleRESTAPI/AsyncConsoleRESTAPI)で比べる
+# ローカルに立てた代役のサーバーを使う。--httpsを指定するとopensslで自己署名証明書を作り、TLSで接続する
+# python bench/bench_console_pool.py [--https] [呼び出し回数]
+
+class StandInConsole(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    # ヘッダーと本文を別々に書き込むため、Nagleアルゴリズムによる遅延を避ける
+    disable_nagle_algorithm = True
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        if self.path == "/token":
+            self.reply({"access_token": "token", "expires_in": 3600})
+        else:
+            self.reply({"result": "SUCCESS"})
+
+    def do_GET(self):
+        self.reply({"devices": []})
+
+    def reply(self, body):
+        data = json.dumps(body).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass
+
+def start_server(use_https):
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StandInConsole)
+    scheme = "http"
+    if use_https:
+        subprocess.run(["openssl", "req", "-x509", "-newkey", "rsa:2048", "-nodes", "-days", "1",
+                        "-keyout", "key.pem", "-out", "cert.pem", "-subj", "/CN=127.0.0.1",
+                        "-addext", "subjectAltName=IP:127.0.0.1"], check=True, capture_output=True)
+        context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+        context.load_cert_chain("cert.pem", "key.pem")
+        server.socket = context.wrap_socket(server.socket, server_side=True)
+        # requestsとhttpxがこの証明書を信頼するようにする
+        os.environ["REQUESTS_CA_BUNDLE"] = os.environ["SSL_CERT_FILE"] = os.path.abspath("cert.pem")
+        scheme = "https"
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, "%s://127.0.0.1:%d" % (scheme, server.server_port)
+
+# 従来の処理: 呼び出しごとにトークンを取得し、接続を使い回さない
+def get_devices_per_call(base_url):
+    token = requests.post(base_url + "/token", data={"grant_type": "client_credentials", "scope": "system"}).json()["access_token"]
+    return requests.get(base_url + "/api/devices", headers={"Authorization": "Bearer " + token}).json()
+
+async def measure_async(base_url, call_count):
+    api = AsyncConsoleRESTAPI(base_url + "/api", "id", "secret", base_url + "/token")
+    start_time = time.perf_counter()
+    for _ in range(call_count):
+        await api.GetDevices()
+    duration = time.perf_counter() - start_time
+    await api.aclose()
+    return call_count / duration
+
+if __name__ == "__main__":
+    use_https = "--https" in sys.argv
+    arguments = [argument for argument in sys.argv[1:] if argument != "--https"]
+    call_count = int(arguments[0]) if arguments else 300
+    for name in ("HTTP_PROXY", "HTTPS_PROXY", "ALL_PROXY", "http_proxy", "https_proxy", "all_proxy"):
+        os.environ.pop(name, None)
+    make_work_dir()
+    server, base_url = start_server(use_https)
+
+    start_time = time.perf_counter()
+    for _ in range(call_count):
+        get_devices_per_call(base_url)
+    per_call_rate = call_count / (time.perf_counter() - start_time)
+
+    api = ConsoleRESTAPI(base_url + "/api", "id", "secret", base_url + "/token")
+    start_time = time.perf_counter()
+    for _ in range(call_count):
+        api.GetDevices()
+    session_rate = call_count / (time.perf_counter() - start_time)
+    api.close()
+
+    print("%s, %d calls" % (base_url.split(":")[0], call_count))
+    print("per call (token + new connection): %7.0f calls/s" % per_call_rate)
+    print("ConsoleRESTAPI (sequential):       %7.0f calls/s  %5.1fx" % (session_rate, session_rate / per_call_rate))
+    async_rate = asyncio.run(measure_async(base_url, call_count))
+    print("AsyncConsoleRESTAPI (sequential):  %7.0f calls/s  %5.1fx" % (async_rate, async_rate / per_call_rate))
+    server.shutdown()
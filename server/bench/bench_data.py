@@ -0,0 +1,59 @@
+import atexit
+import os
+import random
+import shutil
+import sys
+import tempfile
+
+# serverディレクトリのモジュールをモジュール名のみでimportする
+server_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, server_dir)
+from AITRIOSLocalDBHandler import AITRIOSLocalDBPool, STORAGE_LAYOUT_ROW
+
+# ベンチマーク用のDBを置く一時ディレクトリ(実行中はカレントディレクトリにし、終了時に削除する)
+def make_work_dir():
+    original_dir = os.getcwd()
+    work_dir = tempfile.mkdtemp(prefix="aitrios_bench_")
+    os.chdir(work_dir)
+
+    def remove_work_dir():
+        os.chdir(original_dir)
+        shutil.rmtree(work_dir, ignore_errors=True)
+    atexit.register(remove_work_dir)
+    return work_dir
+
+# convert_frame_to_recordsと同じ形の1フレーム分のレコード
+def make_frame_records(device_id, inference_epoch_ms, detection_count, rng=random):
+    data_list = []
+    for _ in range(detection_count):
+        left, top = rng.randint(0, 640), rng.randint(0, 480)
+        data_list.append({
+            "device_id": device_id,
+            "C": rng.randint(0, 3),
+            "T": inference_epoch_ms,
+            "P": rng.random(),
+            "X": left,
+            "Y": top,
+            "x": left + rng.randint(1, 100),
+            "y": top + rng.randint(1, 100),
+        })
+    if not data_list:
+        data_list.append({"device_id": device_id, "C": "", "T": inference_epoch_ms, "P": -1, "X": -1, "Y": -1, "x": -1, "y": -1})
+    return data_list
+
+# device_count台 x frame_count フレーム(1秒間隔) x detection_count件 を登録したDBを作る
+def make_pool(db_file_name, device_count, frame_count, detection_count, storage_layout=STORAGE_LAYOUT_ROW,
+              reader_count=4, start_epoch_ms=1737000000000, frames_per_transaction=1000):
+    rng = random.Random(0)
+    pool = AITRIOSLocalDBPool(db_file_name, reader_count=reader_count, storage_layout=storage_layout)
+    for first_frame in range(0, frame_count, frames_per_transaction):
+        data_list = []
+        for frame in range(first_frame, min(first_frame + frames_per_transaction, frame_count)):
+            for device in range(device_count):
+                data_list.extend(make_frame_records("device%03d" % device, start_epoch_ms + frame * 1000, detection_count, rng))
+        with pool.writer() as table_handler:
+            table_handler.insert_many(data_list)
+    return pool
+
+def device_ids(device_count):
+    return ["device%03d" % device for device in range(device_count)]
@@ -0,0 +1,103 @@
+import asyncio
+import os
+import subprocess
+import sys
+import time
+import httpx
+from bench_data import make_work_dir, make_pool, device_ids
+from AITRIOSLocalDBHandler import DB_FILE_NAME
+
+# 最新フレームの取得(GET /{device_id}/inference_result)のHTTPのリクエスト数/秒を、
+# リクエストごとにSQLiteへ接続する場合(従来: connect)、コネクションプールから借りる場合(pool)、
+# 最新フレームのキャッシュから返す場合(cache: 現在の/{device_id}/inference_result)で比べる
+# connectとpoolはキャッシュを通さずに毎回SQLiteから読み出すベンチマーク用のルートを追加して測る
+# サーバーは別プロセスで起動する
+# python bench/bench_db_pool.py [デバイス数] [1デバイスあたりのフレーム数]
+
+PORT = 8798
+# 同時に送るリクエスト数
+CONCURRENCIES = (1, 8, 32)
+# 1回の計測で送るリクエスト数
+REQUEST_COUNT = 2000
+PATHS = {
+    "connect": "/bench/connect/%s/inference_result",
+    "pool": "/bench/pool/%s/inference_result",
+    "cache": "/%s/inference_result",
+}
+
+def serve():
+    import logging
+    import orjson
+    import uvicorn
+    from fastapi import Depends, Response
+    import AITRIOS_Hub
+    from AITRIOSLocalDBHandler import AITRIOSLocalDBPool, InferenceResultTableHandler
+    logging.disable(logging.INFO)
+
+    # 従来の処理: 接続し、テーブル作成(マイグレーション確認)をしてから読み出し、切断する
+    @AITRIOS_Hub.app_ins.get("/bench/connect/{device_id}/inference_result")
+    def get_inference_result_connect(device_id: str):
+        table_handler = InferenceResultTableHandler()
+        try:
+            record = table_handler.fetch_latestdate_by_device_id(device_id)
+            return Response(orjson.dumps(table_handler.convert_to_json_multiple(record)), media_type="application/json")
+        finally:
+            table_handler.close()
+
+    @AITRIOS_Hub.app_ins.get("/bench/pool/{device_id}/inference_result")
+    def get_inference_result_pool(device_id: str, db_pool: AITRIOSLocalDBPool = Depends(AITRIOS_Hub.get_db_pool)):
+        with db_pool.reader() as table_handler:
+            record = table_handler.fetch_latestdate_by_device_id(device_id)
+            return Response(orjson.dumps(table_handler.convert_to_json_multiple(record)), media_type="application/json")
+
+    uvicorn.run(AITRIOS_Hub.app_ins, host="127.0.0.1", port=PORT, log_level="error")
+
+async def measure(client, path, targets, concurrency):
+    queue = list(reversed(targets))
+
+    async def worker():
+        while queue:
+            response = await client.get(path % queue.pop())
+            assert response.status_code == 200
+
+    start_time = time.perf_counter()
+    await asyncio.gather(*[worker() for _ in range(concurrency)])
+    return len(targets) / (time.perf_counter() - start_time)
+
+async def run_loads(device_count):
+    targets = (device_ids(device_count) * (REQUEST_COUNT // device_count + 1))[:REQUEST_COUNT]
+    async with httpx.AsyncClient(trust_env=False, base_url="http://127.0.0.1:%d" % PORT, timeout=60,
+                                 limits=httpx.Limits(max_connections=max(CONCURRENCIES))) as client:
+        # キャッシュに全デバイスを載せ、接続を張っておく
+        for path in PATHS.values():
+            await measure(client, path, device_ids(device_count), max(CONCURRENCIES))
+        print("concurrency  connect(req/s)  pool(req/s)  cache(req/s)  pool/connect")
+        for concurrency in CONCURRENCIES:
+            rates = {name: await measure(client, path, targets, concurrency) for name, path in PATHS.items()}
+            print("%11d  %14.0f  %11.0f  %12.0f  %11.1fx" % (concurrency, rates["connect"], rates["pool"], rates["cache"],
+                                                             rates["pool"] / rates["connect"]))
+
+def wait_for_server():
+    while True:
+        try:
+            httpx.get("http://127.0.0.1:%d/hub/ingest_stats" % PORT, trust_env=False)
+            return
+        except httpx.TransportError:
+            time.sleep(0.1)
+
+if __name__ == "__main__":
+    if sys.argv[1:2] == ["--serve"]:
+        serve()
+        sys.exit()
+    device_count = int(sys.argv[1]) if len(sys.argv) > 1 else 100
+    frame_count = int(sys.argv[2]) if len(sys.argv) > 2 else 1000
+    make_work_dir()
+    make_pool(DB_FILE_NAME, device_count, frame_count, 3).close()
+    print("%d devices x %d frames x 3 detections" % (device_count, frame_count))
+    server = subprocess.Popen([sys.executable, os.path.abspath(__file__), "--serve"])
+    try:
+        wait_for_server()
+        asyncio.run(run_loads(device_count))
+    finally:
+        server.terminate()
+        server.wait()
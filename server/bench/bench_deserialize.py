@@ -0,0 +1,27 @@
+import os
+import random
+import sys
+import timeit
+
+# serverディレクトリのモジュールとテスト用のペイロード作成をモジュール名のみでimportする
+server_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, server_dir)
+sys.path.insert(0, os.path.join(server_dir, "tests"))
+from Desilialize import DeserializeUtil, DetectionFilter
+from payloads import make_object_detection_payload, make_random_detections
+
+# 1フレームのデコード時間(従来のget_deserialize_data、get_deserialize_columns、絞り込みあり)を検出数ごとに比べる
+if __name__ == "__main__":
+    rng = random.Random(0)
+    deserializeutil = DeserializeUtil()
+    detection_filter = DetectionFilter(class_ids=frozenset([0, 1]), min_score=0.5)
+    print("boxes  objects(us)  columns(us)  filtered(us)  speedup")
+    for count in (1, 10, 50, 200):
+        payload = make_object_detection_payload(make_random_detections(rng, count))
+        number = max(10, 20000 // count)
+        results = []
+        for decode in (lambda: deserializeutil.get_deserialize_data(payload),
+                       lambda: deserializeutil.get_deserialize_columns(payload),
+                       lambda: deserializeutil.get_deserialize_columns(payload, detection_filter)):
+            results.append(min(timeit.repeat(decode, number=number, repeat=5)) / number * 1e6)
+        print("%5d  %11.1f  %11.1f  %12.1f  %6.1fx" % (count, results[0], results[1], results[2], results[0] / results[1]))
@@ -0,0 +1,30 @@
+import os
+import sys
+from bench_data import make_work_dir, make_pool
+from AITRIOSExport import InferenceExporter, EXPORT_FORMATS
+from AITRIOSLocalDBHandler import STORAGE_LAYOUT_ROW
+
+# 形式(parquet/arrow/csv)ごとの書き出し速度とファイルサイズを比べる(pyarrowが無い場合はcsvのみ)
+# python bench/bench_export.py [レコード数(既定値200000)] [row|frame]
+
+DEVICE_COUNT = 10
+DETECTION_COUNT = 5
+
+if __name__ == "__main__":
+    row_count = int(sys.argv[1]) if len(sys.argv) > 1 else 200000
+    storage_layout = sys.argv[2] if len(sys.argv) > 2 else STORAGE_LAYOUT_ROW
+    make_work_dir()
+    pool = make_pool("bench.db", DEVICE_COUNT, row_count // (DEVICE_COUNT * DETECTION_COUNT), DETECTION_COUNT, storage_layout)
+    exporter = InferenceExporter(pool)
+    print("%s layout, %d rows" % (storage_layout, row_count))
+    print("format   rows/s  size(MB)")
+    for export_format in EXPORT_FORMATS:
+        output = "export" + EXPORT_FORMATS[export_format][0]
+        try:
+            result = exporter.export(output, export_format, 0, 2 ** 62)
+        except ValueError as e:
+            # pyarrowが無い場合
+            print("%-7s  %s" % (export_format, e))
+            continue
+        print("%-7s  %6.0f  %8.1f" % (export_format, result["rows_per_sec"], os.path.getsize(output) / 1024 / 1024))
+    pool.close()
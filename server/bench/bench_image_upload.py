@@ -0,0 +1,94 @@
+import asyncio
+import os
+import subprocess
+import sys
+import time
+import httpx
+from bench_data import make_work_dir
+
+# 画像の同時受信時のスループット、イベントループの応答(/hub/image_statsの応答時間)、サーバーの最大メモリ使用量を
+# 受信データを少しずつ一時ファイルに書き込む場合(stream: /image/{filename})と
+# 全体をメモリに載せてからイベントループ上で書き込む場合(buffered: 従来の処理)で比べる
+# サーバーは別プロセスで起動する。最大メモリ使用量はLinuxのみ表示する
+# python bench/bench_image_upload.py [stream|buffered]
+
+PORT = 8799
+# (同時アップロード数, 1ファイルのサイズ(MB))
+LOADS = [(8, 1), (8, 5), (32, 1), (32, 5), (64, 5)]
+
+def serve(mode):
+    import logging
+    import uvicorn
+    from fastapi import Request
+    import AITRIOS_Hub
+    logging.disable(logging.INFO)
+    if mode == "buffered":
+        # 従来の処理: 受信データ全体を読み込んでから、イベントループ上で書き込む
+        @AITRIOS_Hub.app_ins.put("/bench/image/{filename}")
+        async def update_image_buffered(filename, request: Request):
+            content = await request.body()
+            os.makedirs("./image", exist_ok=True)
+            with open(os.path.join("./image", filename), "wb") as w_fp:
+                w_fp.write(content)
+            return {"status": 200}
+    uvicorn.run(AITRIOS_Hub.app_ins, host="127.0.0.1", port=PORT, log_level="error")
+
+def peak_rss_mb(pid):
+    try:
+        with open("/proc/%d/status" % pid) as r_fp:
+            for line in r_fp:
+                if line.startswith("VmHWM"):
+                    return "%d" % (int(line.split()[1]) // 1024)
+    except OSError:
+        pass
+    return "-"
+
+async def run_loads(mode, pid):
+    upload_path = "/bench/image/" if mode == "buffered" else "/image/"
+    async with httpx.AsyncClient(trust_env=False, base_url="http://127.0.0.1:%d" % PORT, timeout=120,
+                                 limits=httpx.Limits(max_connections=200)) as client:
+        print("%s: uploads x MB  seconds  MB/s  ping max(ms)  server peak RSS(MB)" % mode)
+        for upload_count, size_mb in LOADS:
+            data = os.urandom(size_mb * 1024 * 1024)
+            latencies = []
+            stopped = asyncio.Event()
+
+            # 受信中にイベントループが応答できるかを10ms間隔で確認する
+            async def ping():
+                while not stopped.is_set():
+                    start_time = time.perf_counter()
+                    await client.get("/hub/image_stats")
+                    latencies.append(time.perf_counter() - start_time)
+                    await asyncio.sleep(0.01)
+            ping_task = asyncio.create_task(ping())
+            start_time = time.perf_counter()
+            responses = await asyncio.gather(*[client.put("%s%d.jpg" % (upload_path, upload), content=data)
+                                               for upload in range(upload_count)])
+            duration = time.perf_counter() - start_time
+            stopped.set()
+            await ping_task
+            assert all(response.status_code == 200 for response in responses)
+            print("%13d x %d  %7.2f  %4.0f  %12.0f  %19s" % (upload_count, size_mb, duration, upload_count * size_mb / duration,
+                                                        max(latencies) * 1000, peak_rss_mb(pid)))
+
+def wait_for_server():
+    while True:
+        try:
+            httpx.get("http://127.0.0.1:%d/hub/image_stats" % PORT, trust_env=False)
+            return
+        except httpx.TransportError:
+            time.sleep(0.1)
+
+if __name__ == "__main__":
+    if sys.argv[1:2] == ["--serve"]:
+        serve(sys.argv[2])
+        sys.exit()
+    mode = sys.argv[1] if len(sys.argv) > 1 else "stream"
+    make_work_dir()
+    server = subprocess.Popen([sys.executable, os.path.abspath(__file__), "--serve", mode])
+    try:
+        wait_for_server()
+        asyncio.run(run_loads(mode, server.pid))
+    finally:
+        server.terminate()
+        server.wait()
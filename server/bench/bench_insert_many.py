@@ -0,0 +1,40 @@
+import random
+import time
+from bench_data import make_work_dir, make_frame_records
+from AITRIOSLocalDBHandler import AITRIOSLocalDBPool
+
+# 1フレーム分の登録を、1件ずつINSERTしてコミットする場合(従来)とinsert_manyで1トランザクションにまとめる場合で比べる
+# insert_manyは集計(t_inference_rollup)の更新も含むため、executemanyのみの場合も合わせて計測する
+
+def measure(pool, insert, detection_count, frame_count=300):
+    rng = random.Random(0)
+    frames = [make_frame_records("device000", 1737000000000 + frame * 1000, detection_count, rng) for frame in range(frame_count)]
+    start_time = time.perf_counter()
+    with pool.writer() as table_handler:
+        for data_list in frames:
+            insert(table_handler, data_list)
+    return frame_count / (time.perf_counter() - start_time)
+
+def insert_each(table_handler, data_list):
+    for data in data_list:
+        table_handler.insert_data(data)
+
+def insert_many(table_handler, data_list):
+    table_handler.insert_many(data_list)
+
+def executemany_only(table_handler, data_list):
+    with table_handler.dbhandler.connection:
+        table_handler.dbhandler.cursor.executemany(
+            "INSERT INTO t_inference_result  (device_id, class_id, inference_epoch_ms , inference_percentage, x1, y1, x2, y2) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            [(data["device_id"], data["C"], data["T"], data["P"], data["X"], data["Y"], data["x"], data["y"]) for data in data_list])
+
+if __name__ == "__main__":
+    make_work_dir()
+    pool = AITRIOSLocalDBPool("bench.db", reader_count=1)
+    print("detections  each(frames/s)  executemany(frames/s)  insert_many(frames/s)")
+    for detection_count in (1, 10, 100):
+        each_rate = measure(pool, insert_each, detection_count)
+        executemany_rate = measure(pool, executemany_only, detection_count)
+        many_rate = measure(pool, insert_many, detection_count)
+        print("%10d  %14.0f  %21.0f  %21.0f" % (detection_count, each_rate, executemany_rate, many_rate))
+    pool.close()
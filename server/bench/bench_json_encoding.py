@@ -0,0 +1,33 @@
+import timeit
+import orjson
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+from bench_data import make_work_dir, make_pool
+from AITRIOSLocalDBHandler import LatestFrameCache
+
+# 最新フレームの応答のエンコード時間を、FastAPIの既定(jsonable_encoder + JSONResponse)、orjson、
+# LatestFrameCacheのエンコード済みのバイト列を使う場合で比べる
+
+def load_frame(pool):
+    with pool.reader() as table_handler:
+        records = table_handler.fetch_latestdate_by_device_id("device000")
+        return LatestFrameCache.with_frame_id(records[0][3], table_handler.convert_to_json_multiple(records))
+
+if __name__ == "__main__":
+    make_work_dir()
+    print("detections  jsonable_encoder+JSONResponse(us)  orjson(us)  cached(us)")
+    for detection_count in (1, 10, 100):
+        pool = make_pool("bench%d.db" % detection_count, 1, 1, detection_count, reader_count=1)
+        frame = load_frame(pool)
+        pool.close()
+        cache = LatestFrameCache()
+        cache.put("device", 0, frame)
+        cache.get_encoded("device", orjson.dumps)
+        assert orjson.loads(orjson.dumps(frame)) == orjson.loads(JSONResponse(jsonable_encoder(frame)).body)
+        results = []
+        for encode in (lambda: JSONResponse(jsonable_encoder(frame)).body,
+                       lambda: orjson.dumps(frame),
+                       lambda: cache.get_encoded("device", orjson.dumps)):
+            number = 20000 // detection_count
+            results.append(min(timeit.repeat(encode, number=number, repeat=5)) / number * 1e6)
+        print("%10d  %33.1f  %10.1f  %10.2f" % (detection_count, results[0], results[1], results[2]))
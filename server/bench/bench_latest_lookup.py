@@ -0,0 +1,47 @@
+import sqlite3
+import sys
+import time
+from bench_data import make_work_dir, make_pool, device_ids
+
+# デバイスごとの最新フレームの検索を、(device_id, inference_epoch_ms)のインデックスがある場合と無い場合で比べる
+# python bench/bench_latest_lookup.py [レコード数(既定値1000000)]
+
+DB_FILE_NAME = "bench.db"
+DEVICE_COUNT = 10
+DETECTION_COUNT = 3
+
+def measure(pool, targets):
+    start_time = time.perf_counter()
+    with pool.reader() as table_handler:
+        for device_id in targets:
+            table_handler.fetch_latestdate_by_device_id(device_id)
+    return (time.perf_counter() - start_time) / len(targets) * 1000
+
+# 最大値を求めるサブクエリの実行計画(コネクションのステートメントキャッシュの影響を受けないよう、都度接続する)
+def query_plan():
+    connection = sqlite3.connect(DB_FILE_NAME)
+    try:
+        plan = connection.execute(
+            "EXPLAIN QUERY PLAN SELECT MAX(inference_epoch_ms) FROM t_inference_result WHERE device_id = ?", ("device000",)
+        ).fetchall()
+    finally:
+        connection.close()
+    return plan[-1][-1]
+
+if __name__ == "__main__":
+    row_count = int(sys.argv[1]) if len(sys.argv) > 1 else 1000000
+    make_work_dir()
+    frame_count = row_count // (DEVICE_COUNT * DETECTION_COUNT)
+    pool = make_pool(DB_FILE_NAME, DEVICE_COUNT, frame_count, DETECTION_COUNT, reader_count=1)
+    print("%d rows (%d devices x %d frames x %d detections)" % (DEVICE_COUNT * frame_count * DETECTION_COUNT,
+                                                                 DEVICE_COUNT, frame_count, DETECTION_COUNT))
+    indexed_plan = query_plan()
+    indexed_ms = measure(pool, device_ids(DEVICE_COUNT) * 100)
+    with pool.writer() as table_handler:
+        table_handler.dbhandler.connection.execute("DROP INDEX idx_inference_result_device_epoch")
+    scan_plan = query_plan()
+    scan_ms = measure(pool, device_ids(DEVICE_COUNT))
+    print("with index:    %8.3f ms/lookup  (%s)" % (indexed_ms, indexed_plan))
+    print("without index: %8.3f ms/lookup  (%s)" % (scan_ms, scan_plan))
+    print("speedup: %.0fx" % (scan_ms / indexed_ms))
+    pool.close()
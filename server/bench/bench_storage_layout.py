@@ -0,0 +1,77 @@
+import os
+import sqlite3
+import sys
+import time
+from bench_data import make_work_dir, make_pool, device_ids
+from AITRIOSLocalDBHandler import STORAGE_LAYOUT_ROW, STORAGE_LAYOUT_FRAME
+
+# 保存形式(row: 検出結果1件1レコード、frame: 1フレーム1レコード)ごとに、登録速度、DBのサイズ、読み出し速度を比べる
+# 既定値は10デバイスが1fpsで送った1日分(1デバイスあたり86400フレーム、1フレームあたり5件)
+# python bench/bench_storage_layout.py [1デバイスあたりのフレーム数] [1フレームあたりの検出数]
+
+DEVICE_COUNT = 10
+
+# 保存形式ごとのテーブルとインデックス
+LAYOUT_TABLES = {
+    STORAGE_LAYOUT_ROW: ["t_inference_result", "idx_inference_result_device_epoch"],
+    STORAGE_LAYOUT_FRAME: ["t_inference_frame", "idx_inference_frame_device_epoch", "t_device"],
+}
+
+# 推論結果のテーブルとインデックスのサイズ(dbstatが使えない場合はDBファイル全体のサイズ)
+def table_bytes(db_file_name, storage_layout):
+    connection = sqlite3.connect(db_file_name)
+    try:
+        connection.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+        names = LAYOUT_TABLES[storage_layout]
+        return connection.execute("SELECT SUM(pgsize) FROM dbstat WHERE name IN (%s)" % ", ".join(["?"] * len(names)),
+                                  names).fetchone()[0]
+    except sqlite3.OperationalError:
+        return os.path.getsize(db_file_name)
+    finally:
+        connection.close()
+
+def measure(storage_layout, frame_count, detection_count):
+    db_file_name = "bench_%s.db" % storage_layout
+    start_time = time.perf_counter()
+    pool = make_pool(db_file_name, DEVICE_COUNT, frame_count, detection_count, storage_layout, reader_count=1)
+    insert_duration = time.perf_counter() - start_time
+
+    start_time = time.perf_counter()
+    with pool.reader() as table_handler:
+        for device_id in device_ids(DEVICE_COUNT) * 100:
+            table_handler.fetch_latestdate_by_device_id(device_id)
+    latest_ms = (time.perf_counter() - start_time) / (DEVICE_COUNT * 100) * 1000
+
+    # エクスポートと同じく10000件ずつ全件を読み出す
+    start_time = time.perf_counter()
+    row_count = 0
+    with pool.reader() as table_handler:
+        for device_id in device_ids(DEVICE_COUNT):
+            after = None
+            while True:
+                records = table_handler.fetch_range(device_id, 0, 2 ** 62, after, 10000)
+                row_count += len(records)
+                if len(records) < 10000:
+                    break
+                after = records[-1][0]
+    read_duration = time.perf_counter() - start_time
+    pool.close()
+    return {
+        "frames_per_sec": DEVICE_COUNT * frame_count / insert_duration,
+        "bytes": table_bytes(db_file_name, storage_layout),
+        "latest_ms": latest_ms,
+        "rows_per_sec": row_count / read_duration,
+    }
+
+if __name__ == "__main__":
+    frame_count = int(sys.argv[1]) if len(sys.argv) > 1 else 86400
+    detection_count = int(sys.argv[2]) if len(sys.argv) > 2 else 5
+    make_work_dir()
+    detections = DEVICE_COUNT * frame_count * detection_count
+    print("%d devices x %d frames x %d detections" % (DEVICE_COUNT, frame_count, detection_count))
+    print("layout  insert(frames/s)  size(MB)  bytes/detection  latest(ms)  range read(rows/s)")
+    for storage_layout in (STORAGE_LAYOUT_ROW, STORAGE_LAYOUT_FRAME):
+        result = measure(storage_layout, frame_count, detection_count)
+        print("%-6s  %16.0f  %8.1f  %15.1f  %10.3f  %18.0f" % (
+            storage_layout, result["frames_per_sec"], result["bytes"] / 1024 / 1024, result["bytes"] / detections,
+            result["latest_ms"], result["rows_per_sec"]))
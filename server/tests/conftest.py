@@ -0,0 +1,27 @@
+import os
+import sys
+import pytest
+
+# serverディレクトリのモジュールはモジュール名のみでimportする
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from console_server import start_stand_in_console, stop_stand_in_console
+from fastapi.testclient import TestClient
+
+
+# Consoleの代役のサーバー(ベースURLを返す)
+@pytest.fixture
+def console_server(monkeypatch):
+    for name in ("HTTP_PROXY", "HTTPS_PROXY", "ALL_PROXY", "http_proxy", "https_proxy", "all_proxy"):
+        monkeypatch.delenv(name, raising=False)
+    server, base_url = start_stand_in_console()
+    yield base_url
+    stop_stand_in_console(server)
+
+
+# 一時ディレクトリ(DBや画像の保存先)で起動したハブ。(TestClient, AITRIOS_Hubモジュール)を返す
+@pytest.fixture
+def hub(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    import AITRIOS_Hub
+    with TestClient(AITRIOS_Hub.app_ins) as client:
+        yield client, AITRIOS_Hub
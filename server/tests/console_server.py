@@ -0,0 +1,60 @@
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+# トークンの発行とAPIを兼ねる代役のサーバー
+class StandInConsole(BaseHTTPRequestHandler):
+    # 発行したトークンの数、APIの呼び出し(メソッド, パス, トークン)、次のAPIの応答で返すステータスコード
+    token_count = 0
+    calls = []
+    statuses = []
+    expires_in = 3600
+
+    @classmethod
+    def reset(cls):
+        cls.token_count = 0
+        cls.calls = []
+        cls.statuses = []
+        cls.expires_in = 3600
+
+    def do_POST(self):
+        if self.path == "/token":
+            self.rfile.read(int(self.headers["Content-Length"]))
+            StandInConsole.token_count += 1
+            self.reply(200, {"access_token": "token%d" % StandInConsole.token_count, "expires_in": StandInConsole.expires_in})
+        else:
+            self.call()
+
+    def do_GET(self):
+        self.call()
+
+    def call(self):
+        token = self.headers["Authorization"][len("Bearer "):]
+        StandInConsole.calls.append((self.command, self.path, token))
+        status = StandInConsole.statuses.pop(0) if StandInConsole.statuses else 200
+        self.reply(status, {"token": token})
+
+    def reply(self, status, body):
+        data = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass
+
+
+# サーバーを起動し、(サーバー, ベースURL)を返す
+def start_stand_in_console():
+    StandInConsole.reset()
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StandInConsole)
+    threading.Thread(target=server.serve_forever, kwargs={"poll_interval": 0.01}, daemon=True).start()
+    return server, "http://127.0.0.1:%d" % server.server_port
+
+
+def stop_stand_in_console(server):
+    server.shutdown()
+    server.server_close()
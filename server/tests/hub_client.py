@@ -0,0 +1,23 @@
+import time
+
+
+# 受信した推論結果が全て書き込みキューから書き込まれるまで待つ
+def wait_for_ingest(hub, timeout=5):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        stats = hub.ingest_queue.get_stats()
+        if stats["depth"] == 0 and stats["stored"] + stats["failed"] == stats["accepted"]:
+            return stats
+        time.sleep(0.005)
+    raise TimeoutError("ingest queue did not drain")
+
+
+# 予約された縮小画像が全て作成されるまで待つ
+def wait_for_thumbnails(hub, timeout=5):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        stats = hub.thumbnail_generator.get_stats()
+        if stats["pending"] == 0:
+            return stats
+        time.sleep(0.005)
+    raise TimeoutError("thumbnails were not generated")
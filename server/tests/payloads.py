@@ -0,0 +1,71 @@
+import base64
+import cv2
+import flatbuffers
+import numpy as np
+
+
+# ObjectDetectionTopのペイロード(Base64)を作る
+# detectionsは(クラスID, スコア, Left, Top, Right, Bottom)のリスト。バウンディングボックスがNoneの場合はBoundingBox2d以外として作る
+def make_object_detection_payload(detections):
+    builder = flatbuffers.Builder(1024)
+    objects = []
+    for class_id, score, *bbox in detections:
+        if bbox[0] is not None:
+            builder.StartObject(4)
+            for field_index, value in enumerate(bbox):
+                builder.PrependInt32Slot(field_index, value, 0)
+            bbox_offset = builder.EndObject()
+        builder.StartObject(4)
+        builder.PrependUint32Slot(0, class_id, 0)
+        if bbox[0] is not None:
+            builder.PrependUint8Slot(1, 1, 0)
+            builder.PrependUOffsetTRelativeSlot(2, bbox_offset, 0)
+        builder.PrependFloat32Slot(3, score, 0.0)
+        objects.append(builder.EndObject())
+
+    builder.StartVector(4, len(objects), 4)
+    for object_offset in reversed(objects):
+        builder.PrependUOffsetTRelative(object_offset)
+    vector_offset = builder.EndVector()
+    builder.StartObject(1)
+    builder.PrependUOffsetTRelativeSlot(0, vector_offset, 0)
+    data_offset = builder.EndObject()
+    builder.StartObject(1)
+    builder.PrependUOffsetTRelativeSlot(0, data_offset, 0)
+    builder.Finish(builder.EndObject())
+    return base64.b64encode(builder.Output()).decode()
+
+
+def make_random_detections(rng, count, without_bbox_rate=0.0):
+    detections = []
+    for _ in range(count):
+        left, top = rng.randint(0, 640), rng.randint(0, 480)
+        bbox = (left, top, left + rng.randint(0, 100), top + rng.randint(0, 100))
+        if rng.random() < without_bbox_rate:
+            bbox = (None, None, None, None)
+        # 既定値(0)のフィールドはペイロードに含まれないため、0も混ぜる
+        class_id = rng.choice([0, 0, 1, 2, 3, rng.randint(0, 2 ** 32 - 1)])
+        score = rng.choice([0.0, 0.5, rng.random()])
+        detections.append((class_id, score) + bbox)
+    return detections
+
+
+# /meta/{filename}で受信する推論結果のJSON
+# framesは(日時(YYYYmmddHHMMSSfff), detections)のリスト
+def make_meta(device_id, frames):
+    return {
+        "DeviceID": device_id,
+        "ModelID": "test",
+        "Image": True,
+        "Inferences": [{"T": inference_datetime, "O": make_object_detection_payload(detections)}
+                       for inference_datetime, detections in frames],
+    }
+
+
+# 画像の受信で送るJPEG(width x heightの画像)
+def make_jpeg(width=800, height=600):
+    image = np.zeros((height, width, 3), dtype=np.uint8)
+    cv2.rectangle(image, (100, 100), (400, 300), (0, 255, 0), -1)
+    ok, encoded = cv2.imencode(".jpg", image)
+    assert ok
+    return encoded.tobytes()
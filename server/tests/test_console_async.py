@@ -0,0 +1,77 @@
+import asyncio
+import types
+import pytest
+import ConsoleWrapperAsync
+from ConsoleWrapperAsync import AsyncConsoleRESTAPI
+from ConsoleWrapperLimited import TOKEN_REFRESH_MARGIN
+from console_server import StandInConsole
+
+
+# pytest-asyncioを使わず、テストごとにasyncio.runで実行する
+def run_with_api(console_server, test):
+    async def main():
+        api = AsyncConsoleRESTAPI(console_server + "/api", "id", "secret", console_server + "/token", backoff_factor=0)
+        try:
+            return await test(api)
+        finally:
+            await api.aclose()
+    return asyncio.run(main())
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    # トークンの有効期限の判定に使う時計を進められるようにする
+    clock = types.SimpleNamespace(now=1000.0)
+    monkeypatch.setattr(ConsoleWrapperAsync, "time", types.SimpleNamespace(monotonic=lambda: clock.now))
+    return clock
+
+
+def test_concurrent_get_token_requests_the_token_once(console_server, clock):
+    async def test(api):
+        return await asyncio.gather(*[api.GetToken() for _ in range(8)])
+    assert run_with_api(console_server, test) == ["token1"] * 8
+    assert StandInConsole.token_count == 1
+
+
+def test_token_is_reused_until_it_expires(console_server, clock):
+    async def test(api):
+        await api.GetDevices()
+        clock.now += 3600 - TOKEN_REFRESH_MARGIN - 1
+        await api.GetDevices()
+        clock.now += 1
+        await api.GetDevices()
+    run_with_api(console_server, test)
+    assert [call[2] for call in StandInConsole.calls] == ["token1", "token1", "token2"]
+
+
+def test_rejected_token_is_refreshed_and_retried_once(console_server, clock):
+    async def test(api):
+        return await api.GetDevices()
+    StandInConsole.statuses = [401]
+    assert run_with_api(console_server, test) == {"token": "token2"}
+    assert StandInConsole.token_count == 2
+    assert [call[2] for call in StandInConsole.calls] == ["token1", "token2"]
+
+    # 取り直したトークンでも401の場合は再試行しない
+    StandInConsole.reset()
+    StandInConsole.statuses = [401, 401]
+    assert run_with_api(console_server, test) == {"token": "token2"}
+    assert StandInConsole.token_count == 2
+    assert len(StandInConsole.calls) == 2
+
+
+def test_only_idempotent_methods_are_retried(console_server, clock):
+    async def get_devices(api):
+        return await api.GetDevices()
+
+    async def start_upload(api):
+        return await api.StartUploadInferenceResult("dev1")
+
+    StandInConsole.statuses = [503, 502]
+    assert run_with_api(console_server, get_devices) == {"token": "token1"}
+    assert [call[0] for call in StandInConsole.calls] == ["GET", "GET", "GET"]
+
+    StandInConsole.calls = []
+    StandInConsole.statuses = [503]
+    run_with_api(console_server, start_upload)
+    assert [call[0] for call in StandInConsole.calls] == ["POST"]
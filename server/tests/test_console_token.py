@@ -0,0 +1,63 @@
+import threading
+import types
+import pytest
+import ConsoleWrapperLimited
+from ConsoleWrapperLimited import ConsoleRESTAPI, TOKEN_REFRESH_MARGIN
+from console_server import StandInConsole
+
+
+@pytest.fixture
+def console(monkeypatch, console_server):
+    # トークンの有効期限の判定に使う時計を進められるようにする
+    clock = types.SimpleNamespace(now=1000.0)
+    monkeypatch.setattr(ConsoleWrapperLimited, "time", types.SimpleNamespace(monotonic=lambda: clock.now))
+    api = ConsoleRESTAPI(console_server + "/api", "id", "secret", console_server + "/token", backoff_factor=0)
+    yield api, clock
+    api.close()
+
+
+def test_token_is_reused_until_it_expires(console):
+    api, clock = console
+    api.GetDevices()
+    api.GetDevices()
+    assert StandInConsole.token_count == 1
+    assert [call[2] for call in StandInConsole.calls] == ["token1", "token1"]
+
+    # 有効期限のTOKEN_REFRESH_MARGIN秒前までは使い回し、それ以降は取り直す
+    clock.now += 3600 - TOKEN_REFRESH_MARGIN - 1
+    api.GetDevices()
+    assert StandInConsole.token_count == 1
+    clock.now += 1
+    api.GetDevices()
+    assert StandInConsole.token_count == 2
+    assert StandInConsole.calls[-1][2] == "token2"
+
+
+def test_concurrent_requests_fetch_the_token_once(console):
+    api, _ = console
+    threads = [threading.Thread(target=api.GetDevices) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert StandInConsole.token_count == 1
+    assert len(StandInConsole.calls) == 8
+
+
+def test_rejected_token_is_refreshed_once(console):
+    api, _ = console
+    StandInConsole.statuses = [401]
+    assert api.GetDevices() == {"token": "token2"}
+    assert [call[2] for call in StandInConsole.calls] == ["token1", "token2"]
+
+
+def test_only_idempotent_methods_are_retried(console):
+    api, _ = console
+    StandInConsole.statuses = [503, 502]
+    assert api.GetDevices() == {"token": "token1"}
+    assert [call[0] for call in StandInConsole.calls] == ["GET", "GET", "GET"]
+
+    StandInConsole.calls = []
+    StandInConsole.statuses = [503]
+    api.StartUploadInferenceResult("dev1")
+    assert [call[0] for call in StandInConsole.calls] == ["POST"]
@@ -0,0 +1,53 @@
+import random
+import numpy as np
+from Desilialize import DeserializeUtil, DetectionFilter
+from payloads import make_object_detection_payload, make_random_detections
+
+
+# 従来のデコーダ(get_deserialize_data)の結果を(C, P, X, Y, x, y)のリストにする
+def decode_with_objects(payload):
+    return [(value["C"], value["P"], value["X"], value["Y"], value["x"], value["y"])
+            for value in DeserializeUtil().get_deserialize_data(payload).values()]
+
+
+# 従来のデコーダの結果をPythonで1件ずつ絞り込む
+def filter_with_objects(rows, detection_filter):
+    rows = [row for row in rows
+            if row[1] >= detection_filter.min_score
+            and (detection_filter.class_ids is None or row[0] in detection_filter.class_ids)
+            and (row[4] - row[2]) * (row[5] - row[3]) >= detection_filter.min_box_area]
+    if detection_filter.max_detections is not None:
+        top = sorted(range(len(rows)), key=lambda index: -rows[index][1])[:detection_filter.max_detections]
+        rows = [rows[index] for index in sorted(top)]
+    return rows
+
+
+def test_columns_match_object_decoder_on_random_payloads():
+    rng = random.Random(0)
+    deserializeutil = DeserializeUtil()
+    for _ in range(200):
+        payload = make_object_detection_payload(make_random_detections(rng, rng.randint(0, 200), 0.1))
+        detections = deserializeutil.get_deserialize_columns(payload)
+        assert detections.dtype.names == ("C", "P", "X", "Y", "x", "y")
+        assert detections.tolist() == decode_with_objects(payload)
+
+
+def test_filtered_columns_match_filtered_object_decoder_on_random_payloads():
+    rng = random.Random(1)
+    deserializeutil = DeserializeUtil()
+    for _ in range(200):
+        payload = make_object_detection_payload(make_random_detections(rng, rng.randint(0, 200), 0.1))
+        detection_filter = DetectionFilter(
+            class_ids=rng.choice([None, frozenset([0]), frozenset([0, 1, 3])]),
+            min_score=rng.choice([0.0, 0.5, rng.random()]),
+            max_detections=rng.choice([None, 0, 1, 10]),
+            min_box_area=rng.choice([0, 1, 2500]),
+        )
+        detections = deserializeutil.get_deserialize_columns(payload, detection_filter)
+        assert detections.tolist() == filter_with_objects(decode_with_objects(payload), detection_filter)
+
+
+def test_empty_payload():
+    detections = DeserializeUtil().get_deserialize_columns(make_object_detection_payload([]))
+    assert len(detections) == 0
+    assert isinstance(detections, np.ndarray)
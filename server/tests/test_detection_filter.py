@@ -0,0 +1,62 @@
+import numpy as np
+import pytest
+from Desilialize import DeserializeUtil, DetectionFilter
+from payloads import make_object_detection_payload
+
+
+def test_from_dict_converts_strings_to_numbers():
+    detection_filter = DetectionFilter.from_dict({"class_ids": ["0", 1], "max_detections": "2", "min_score": "0.5"})
+    assert detection_filter.class_ids == frozenset([0, 1])
+    assert detection_filter.max_detections == 2
+    assert detection_filter.min_score == 0.5
+
+
+@pytest.mark.parametrize("data", [
+    [],
+    {"class_ids": 0},
+    {"class_ids": ["a"]},
+    {"class_ids": [-1]},
+    {"class_ids": [2 ** 32]},
+    {"max_detections": "many"},
+    {"max_detections": -1},
+    {"min_score": None},
+    {"min_box_area": -1},
+    {"max_detection": 10},
+])
+def test_from_dict_rejects_invalid_values(data):
+    with pytest.raises(ValueError):
+        DetectionFilter.from_dict(data)
+
+
+DETECTIONS = [
+    (0, 0.9, 0, 0, 10, 10),
+    (1, 0.4, 0, 0, 100, 100),
+    (2, 0.8, 0, 0, 100, 100),
+    (0, 0.7, 0, 0, 5, 5),
+    (1, 0.95, 0, 0, 50, 50),
+]
+
+
+def decode(detection_filter=None):
+    payload = make_object_detection_payload(DETECTIONS)
+    return DeserializeUtil().get_deserialize_columns(payload, detection_filter).tolist()
+
+
+def test_filter_keeps_a_subset_of_unfiltered_detections():
+    unfiltered = decode()
+    assert len(unfiltered) == len(DETECTIONS)
+    filtered = decode(DetectionFilter.from_dict({"class_ids": ["0", "1"], "min_score": 0.5}))
+    assert filtered == [unfiltered[0], unfiltered[3], unfiltered[4]]
+
+
+def test_max_detections_keeps_highest_scores_in_original_order():
+    detections = DeserializeUtil().get_deserialize_columns(make_object_detection_payload(DETECTIONS),
+                                                           DetectionFilter.from_dict({"max_detections": "2"}))
+    assert detections["C"].tolist() == [0, 1]
+    assert np.allclose(detections["P"], [0.9, 0.95])
+
+
+def test_min_box_area():
+    detections = DeserializeUtil().get_deserialize_columns(make_object_detection_payload(DETECTIONS),
+                                                           DetectionFilter.from_dict({"min_box_area": 100}))
+    assert detections["C"].tolist() == [0, 1, 2, 1]
@@ -0,0 +1,41 @@
+from hub_client import wait_for_ingest
+from payloads import make_meta
+
+
+def put_frame(client, AITRIOS_Hub, inference_datetime, detections):
+    assert client.put("/meta/1.txt", json=make_meta("dev1", [(inference_datetime, detections)])).status_code == 200
+    wait_for_ingest(AITRIOS_Hub)
+
+
+def test_unchanged_frame_is_answered_with_304(hub):
+    client, AITRIOS_Hub = hub
+    put_frame(client, AITRIOS_Hub, "20250116123456000", [(0, 0.9, 1, 2, 3, 4)])
+
+    response = client.get("/dev1/inference_result")
+    assert response.status_code == 200
+    etag = response.headers["etag"]
+    assert etag == '"%s"' % response.json()["frame_id"]
+
+    for if_none_match in (etag, "W/" + etag, '"other", ' + etag, "*"):
+        response = client.get("/dev1/inference_result", headers={"If-None-Match": if_none_match})
+        assert response.status_code == 304
+        assert response.headers["etag"] == etag
+        assert response.content == b""
+
+
+def test_new_frame_is_answered_with_200_and_a_new_etag(hub):
+    client, AITRIOS_Hub = hub
+    put_frame(client, AITRIOS_Hub, "20250116123456000", [(0, 0.9, 1, 2, 3, 4)])
+    etag = client.get("/dev1/inference_result").headers["etag"]
+
+    # 同じ日時の追加分もフレームが変わるためETagが変わる
+    put_frame(client, AITRIOS_Hub, "20250116123456000", [(1, 0.9, 1, 2, 3, 4)])
+    response = client.get("/dev1/inference_result", headers={"If-None-Match": etag})
+    assert response.status_code == 200
+    assert response.json()["count"] == 2
+    assert response.headers["etag"] != etag
+
+    put_frame(client, AITRIOS_Hub, "20250116123457000", [(0, 0.9, 1, 2, 3, 4)])
+    response = client.get("/dev1/inference_result", headers={"If-None-Match": '"other"'})
+    assert response.status_code == 200
+    assert response.json()["count"] == 1
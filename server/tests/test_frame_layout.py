@@ -0,0 +1,33 @@
+import pytest
+from AITRIOSLocalDBHandler import AITRIOSLocalDBPool, STORAGE_LAYOUT_FRAME
+
+
+def make_records(device_id, inference_epoch_ms, *class_ids):
+    return [{"device_id": device_id, "C": class_id, "T": inference_epoch_ms, "P": 0.9, "X": 1, "Y": 2, "x": 3, "y": 4}
+            for class_id in class_ids]
+
+
+@pytest.fixture
+def pool(tmp_path):
+    pool = AITRIOSLocalDBPool(str(tmp_path / "test.db"), reader_count=1, storage_layout=STORAGE_LAYOUT_FRAME)
+    yield pool
+    pool.close()
+
+
+def test_device_key_of_rolled_back_insert_is_not_cached(pool, monkeypatch):
+    with pool.writer() as table_handler:
+        def fail(data_list):
+            raise RuntimeError("rollup failed")
+        monkeypatch.setattr(table_handler, "update_rollups", fail)
+        with pytest.raises(RuntimeError):
+            table_handler.insert_many(make_records("dev1", 1000, 0))
+    assert "dev1" not in pool.device_keys
+
+    # ロールバックで空いたキーが別のデバイスに採番されても、フレームは混ざらない
+    with pool.writer() as table_handler:
+        table_handler.insert_many(make_records("dev2", 2000, 1))
+        table_handler.insert_many(make_records("dev1", 3000, 0))
+    with pool.reader() as table_handler:
+        assert [record[2] for record in table_handler.fetch_latestdate_by_device_id("dev1")] == ["0"]
+        assert [record[2] for record in table_handler.fetch_latestdate_by_device_id("dev2")] == ["1"]
+        assert table_handler.fetch_latestdate_by_device_id("dev1")[0][3] == 3000
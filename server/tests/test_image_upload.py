@@ -0,0 +1,91 @@
+import os
+from hub_client import wait_for_thumbnails
+from payloads import make_jpeg, make_meta
+
+
+def list_files(root_dir):
+    return sorted(os.path.relpath(os.path.join(directory, name), root_dir)
+                  for directory, _, names in os.walk(root_dir) for name in names)
+
+
+def fetch_image_index(AITRIOS_Hub):
+    with AITRIOS_Hub.db_pool.reader() as table_handler:
+        table_handler.dbhandler.cursor.execute("SELECT device_id, image_epoch_ms, path, size FROM t_image_index ORDER BY id")
+        return table_handler.dbhandler.cursor.fetchall()
+
+
+def test_uploaded_jpeg_is_stored_and_indexed(hub):
+    client, AITRIOS_Hub = hub
+    jpeg = make_jpeg()
+    response = client.put("/image/dev1/20250116123456789.jpg", content=jpeg)
+    assert response.status_code == 200
+
+    relative_path = os.path.join("dev1", "20250116", "12", "20250116123456789.jpg")
+    with open(os.path.join("image", relative_path), "rb") as r_fp:
+        assert r_fp.read() == jpeg
+    assert fetch_image_index(AITRIOS_Hub) == [("dev1", 1737030896789, relative_path, len(jpeg))]
+    wait_for_thumbnails(AITRIOS_Hub)
+    assert not any(name.endswith(".part") for name in list_files("image"))
+
+    response = client.get("/image/dev1/latest")
+    assert response.status_code == 200
+    assert response.content == jpeg
+    assert response.headers["x-image-datetime"] == "2025-01-16T12:34:56.789000"
+    response = client.get("/image/dev1/nearest", params={"datetime": "2025-01-16T12:34:57"})
+    assert response.content == jpeg
+
+
+def test_upload_over_the_size_limit_is_rejected_without_leaving_files(hub, monkeypatch):
+    client, AITRIOS_Hub = hub
+    monkeypatch.setattr(AITRIOS_Hub.image_receiver, "max_size", 1000)
+    jpeg = make_jpeg()
+    assert len(jpeg) > 1000
+
+    # Content-Lengthで判定できる場合
+    response = client.put("/image/dev1/20250116123456000.jpg", content=jpeg)
+    assert response.status_code == 413
+    # Content-Lengthが無い場合は受信しながら判定する
+    response = client.put("/image/dev1/20250116123457000.jpg", content=iter([jpeg[:800], jpeg[800:]]))
+    assert response.status_code == 413
+
+    assert not any(name.endswith(".jpg") or name.endswith(".part") for name in list_files("image"))
+    assert fetch_image_index(AITRIOS_Hub) == []
+    assert AITRIOS_Hub.image_receiver.get_stats()["rejected"] == 2
+
+
+def test_reupload_replaces_the_file_and_its_index_row(hub):
+    client, AITRIOS_Hub = hub
+    first, second = make_jpeg(), make_jpeg(320, 240)
+    assert client.put("/image/dev1/20250116123456000.jpg", content=first).status_code == 200
+    assert client.put("/image/dev1/20250116123456000.jpg", content=second).status_code == 200
+    wait_for_thumbnails(AITRIOS_Hub)
+
+    assert client.get("/image/dev1/latest").content == second
+    relative_path = os.path.join("dev1", "20250116", "12", "20250116123456000.jpg")
+    assert [row[2:] for row in fetch_image_index(AITRIOS_Hub)] == [(relative_path, len(second))]
+    assert not any(name.endswith(".part") for name in list_files("image"))
+
+
+def test_unsafe_names_are_rejected(hub):
+    client, _ = hub
+    assert client.put("/image/dev1/a%5Cb.jpg", content=b"x").status_code == 400
+
+
+def test_image_without_device_id_is_linked_to_its_device(hub):
+    client, AITRIOS_Hub = hub
+    jpeg = make_jpeg(320, 240)
+    # 推論結果をまだ受信していない送信元はunknown
+    assert client.put("/image/20250116123455000.jpg", content=jpeg).status_code == 200
+    assert client.get("/image/unknown/latest").status_code == 200
+
+    # 同じ送信元から受信した推論結果のDeviceID
+    assert client.put("/meta/20250116123456000.txt", json=make_meta("dev1", [("20250116123456000", [])])).status_code == 200
+    assert client.put("/image/20250116123456000.jpg", content=jpeg).status_code == 200
+    # X-Device-IDヘッダーが優先される
+    assert client.put("/image/20250116123457000.jpg", content=jpeg, headers={"X-Device-ID": "dev2"}).status_code == 200
+    assert client.put("/image/20250116123458000.jpg", content=jpeg, headers={"X-Device-ID": "../dev2"}).status_code == 400
+    wait_for_thumbnails(AITRIOS_Hub)
+
+    assert [row[0] for row in fetch_image_index(AITRIOS_Hub)] == ["unknown", "dev1", "dev2"]
+    assert client.get("/image/dev1/latest").headers["x-image-datetime"] == "2025-01-16T12:34:56"
+    assert client.get("/image/dev2/latest").headers["x-image-datetime"] == "2025-01-16T12:34:57"
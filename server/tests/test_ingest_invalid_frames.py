@@ -0,0 +1,25 @@
+import base64
+from hub_client import wait_for_ingest
+from payloads import make_meta
+
+
+def test_undecodable_frames_are_counted_and_siblings_are_stored(hub):
+    client, AITRIOS_Hub = hub
+    meta = make_meta("dev1", [("20250116123456000", [(0, 0.9, 1, 2, 3, 4)]), ("20250116123457000", [(1, 0.9, 1, 2, 3, 4)])])
+    meta["Inferences"][1]["O"] = base64.b64encode(b"\x01").decode()
+    assert client.put("/meta/1.txt", json=meta).status_code == 200
+
+    stats = wait_for_ingest(AITRIOS_Hub)
+    assert stats["stored"] == 1
+    assert stats["invalid_frames"] == 1
+    assert client.get("/hub/ingest_stats").json()["invalid_frames"] == 1
+    assert client.get("/dev1/inference_result").json()["count"] == 1
+
+
+def test_frames_without_a_payload_are_rejected_before_queueing(hub):
+    client, AITRIOS_Hub = hub
+    meta = make_meta("dev1", [("20250116123456000", [])])
+    for inference in ({"T": "20250116123456000"}, "frame", {"T": "20250116123456000", "O": 1}):
+        response = client.put("/meta/1.txt", json=dict(meta, Inferences=[inference]))
+        assert response.status_code == 400
+    assert AITRIOS_Hub.ingest_queue.get_stats()["accepted"] == 0
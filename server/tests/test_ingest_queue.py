@@ -0,0 +1,40 @@
+import threading
+from AITRIOSIngestQueue import InferenceIngestQueue
+
+
+def test_failed_batches_are_not_counted_as_stored():
+    stored = []
+    done = threading.Event()
+
+    def store_function(batch):
+        if batch[0] == "fail":
+            raise RuntimeError("disk full")
+        stored.extend(batch)
+        if "last" in batch:
+            done.set()
+
+    ingest_queue = InferenceIngestQueue(store_function, max_batch_size=1)
+    ingest_queue.start()
+    for item in ["ok", "fail", "last"]:
+        assert ingest_queue.put(item)
+    assert done.wait(5)
+    ingest_queue.stop()
+
+    stats = ingest_queue.get_stats()
+    assert stored == ["ok", "last"]
+    assert stats["stored"] == 2
+    assert stats["failed"] == 1
+    assert stats["failed_batches"] == 1
+    assert stats["batches"] == 3
+
+
+def test_invalid_frames_returned_by_the_store_function_are_counted():
+    ingest_queue = InferenceIngestQueue(lambda batch: len(batch), max_batch_size=10)
+    ingest_queue.start()
+    for item in range(3):
+        assert ingest_queue.put(item)
+    ingest_queue.stop()
+
+    stats = ingest_queue.get_stats()
+    assert stats["stored"] == 3
+    assert stats["invalid_frames"] == 3
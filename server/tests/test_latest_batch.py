@@ -0,0 +1,49 @@
+from AITRIOSLocalDBHandler import LatestFrameCache
+from hub_client import wait_for_ingest
+from payloads import make_meta
+
+
+def put_frames(client, AITRIOS_Hub):
+    for device_id, inference_datetime, class_ids in (("dev1", "20250116123456000", [0]),
+                                                      ("dev2", "20250116123457000", [0, 1])):
+        detections = [(class_id, 0.9, 1, 2, 3, 4) for class_id in class_ids]
+        assert client.put("/meta/1.txt", json=make_meta(device_id, [(inference_datetime, detections)])).status_code == 200
+    wait_for_ingest(AITRIOS_Hub)
+
+
+def test_known_and_unknown_devices_in_one_request(hub, monkeypatch):
+    client, AITRIOS_Hub = hub
+    put_frames(client, AITRIOS_Hub)
+    # 起動直後と同じく空のキャッシュにし、dev1のみキャッシュに載せる(残りはSQLiteから読み出す)
+    monkeypatch.setattr(AITRIOS_Hub, "latest_frame_cache", LatestFrameCache())
+    client.get("/dev1/inference_result")
+
+    response = client.post("/inference_results/latest", json={"device_ids": ["dev2", "missing", "dev1", "dev2"]})
+    assert response.status_code == 200
+    body = response.json()
+    assert body["count"] == 3
+    assert list(body["results"]) == ["dev2", "missing", "dev1"]
+    assert body["results"]["dev1"]["count"] == 1
+    assert body["results"]["dev2"]["count"] == 2
+    assert body["results"]["missing"]["count"] == 0
+    for device_id in ("dev1", "dev2", "missing"):
+        assert body["results"][device_id] == client.get("/%s/inference_result" % device_id).json()
+
+
+def test_device_group(hub):
+    client, AITRIOS_Hub = hub
+    put_frames(client, AITRIOS_Hub)
+    AITRIOS_Hub.device_groups["line1"] = ["dev1", "missing"]
+
+    body = client.post("/inference_results/latest", json={"device_group": "line1"}).json()
+    assert list(body["results"]) == ["dev1", "missing"]
+    assert body["results"]["dev1"]["count"] == 1
+    assert client.post("/inference_results/latest", json={"device_group": "other"}).status_code == 400
+
+
+def test_invalid_requests_are_rejected(hub):
+    client, AITRIOS_Hub = hub
+    for content in (b"not json", b"[]", b'{"device_ids": "dev1"}', b'{"device_ids": [1]}'):
+        assert client.post("/inference_results/latest", content=content).status_code == 400
+    device_ids = ["dev%d" % index for index in range(AITRIOS_Hub.LATEST_BATCH_MAX_DEVICES + 1)]
+    assert client.post("/inference_results/latest", json={"device_ids": device_ids}).status_code == 400
@@ -0,0 +1,52 @@
+from AITRIOSLocalDBHandler import LatestFrameCache
+
+
+def make_frame(*class_ids):
+    inferences = [{"device_id": "dev1", "C": str(class_id)} for class_id in class_ids]
+    return {"count": len(inferences), "inferences": inferences}
+
+
+def test_writer_puts_merge_frames_with_the_same_datetime():
+    cache = LatestFrameCache()
+    cache.put("dev1", 1000, make_frame(0))
+    frame = cache.put("dev1", 1000, make_frame(1))
+    assert frame["count"] == 2
+    assert frame["frame_id"] == "1000-2"
+
+
+def test_snapshot_read_during_write_is_not_cached():
+    cache = LatestFrameCache()
+    # 読み出し側が世代を取得した後に書き込みがコミットされ、読み出し側が書き込み済みのフレームを読む
+    generation = cache.get_write_generation("dev1")
+    cache.begin_write({"dev1"})
+    assert cache.put("dev1", 1000, make_frame(0), generation) is None
+    # 書き込み側の反映で1回だけ追加される
+    frame = cache.put("dev1", 1000, make_frame(0))
+    cache.end_write({"dev1"})
+    assert frame["count"] == 1
+    assert cache.get("dev1")["frame_id"] == "1000-1"
+
+
+def test_snapshot_read_before_a_finished_write_is_not_cached():
+    cache = LatestFrameCache()
+    generation = cache.get_write_generation("dev1")
+    cache.begin_write({"dev1"})
+    cache.put("dev1", 1000, make_frame(0))
+    cache.end_write({"dev1"})
+    assert cache.put("dev1", 1000, make_frame(0), generation) is None
+    assert cache.get("dev1")["count"] == 1
+
+
+def test_snapshot_replaces_instead_of_merging():
+    cache = LatestFrameCache()
+    cache.put("dev1", 1000, make_frame(0))
+    frame = cache.put("dev1", 1000, make_frame(0, 1), cache.get_write_generation("dev1"))
+    assert frame["count"] == 2
+
+
+def test_writes_to_other_devices_do_not_block_snapshots():
+    cache = LatestFrameCache()
+    generation = cache.get_write_generation("dev1")
+    cache.begin_write({"dev2"})
+    assert cache.put("dev1", 1000, make_frame(0), generation)["frame_id"] == "1000-1"
+    cache.end_write({"dev2"})
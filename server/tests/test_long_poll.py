@@ -0,0 +1,62 @@
+import threading
+import time
+from hub_client import wait_for_ingest
+from payloads import make_meta
+
+
+def put_frame(client, inference_datetime):
+    assert client.put("/meta/1.txt", json=make_meta("dev1", [(inference_datetime, [(0, 0.9, 1, 2, 3, 4)])])).status_code == 200
+
+
+def test_long_poll_wakes_when_a_new_frame_is_ingested(hub):
+    client, AITRIOS_Hub = hub
+    put_frame(client, "20250116123456000")
+    wait_for_ingest(AITRIOS_Hub)
+    frame_id = client.get("/dev1/inference_result").json()["frame_id"]
+
+    responses = []
+    poll = threading.Thread(target=lambda: responses.append(
+        client.get("/dev1/inference_result", params={"after": frame_id, "wait": 10})))
+    start_time = time.monotonic()
+    poll.start()
+    time.sleep(0.2)
+    assert poll.is_alive()
+    put_frame(client, "20250116123457000")
+    poll.join(5)
+
+    assert time.monotonic() - start_time < 5
+    response, = responses
+    assert response.status_code == 200
+    assert response.json()["frame_id"] != frame_id
+    assert response.json()["inferences"][0]["T"] == "2025-01-16T12:34:57"
+
+
+def test_long_poll_returns_304_when_no_frame_arrives(hub):
+    client, AITRIOS_Hub = hub
+    put_frame(client, "20250116123456000")
+    wait_for_ingest(AITRIOS_Hub)
+    frame_id = client.get("/dev1/inference_result").json()["frame_id"]
+
+    start_time = time.monotonic()
+    response = client.get("/dev1/inference_result", params={"after": frame_id, "wait": 0.3})
+    assert time.monotonic() - start_time >= 0.3
+    assert response.status_code == 304
+    assert response.headers["etag"] == '"%s"' % frame_id
+
+
+def test_long_poll_returns_at_once_when_the_frame_already_changed(hub):
+    client, AITRIOS_Hub = hub
+    put_frame(client, "20250116123456000")
+    wait_for_ingest(AITRIOS_Hub)
+
+    start_time = time.monotonic()
+    response = client.get("/dev1/inference_result", params={"after": "0-0", "wait": 10})
+    assert time.monotonic() - start_time < 5
+    assert response.status_code == 200
+    assert response.json()["count"] == 1
+
+
+def test_wait_is_limited(hub):
+    client, AITRIOS_Hub = hub
+    response = client.get("/dev1/inference_result", params={"after": "0-0", "wait": AITRIOS_Hub.LONG_POLL_MAX_WAIT + 1})
+    assert response.status_code == 422
@@ -0,0 +1,50 @@
+import sqlite3
+import AITRIOSLocalDBHandler
+from AITRIOSLocalDBHandler import AITRIOSLocalDBPool, SCHEMA_MIGRATIONS, migrate, parse_inference_datetime
+
+
+# v5までのスキーマで、日時を文字列(YYYYmmddHHMMSSfff)で保存したDBを作る
+def make_v5_db(db_file_name, monkeypatch, rows):
+    monkeypatch.setattr(AITRIOSLocalDBHandler, "SCHEMA_MIGRATIONS", [m for m in SCHEMA_MIGRATIONS if m[0] <= 5])
+    connection = sqlite3.connect(db_file_name)
+    migrate(connection)
+    connection.executemany(
+        "INSERT INTO t_inference_result (device_id, class_id, inference_datetime, inference_percentage, x1, y1, x2, y2) "
+        "VALUES (?, ?, ?, ?, 1, 2, 3, 4)", rows)
+    connection.commit()
+    connection.close()
+    monkeypatch.undo()
+
+
+def test_v6_converts_string_datetimes_to_epoch_ms(tmp_path, monkeypatch):
+    db_file_name = str(tmp_path / "v5.db")
+    rows = [
+        ("dev1", "0", "20250116123456000", 0.9),
+        ("dev1", "1", "20250116123456789", 0.8),
+        ("dev1", "", "20241231235959999", -1),
+        ("dev2", "0", "20250101000000001", 0.7),
+    ]
+    make_v5_db(db_file_name, monkeypatch, rows)
+
+    pool = AITRIOSLocalDBPool(db_file_name, reader_count=1)
+    with pool.reader() as table_handler:
+        cursor = table_handler.dbhandler.cursor
+        cursor.execute("SELECT id, device_id, class_id, inference_epoch_ms, inference_percentage FROM t_inference_result ORDER BY id")
+        assert cursor.fetchall() == [(index + 1, device_id, class_id, parse_inference_datetime(inference_datetime), score)
+                                     for index, (device_id, class_id, inference_datetime, score) in enumerate(rows)]
+        cursor.execute("SELECT version FROM t_schema_version ORDER BY version")
+        assert [version for version, in cursor.fetchall()] == [version for version, _ in SCHEMA_MIGRATIONS]
+        cursor.execute("SELECT name FROM sqlite_master WHERE type = 'index' AND tbl_name = 't_inference_result'")
+        assert "idx_inference_result_device_epoch" in [name for name, in cursor.fetchall()]
+
+        latest = table_handler.convert_to_json_multiple(table_handler.fetch_latestdate_by_device_id("dev1"))
+        assert latest["count"] == 1
+        assert latest["inferences"][0]["C"] == "1"
+        assert latest["inferences"][0]["T"] == "2025-01-16T12:34:56.789000"
+    pool.close()
+
+    # 再起動時は適用済みのため、そのまま開ける
+    pool = AITRIOSLocalDBPool(db_file_name, reader_count=1)
+    with pool.reader() as table_handler:
+        assert len(table_handler.fetch_latestdate_by_device_id("dev2")) == 1
+    pool.close()
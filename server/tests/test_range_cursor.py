@@ -0,0 +1,78 @@
+import json
+import pytest
+from AITRIOSLocalDBHandler import AITRIOSLocalDBPool, STORAGE_LAYOUT_ROW, STORAGE_LAYOUT_FRAME
+from hub_client import wait_for_ingest
+from payloads import make_meta
+
+
+# Xに通し番号を入れ、取り出した順序を確認できるようにする
+def make_records(device_id, inference_epoch_ms, *numbers):
+    return [{"device_id": device_id, "C": 0, "T": inference_epoch_ms, "P": 0.9, "X": number, "Y": 2, "x": 3, "y": 4}
+            for number in numbers]
+
+
+@pytest.fixture(params=[STORAGE_LAYOUT_ROW, STORAGE_LAYOUT_FRAME])
+def pool(tmp_path, request):
+    pool = AITRIOSLocalDBPool(str(tmp_path / "test.db"), reader_count=1, storage_layout=request.param)
+    with pool.writer() as table_handler:
+        table_handler.insert_many(make_records("dev1", 1000, 0, 1, 2))
+        # 同じ日時のフレームを別の登録で追加する
+        table_handler.insert_many(make_records("dev1", 1000, 3))
+        table_handler.insert_many(make_records("dev1", 2000, 4, 5) + make_records("dev2", 2000, 100))
+        table_handler.insert_many(make_records("dev1", 2000, 6))
+        table_handler.insert_many(make_records("dev1", 3000, 7))
+    yield pool
+    pool.close()
+
+
+def fetch_all_pages(pool, limit, from_epoch_ms=0, to_epoch_ms=10000):
+    numbers = []
+    after = None
+    while True:
+        with pool.reader() as table_handler:
+            records = table_handler.fetch_range("dev1", from_epoch_ms, to_epoch_ms, after, limit)
+        numbers.extend(data_tuple[5] for _, data_tuple in records)
+        if len(records) < limit:
+            return numbers
+        after = records[-1][0]
+
+
+@pytest.mark.parametrize("limit", [1, 2, 3, 4, 100])
+def test_pages_do_not_skip_or_repeat_detections_with_equal_datetimes(pool, limit):
+    assert fetch_all_pages(pool, limit) == list(range(8))
+
+
+def test_range_excludes_to_and_starts_at_from(pool):
+    assert fetch_all_pages(pool, 2, from_epoch_ms=2000, to_epoch_ms=3000) == [4, 5, 6]
+
+
+def test_invalid_cursor_is_rejected(pool):
+    with pool.reader() as table_handler:
+        for cursor in ("abc", "1000", "1000-1-2-3", "-1-2"):
+            with pytest.raises(ValueError):
+                table_handler.fetch_range("dev1", 0, 10000, cursor, 10)
+
+
+def test_inference_results_pages_with_the_cursor(hub):
+    client, AITRIOS_Hub = hub
+    for detections in ([(0, 0.9, 0, 2, 3, 4), (0, 0.9, 1, 2, 3, 4)], [(0, 0.9, 2, 2, 3, 4)]):
+        client.put("/meta/1.txt", json=make_meta("dev1", [("20250116120000000", detections)]))
+        wait_for_ingest(AITRIOS_Hub)
+    client.put("/meta/1.txt", json=make_meta("dev1", [("20250116120001000", [(0, 0.9, 3, 2, 3, 4)])]))
+    wait_for_ingest(AITRIOS_Hub)
+
+    params = {"from": "2025-01-16T12:00:00", "to": "2025-01-16T12:00:02", "limit": 2}
+    lines = []
+    while True:
+        response = client.get("/dev1/inference_results", params=params)
+        assert response.headers["content-type"] == "application/x-ndjson"
+        page = [line for line in response.text.splitlines() if line]
+        lines.extend(page)
+        if len(page) < params["limit"]:
+            break
+        params["after"] = json.loads(page[-1])["cursor"]
+    inferences = [json.loads(line) for line in lines]
+    assert [inference["X"] for inference in inferences] == [0, 1, 2, 3]
+    assert len({inference["cursor"] for inference in inferences}) == 4
+
+    assert client.get("/dev1/inference_results", params={"after": "bad"}).status_code == 400
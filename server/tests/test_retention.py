@@ -0,0 +1,30 @@
+import time
+from AITRIOSLocalDBHandler import AITRIOSLocalDBPool
+from AITRIOSRetention import InferenceRetentionJob
+
+
+def make_records(device_id, inference_epoch_ms, count):
+    return [{"device_id": device_id, "C": 0, "T": inference_epoch_ms, "P": 0.9, "X": 1, "Y": 2, "x": 3, "y": 4}
+            for _ in range(count)]
+
+
+def test_run_once_purges_old_frames_and_counts_them(tmp_path):
+    db_pool = AITRIOSLocalDBPool(str(tmp_path / "retention.db"), reader_count=1)
+    now_epoch_ms = int(time.time() * 1000)
+    with db_pool.writer() as table_handler:
+        table_handler.insert_many(make_records("device000", now_epoch_ms - 3 * 3600 * 1000, 5) +
+                                  make_records("device000", now_epoch_ms, 2))
+
+    retention_job = InferenceRetentionJob(db_pool, retention_hours=1, batch_size=2)
+    assert retention_job.get_stats()["total_rows_purged"] == 0
+    retention_job.run_once()
+    retention_job.run_once()
+
+    stats = retention_job.get_stats()
+    assert stats["runs"] == 2
+    assert stats["last_rows_purged"] == 0
+    assert stats["total_rows_purged"] == 5
+    assert stats["retention_hours"] == 1
+    with db_pool.reader() as table_handler:
+        assert len(table_handler.fetch_latestdate_by_device_id("device000")) == 2
+    db_pool.close()
@@ -0,0 +1,51 @@
+import pytest
+from hub_client import wait_for_ingest
+from payloads import make_meta
+
+
+def put_frames(client, AITRIOS_Hub, device_id, frames):
+    assert client.put("/meta/1.txt", json=make_meta(device_id, frames)).status_code == 200
+    wait_for_ingest(AITRIOS_Hub)
+
+
+def test_rollups_accumulate_across_batches_and_bucket_edges(hub):
+    client, AITRIOS_Hub = hub
+    put_frames(client, AITRIOS_Hub, "dev1", [("20250116120059500", [(0, 0.9, 1, 2, 3, 4), (1, 0.7, 1, 2, 3, 4)]),
+                                             ("20250116120100000", [(0, 0.6, 1, 2, 3, 4)])])
+    # 別のバッチで同じ時間単位に加算される
+    put_frames(client, AITRIOS_Hub, "dev1", [("20250116120130000", []),
+                                             ("20250116120145000", [(0, 0.8, 1, 2, 3, 4), (0, 0.5, 1, 2, 3, 4)])])
+
+    stats = client.get("/dev1/stats", params={"from": "2025-01-16T12:00:00", "to": "2025-01-16T12:02:00"}).json()
+    assert stats["count"] == 2
+    first, second = stats["buckets"]
+    assert first["T"] == "2025-01-16T12:00:00"
+    assert (first["frames"], first["detections"], first["max_per_frame"]) == (1, 2, 2)
+    assert first["mean_score"] == pytest.approx(0.8)
+    assert [(c["C"], c["frames"], c["detections"]) for c in first["classes"]] == [("0", 1, 1), ("1", 1, 1)]
+    assert second["T"] == "2025-01-16T12:01:00"
+    assert (second["frames"], second["detections"], second["max_per_frame"]) == (3, 3, 2)
+    assert second["mean_per_frame"] == pytest.approx(1.0)
+    assert second["mean_score"] == pytest.approx((0.6 + 0.8 + 0.5) / 3)
+    assert [(c["C"], c["frames"], c["detections"], c["max_per_frame"]) for c in second["classes"]] == [("0", 2, 3, 2)]
+
+    hour = client.get("/dev1/stats", params={"bucket": "hour", "from": "2025-01-16T12:00:00",
+                                             "to": "2025-01-16T13:00:00"}).json()["buckets"]
+    assert [(b["T"], b["frames"], b["detections"], b["max_per_frame"]) for b in hour] == [("2025-01-16T12:00:00", 4, 5, 2)]
+
+
+def test_stats_range_includes_the_bucket_containing_from_and_excludes_to(hub):
+    client, AITRIOS_Hub = hub
+    put_frames(client, AITRIOS_Hub, "dev1", [("20250116120059500", [(0, 0.9, 1, 2, 3, 4)]),
+                                             ("20250116120100000", [(0, 0.9, 1, 2, 3, 4)])])
+
+    # fromが時間単位の途中の場合はその時間単位から、toちょうどに始まる時間単位は含まない
+    buckets = client.get("/dev1/stats", params={"from": "2025-01-16T12:00:30", "to": "2025-01-16T12:01:00"}).json()["buckets"]
+    assert [b["T"] for b in buckets] == ["2025-01-16T12:00:00"]
+    buckets = client.get("/dev1/stats", params={"from": "2025-01-16T12:01:00", "to": "2025-01-16T12:01:00.001"}).json()["buckets"]
+    assert [b["T"] for b in buckets] == ["2025-01-16T12:01:00"]
+
+
+def test_stats_rejects_unknown_bucket(hub):
+    client, _ = hub
+    assert client.get("/dev1/stats", params={"bucket": "day"}).status_code == 400
@@ -0,0 +1,52 @@
+import os
+import cv2
+import numpy as np
+from hub_client import wait_for_thumbnails
+from payloads import make_jpeg
+
+
+def decode_size(content):
+    image = cv2.imdecode(np.frombuffer(content, dtype=np.uint8), cv2.IMREAD_COLOR)
+    height, width = image.shape[:2]
+    return width, height
+
+
+def test_thumbnails_are_generated_after_upload(hub):
+    client, AITRIOS_Hub = hub
+    assert client.put("/image/dev1/20250116123456000.jpg", content=make_jpeg(800, 600)).status_code == 200
+    stats = wait_for_thumbnails(AITRIOS_Hub)
+    assert stats["generated"] == 1
+
+    image_dir = os.path.join("image", "dev1", "20250116", "12")
+    assert sorted(os.listdir(image_dir)) == ["20250116123456000.jpg", "20250116123456000_160.jpg",
+                                             "20250116123456000_320.jpg", "20250116123456000_640.jpg"]
+    for size, expected in ((160, (160, 120)), (320, (320, 240)), (640, (640, 480))):
+        response = client.get("/image/dev1/latest", params={"size": size})
+        assert response.status_code == 200
+        assert decode_size(response.content) == expected
+        assert response.headers["x-image-datetime"] == "2025-01-16T12:34:56"
+    assert decode_size(client.get("/image/dev1/latest").content) == (800, 600)
+
+
+def test_missing_thumbnail_is_generated_on_request(hub):
+    client, AITRIOS_Hub = hub
+    assert client.put("/image/dev1/20250116123456000.jpg", content=make_jpeg(400, 300)).status_code == 200
+    wait_for_thumbnails(AITRIOS_Hub)
+    thumbnail_path = os.path.join("image", "dev1", "20250116", "12", "20250116123456000_160.jpg")
+    os.remove(thumbnail_path)
+
+    response = client.get("/image/dev1/latest", params={"size": 160})
+    assert response.status_code == 200
+    assert decode_size(response.content) == (160, 120)
+    assert os.path.exists(thumbnail_path)
+
+
+def test_unknown_size_and_undecodable_image(hub):
+    client, AITRIOS_Hub = hub
+    assert client.get("/image/dev1/latest", params={"size": 100}).status_code == 400
+    assert client.get("/image/dev1/latest", params={"size": 160}).status_code == 404
+
+    assert client.put("/image/dev1/20250116123456000.jpg", content=b"not a jpeg").status_code == 200
+    assert wait_for_thumbnails(AITRIOS_Hub)["failed"] == 1
+    assert client.get("/image/dev1/latest", params={"size": 160}).status_code == 404
+    assert client.get("/image/dev1/latest").content == b"not a jpeg"